@@ -1146,7 +1146,7 @@ export function ReportDetailsModal({ request, onClose, onDownloadFile }) {
                       <button
                         className="ml-2 px-2 py-1 bg-indigo-600 text-white rounded text-xs"
                         onClick={() =>
-                          onDownloadFile(file.base64 || file.data, file.filename)
+                          onDownloadFile(file.base64 || file.data, file.filename, file.id)
                         }
                         type="button"
                       >
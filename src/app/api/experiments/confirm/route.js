@@ -17,6 +17,10 @@ export async function POST(req) {
     );
     const py = spawn(PYTHON_CMD, [scriptPath, "--confirm"]);
 
+    // Decoded as a stream, so a UTF-8 character split across two chunks
+    // is put back together instead of becoming U+FFFD
+    py.stdout.setEncoding("utf8");
+    py.stderr.setEncoding("utf8");
     let stdout = "";
     let stderr = "";
     py.stdout.on("data", (data) => {
@@ -0,0 +1,103 @@
+import { NextResponse } from "next/server";
+import { spawn } from "child_process";
+import path from "path";
+import { Readable } from "stream";
+
+const PYTHON_CMD = process.env.PYTHON_CMD || "python3";
+
+const scriptPath = path.join(
+  process.cwd(),
+  "src",
+  "app",
+  "database",
+  "cli.py"
+);
+
+// Run cli.py with args and resolve with its parsed JSON output
+function runJson(args) {
+  return new Promise((resolve, reject) => {
+    const py = spawn(PYTHON_CMD, [scriptPath, ...args]);
+    // Decoded as a stream, so a UTF-8 character split across two chunks
+    // is put back together instead of becoming U+FFFD
+    py.stdout.setEncoding("utf8");
+    py.stderr.setEncoding("utf8");
+    let stdout = "";
+    let stderr = "";
+    py.stdout.on("data", (data) => {
+      stdout += data.toString();
+    });
+    py.stderr.on("data", (data) => {
+      stderr += data.toString();
+    });
+    py.on("close", (code) => {
+      if (code !== 0) {
+        reject(new Error(`python exited ${code}: ${stderr}`));
+        return;
+      }
+      try {
+        resolve(JSON.parse(stdout));
+      } catch (err) {
+        reject(new Error(`Invalid JSON from backend: ${stdout}`));
+      }
+    });
+    py.on("error", (err) => reject(err));
+  });
+}
+
+// GET /api/experiments/files?id=<file id>[&offset=N&length=N]
+// Streams a stored experiment file (or a byte range of it) without loading
+// it into memory. 404 if there is no such file.
+export async function GET(req) {
+  try {
+    const { searchParams } = new URL(req.url);
+    const id = searchParams.get("id");
+    if (!id || !/^\d+$/.test(id)) {
+      return NextResponse.json({ ok: false, error: "missing file id" }, { status: 400 });
+    }
+    // Look the file up first: once the body starts streaming the status
+    // can no longer change
+    const info = await runJson(["--file-info", id]);
+    if (!info) {
+      return NextResponse.json({ ok: false, error: "no such file" }, { status: 404 });
+    }
+    const args = [scriptPath, "--get-file", id];
+    for (const param of ["offset", "length"]) {
+      const value = searchParams.get(param);
+      if (value && /^\d+$/.test(value)) args.push(`--${param}`, value);
+    }
+    const py = spawn(PYTHON_CMD, args);
+    let stderr = "";
+    py.stderr.on("data", (data) => {
+      stderr += data.toString();
+      console.log("Received stderr:", data.toString());
+    });
+    // A reader that fails part way (file removed in between, unreadable
+    // blob) aborts the download instead of ending it as if complete.
+    // Reading pauses while the client is behind, so nothing piles up here.
+    const body = new Readable({
+      read() {
+        py.stdout.resume();
+      },
+    });
+    py.stdout.on("data", (chunk) => {
+      if (!body.push(chunk)) py.stdout.pause();
+    });
+    py.on("close", (code) => {
+      if (code === 0) body.push(null);
+      else body.destroy(new Error(`python exited ${code}: ${stderr}`));
+    });
+    py.on("error", (err) => body.destroy(err));
+    const filename = searchParams.get("filename") || info.filename || `file-${id}`;
+    return new Response(Readable.toWeb(body), {
+      headers: {
+        "Content-Type": "application/octet-stream",
+        "Content-Disposition": `attachment; filename="${filename.replace(/"/g, "")}"`,
+      },
+    });
+  } catch (err) {
+    return NextResponse.json(
+      { ok: false, error: String(err) },
+      { status: 500 }
+    );
+  }
+}
@@ -1,9 +1,25 @@
 import { NextResponse } from "next/server";
 import { spawn } from "child_process";
 import path from "path";
+import { Readable } from "stream";
 
 const PYTHON_CMD = process.env.PYTHON_CMD || "python3";
 
+// Base64 characters per chunk line; a multiple of 4 so every chunk decodes
+// on its own
+const BASE64_CHUNK = 256 * 1024;
+
+const LIST_FLAGS = {
+  cursor: "--cursor",
+  limit: "--limit",
+  status: "--status",
+  user_email: "--user-email",
+  experimentType: "--type",
+  since: "--since",
+  until: "--until",
+  fields: "--fields",
+};
+
 export async function POST(req) {
   try {
     const body = await req.json();
@@ -14,7 +30,11 @@ export async function POST(req) {
       "database",
       "cli.py"
     );
-    const py = spawn(PYTHON_CMD, [scriptPath]);
+    const py = spawn(PYTHON_CMD, [scriptPath, "--submit-stream"]);
+    // Decoded as a stream, so a UTF-8 character split across two chunks
+    // is put back together instead of becoming U+FFFD
+    py.stdout.setEncoding("utf8");
+    py.stderr.setEncoding("utf8");
     let stdout = "";
     let stderr = "";
     py.stdout.on("data", (data) => { stdout += data.toString(); });
@@ -26,8 +46,17 @@ export async function POST(req) {
       });
       py.on("error", (err) => reject(err));
     });
-    // Write JSON to stdin
-    py.stdin.write(JSON.stringify(body));
+    // Write the submission as NDJSON: the payload without file bodies, then
+    // each file's metadata line followed by its base64 data in chunks
+    const { files = [], ...submission } = body;
+    py.stdin.write(JSON.stringify(submission) + "\n");
+    for (const file of files) {
+      const { data = "", ...meta } = file;
+      py.stdin.write(JSON.stringify(meta) + "\n");
+      for (let i = 0; i < data.length; i += BASE64_CHUNK) {
+        py.stdin.write(JSON.stringify({ data: data.slice(i, i + BASE64_CHUNK) }) + "\n");
+      }
+    }
     py.stdin.end();
     try {
       await promise;
@@ -61,8 +90,30 @@ export async function GET(req) {
       "cli.py"
     );
     console.log("Using script path:", scriptPath);
-    const py = spawn(PYTHON_CMD, [scriptPath, "--list"]);
+    // Optional paging/filter query params map onto cli.py --list flags
+    const { searchParams } = new URL(req.url);
+    const args = [scriptPath, "--list"];
+    for (const [param, flag] of Object.entries(LIST_FLAGS)) {
+      const value = searchParams.get(param);
+      if (value) args.push(flag, value);
+    }
+    // ?stream=1 pipes NDJSON (one experiment per line) straight through
+    if (searchParams.get("stream")) {
+      args.push("--stream");
+      const py = spawn(PYTHON_CMD, args);
+      py.stderr.on("data", (data) => {
+        console.log("Received stderr:", data.toString());
+      });
+      return new Response(Readable.toWeb(py.stdout), {
+        headers: { "Content-Type": "application/x-ndjson" },
+      });
+    }
+    const py = spawn(PYTHON_CMD, args);
 
+    // Decoded as a stream, so a UTF-8 character split across two chunks
+    // is put back together instead of becoming U+FFFD
+    py.stdout.setEncoding("utf8");
+    py.stderr.setEncoding("utf8");
     let stdout = "";
     let stderr = "";
     py.stdout.on("data", (data) => {
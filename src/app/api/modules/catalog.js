@@ -0,0 +1,97 @@
+import { spawn } from "child_process";
+import path from "path";
+
+const PYTHON_CMD = process.env.PYTHON_CMD || "python3";
+
+// How long a loaded catalog is served before it is checked for a new
+// version (in the background; requests keep getting the current one)
+const CATALOG_TTL_MS = Number(process.env.MODULE_CATALOG_TTL_MS) || 5 * 60 * 1000;
+
+// The module catalog is owned by the Python side (database/catalog.py).
+// It is loaded once per server process with `cli.py --catalog` and indexed
+// here, so a request never touches the database or spawns Python.
+let current = null;
+let loadedAt = 0;
+let pending = null;
+
+function runCatalogCommand() {
+  const scriptPath = path.join(process.cwd(), "src", "app", "database", "cli.py");
+  return new Promise((resolve, reject) => {
+    const py = spawn(PYTHON_CMD, [scriptPath, "--catalog"]);
+    // Decoded as a stream, so a UTF-8 character split across two chunks
+    // is put back together instead of becoming U+FFFD
+    py.stdout.setEncoding("utf8");
+    py.stderr.setEncoding("utf8");
+    let stdout = "";
+    let stderr = "";
+    py.stdout.on("data", (data) => { stdout += data.toString(); });
+    py.stderr.on("data", (data) => { stderr += data.toString(); });
+    py.on("error", reject);
+    py.on("close", (code) => {
+      if (code !== 0) {
+        reject(new Error(`python exited ${code}: ${stderr}`));
+        return;
+      }
+      try {
+        resolve(JSON.parse(stdout));
+      } catch (err) {
+        reject(new Error(`invalid catalog output: ${err}`));
+      }
+    });
+  });
+}
+
+function buildIndex(raw) {
+  const byId = new Map(raw.modules.map((m) => [m.id, Object.freeze(m)]));
+  const byPlanOption = new Map(
+    Object.entries(raw.by_plan_option).map(([id, ids]) => [
+      Number(id),
+      Object.freeze(ids.map((moduleId) => byId.get(moduleId))),
+    ])
+  );
+  return Object.freeze({
+    version: raw.version,
+    modules: Object.freeze([...byId.values()]),
+    byId,
+    byPlanOption,
+    defaultPlanOptionId: raw.default_plan_option_id,
+  });
+}
+
+function refresh() {
+  // One load at a time; concurrent callers share it
+  if (!pending) {
+    pending = runCatalogCommand()
+      .then((raw) => {
+        if (!current || current.version !== raw.version) current = buildIndex(raw);
+        loadedAt = Date.now();
+        return current;
+      })
+      .finally(() => { pending = null; });
+  }
+  return pending;
+}
+
+export async function getCatalog() {
+  if (!current) return refresh();
+  if (Date.now() - loadedAt > CATALOG_TTL_MS) {
+    refresh().catch((err) => console.error("module catalog refresh failed:", err));
+  }
+  return current;
+}
+
+export function parsePlanOptionId(planOptionId) {
+  // Accepts string or int, extracts first integer if format is '1:1'
+  if (typeof planOptionId === "number") return planOptionId;
+  if (typeof planOptionId === "string") {
+    return parseInt(planOptionId.split(":")[0], 10) || 1;
+  }
+  return 1;
+}
+
+export async function getModulesForPlanOption(planOptionId) {
+  const catalog = await getCatalog();
+  const modules = catalog.byPlanOption.get(parsePlanOptionId(planOptionId));
+  // If no modules found for the plan option, return all modules as fallback
+  return { version: catalog.version, modules: modules && modules.length ? modules : catalog.modules };
+}
@@ -1,12 +1,18 @@
 import { NextResponse } from 'next/server';
-import { getModulesForPlanOption } from './sqlite';
+import { getModulesForPlanOption } from './catalog';
 
 export async function GET(req) {
   try {
     const { searchParams } = new URL(req.url);
     const planOptionId = searchParams.get('plan_option_id') || '1';
-    const modules = await getModulesForPlanOption(planOptionId);
-    return NextResponse.json({ modules });
+    const { version, modules } = await getModulesForPlanOption(planOptionId);
+    // The catalog version identifies the response, so clients can revalidate
+    // cheaply with If-None-Match
+    const etag = `"${version}-${planOptionId}"`;
+    if (req.headers.get('if-none-match') === etag) {
+      return new NextResponse(null, { status: 304, headers: { ETag: etag } });
+    }
+    return NextResponse.json({ modules, version }, { headers: { ETag: etag } });
   } catch (err) {
     console.error('API route error:', err);
     return NextResponse.json({ ok: false, error: String(err) }, { status: 500 });
@@ -0,0 +1,4 @@
+# Benchmarks for the database layer. Run from src/app/database, e.g.
+#   python3 -m benchmarks.cli_latency
+# benchmarks.suite times every public database.py function on synthetic
+# data from benchmarks.datagen and can compare against an earlier run.
@@ -0,0 +1,82 @@
+# Approval throughput for a batch of confirmations: one
+# update_experiment_confirmation call (one transaction) per experiment,
+# one cli.py --confirm process per experiment as the confirm API route does
+# it (timed on a sample and extrapolated), and the bulk API in-process and
+# through a single cli.py --confirm.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import database
+from benchmarks.common import CLI_PATH, emit, temp_database
+from data import STATUS_OPTIONS
+
+# Time the writes themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+
+def populate(count):
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'exp-{i}', 'approval benchmark', 'pending approval', '{}') for i in range(count)))
+
+
+def batch(count, rng):
+    statuses = [s.name for s in STATUS_OPTIONS]
+    return [(i, rng.choice(statuses), f'note {i}') for i in range(1, count + 1)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--cli-sample', type=int, default=20,
+                        help='single-item cli.py calls to time for the per-process estimate')
+    parser.add_argument('--seed', type=int, default=1)
+    opts = parser.parse_args()
+
+    rng = random.Random(opts.seed)
+    updates = batch(opts.items, rng)
+    results = {'items': opts.items}
+    with temp_database() as db_path:
+        populate(opts.items)
+
+        _, elapsed = timed(lambda: [database.update_experiment_confirmation(*u) for u in updates])
+        results['per_item_calls_s'] = round(elapsed, 3)
+
+        sample = updates[:opts.cli_sample]
+        _, elapsed = timed(lambda: [subprocess.run([sys.executable, CLI_PATH, '--confirm'], check=True,
+                                                   capture_output=True,
+                                                   input=json.dumps(dict(zip(('experiment_id', 'status', 'notes'), u))).encode())
+                                    for u in sample])
+        results['per_item_cli_estimated_s'] = round(elapsed / len(sample) * opts.items, 1)
+
+        out, elapsed = timed(database.bulk_update_experiment_confirmation, updates)
+        assert out['updated'] == opts.items, out['failed']
+        results['bulk_s'] = round(elapsed, 3)
+        results['bulk_items_per_s'] = round(opts.items / elapsed)
+
+        proc, elapsed = timed(lambda: subprocess.run([sys.executable, CLI_PATH, '--confirm'], check=True,
+                                                     capture_output=True, input=json.dumps(updates).encode()))
+        assert json.loads(proc.stdout)['updated'] == opts.items
+        results['bulk_cli_s'] = round(elapsed, 3)
+
+        out, elapsed = timed(database.confirm_matching_experiments, 'experiment queued', 'bulk',
+                             None, ['pending approval', 'failed'])
+        results['filter_confirm_s'] = round(elapsed, 3)
+        results['filter_confirm_updated'] = out['updated']
+    emit('bulk_confirm', results)
+
+
+if __name__ == '__main__':
+    main()
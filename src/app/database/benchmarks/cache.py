@@ -0,0 +1,101 @@
+# Read cache: latency of the cached lookups (cold vs warm) with each store,
+# and a check that writes are seen at once, in this process and, through the
+# shared SQLite store, in another one.
+import argparse
+import multiprocessing
+import os
+import time
+
+import database
+from benchmarks.common import emit, summarize, temp_database
+from data import ExperimentData, PlanOption, SubscriptionPlan, UserData, UserSubscription
+
+
+def seed(experiments, files):
+    blob = os.urandom(1024)
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'exp-{i}', 'cache benchmark', 'pending approval', '{}') for i in range(experiments)))
+        conn.executemany(
+            "INSERT INTO experiment_files (experiment_id, filename, file_data, file_size) VALUES (?, ?, ?, ?)",
+            ((exp_id, f'file-{n}.bin', blob, len(blob))
+             for exp_id in range(1, experiments + 1) for n in range(files)))
+    database.create_plan_option(PlanOption(id=None, name='basic', perks='none'))
+    database.create_subscription_plan(SubscriptionPlan(credits_to_buy=100, plan_option_id=1))
+    database.save_user_data(UserData(username='bench', pwd_hash='x', api_key_hash='y',
+                                     credits_available=10, subscriptionplan_id=1))
+    database.create_user_subscription(UserSubscription(user_id=1, plan_id=1, credits_available=10))
+
+
+LOOKUPS = (
+    ('list_experiments', lambda: database.list_experiments(limit=50)),
+    ('get_subscription_plan', lambda: database.get_subscription_plan(1)),
+    ('get_plan_option', lambda: database.get_plan_option(1)),
+    ('get_user_subscription', lambda: database.get_user_subscription(1)),
+)
+
+
+def time_lookups(repeat):
+    results = {}
+    for name, call in LOOKUPS:
+        cold, warm = [], []
+        for _ in range(repeat):
+            database.invalidate_cache('experiments', 'subscription_plans', 'user_subscriptions', 'plan_options')
+            start = time.perf_counter()
+            call()
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            call()
+            warm.append(time.perf_counter() - start)
+        results[name] = {'miss': summarize(cold), 'hit': summarize(warm)}
+    return results
+
+
+def confirm_in_child(db_path, experiment_id):
+    database.db_name = db_path
+    database.update_experiment_confirmation(experiment_id, 'experiment queued', 'from another process')
+
+
+def check_invalidation(db_path, shared):
+    # A write in this process, then (shared store only) one in another
+    # process, must both show up on the next cached read
+    def newest():
+        return database.list_experiments(limit=50)['experiments'][0]
+
+    newest()
+    new_id = database.save_experiment(ExperimentData(name='fresh', description='', status='pending approval'))
+    ok = newest()['id'] == new_id
+    if shared:
+        newest()
+        child = multiprocessing.get_context('spawn').Process(target=confirm_in_child, args=(db_path, new_id))
+        child.start()
+        child.join()
+        ok = ok and newest()['status'] == 'experiment queued'
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--experiments', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    opts = parser.parse_args()
+
+    results = {}
+    for backend in ('off', 'memory', 'sqlite'):
+        os.environ['CACHE_BACKEND'] = backend
+        os.environ['CACHE_TTL'] = '60'
+        with temp_database() as db_path:
+            os.environ['CACHE_DB'] = db_path + '-cache'
+            seed(opts.experiments, opts.files)
+            results[backend] = {
+                'lookups': time_lookups(opts.repeat),
+                'writes_visible': check_invalidation(db_path, backend == 'sqlite') if backend != 'off' else None,
+                'stats': database.cache_stats(),
+            }
+    emit('cache', results)
+
+
+if __name__ == '__main__':
+    main()
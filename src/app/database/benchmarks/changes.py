@@ -0,0 +1,74 @@
+# What a dashboard pays to notice a status change: re-reading the whole
+# listing against asking the change feed for what came after the last seq,
+# plus how long a long-polling reader takes to see a commit made by
+# another process.
+import argparse
+import multiprocessing
+import os
+import time
+
+import database
+from benchmarks.common import emit, summarize, temp_database
+
+# Time the queries themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+
+def populate(count):
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'exp-{i}', 'change feed benchmark', 'pending approval', '{}') for i in range(count)))
+
+
+def confirm_later(db_path, experiment_id, delay, stamps):
+    database.db_name = db_path
+    time.sleep(delay)
+    database.update_experiment_confirmation(experiment_id, 'experiment queued', '')
+    stamps.put(time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--experiments', type=int, default=10000)
+    parser.add_argument('--polls', type=int, default=10)
+    parser.add_argument('--notifications', type=int, default=10)
+    opts = parser.parse_args()
+
+    with temp_database() as db_path:
+        populate(opts.experiments)
+        full, delta = [], []
+        for i in range(opts.polls):
+            since = database.latest_change_seq()
+            database.update_experiment_confirmation(i + 1, 'experiment queued', 'poll')
+            start = time.perf_counter()
+            database.get_all_experiments()
+            full.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            changes = database.get_changes_since(since)['changes']
+            delta.append(time.perf_counter() - start)
+            assert [c['experiment_id'] for c in changes] == [i + 1, i + 1]
+
+        ctx = multiprocessing.get_context('spawn')
+        stamps = ctx.Queue()
+        latency = []
+        for i in range(opts.notifications):
+            since = database.latest_change_seq()
+            writer = ctx.Process(target=confirm_later, args=(db_path, opts.polls + i + 1, 0.2, stamps))
+            writer.start()
+            result = database.wait_for_changes(since, timeout=10)
+            seen = time.time()
+            writer.join()
+            assert result['changes']
+            latency.append(seen - stamps.get())
+
+        emit('changes', {
+            'experiments': opts.experiments,
+            'full_listing_poll': summarize(full),
+            'changes_since_poll': summarize(delta),
+            'long_poll_notify_latency': summarize(latency),
+        })
+
+
+if __name__ == '__main__':
+    main()
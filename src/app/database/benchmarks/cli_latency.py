@@ -0,0 +1,75 @@
+# Per-request latency of spawning cli.py for every call versus sending the
+# same requests to one long-running `cli.py --serve` worker.
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.common import CLI_PATH, emit, summarize, temp_database, timer
+
+
+def sample_submission(i):
+    return {
+        'experiment': {
+            'name': f'bench-{i}',
+            'description': 'cli latency benchmark',
+            'status': 'pending approval',
+            'experimentType': 'Benchmark',
+            'ModulesNeeded': 'Camera',
+            'user_email': 'bench@example.com',
+        },
+        'files': [],
+    }
+
+
+def spawn_per_call(requests):
+    samples = []
+    for command, payload in requests:
+        args = [sys.executable, CLI_PATH]
+        if command != 'submit':
+            args.append('--' + command)
+        with timer(samples):
+            subprocess.run(args, input=json.dumps(payload), capture_output=True,
+                           text=True, check=True)
+    return samples
+
+
+def worker(requests):
+    samples = []
+    proc = subprocess.Popen([sys.executable, CLI_PATH, '--serve'], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, text=True, bufsize=1)
+    try:
+        for i, (command, payload) in enumerate(requests):
+            with timer(samples):
+                proc.stdin.write(json.dumps({'id': i, 'command': command, 'payload': payload}) + '\n')
+                proc.stdin.flush()
+                response = json.loads(proc.stdout.readline())
+            if not response.get('ok'):
+                raise RuntimeError(response)
+    finally:
+        proc.stdin.close()
+        proc.wait()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50)
+    opts = parser.parse_args()
+
+    requests = []
+    for i in range(opts.requests):
+        requests.append(('submit', sample_submission(i)))
+        requests.append(('list', {}))
+
+    results = {}
+    with temp_database():
+        results['spawn_per_call'] = summarize(spawn_per_call(requests))
+    with temp_database():
+        results['serve'] = summarize(worker(requests))
+    results['speedup'] = round(results['spawn_per_call']['mean_ms'] / max(results['serve']['mean_ms'], 1e-9), 1)
+    emit('cli_latency', results)
+
+
+if __name__ == '__main__':
+    main()
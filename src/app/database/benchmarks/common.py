@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database
+
+DATABASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(DATABASE_DIR, 'cli.py')
+
+
+@contextmanager
+def temp_database():
+    # Point database.py (and any cli.py we spawn, via SITE_DB) at a scratch
+    # file so benchmarks never touch the real site.db
+    tmpdir = tempfile.mkdtemp(prefix='site-bench-')
+    db_path = os.path.join(tmpdir, 'site.db')
+    old_env = os.environ.get('SITE_DB')
+    old_name = database.db_name
+    os.environ['SITE_DB'] = db_path
+    database.db_name = db_path
+    try:
+        database.create_table()
+        yield db_path
+    finally:
+        database.db_name = old_name
+        if old_env is None:
+            os.environ.pop('SITE_DB', None)
+        else:
+            os.environ['SITE_DB'] = old_env
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def summarize(samples):
+    # Latency summary in milliseconds
+    return {
+        'n': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+    }
+
+
+@contextmanager
+def timer(samples):
+    start = time.perf_counter()
+    yield
+    samples.append(time.perf_counter() - start)
+
+
+def emit(name, results, stream=None):
+    stream = stream if stream is not None else sys.stdout
+    json.dump({'benchmark': name, 'python': sys.version.split()[0], 'results': results},
+              stream, indent=2)
+    stream.write('\n')
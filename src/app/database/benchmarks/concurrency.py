@@ -0,0 +1,100 @@
+# Multi-process load test: N processes submitting experiments (and confirming
+# and listing them) against one database at the same time, once per storage
+# configuration. Reports write throughput and the rate of "database is
+# locked" failures that reached the caller.
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+
+import database
+from benchmarks.common import emit, temp_database
+from data import ExperimentBundle, ExperimentData, ExperimentFileData
+from storage import is_busy_error
+
+# Time the queries themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+CONFIGS = {
+    # What the app ran with before: rollback journal, full sync, no retries
+    'rollback_journal': {'DB_JOURNAL_MODE': 'DELETE', 'DB_SYNCHRONOUS': 'FULL', 'DB_BUSY_RETRIES': '0'},
+    # storage.StorageConfig defaults
+    'wal_tuned': {},
+}
+
+
+def submitter(args):
+    worker, iterations, seed = args
+    rng = random.Random(seed)
+    ok = locked = other = 0
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        try:
+            saved = database.submit_experiment_bundle(ExperimentBundle(
+                experiment=ExperimentData(name=f'load-{worker}-{i}', description='load test',
+                                          status='pending approval', user_email=f'user{worker}@example.com'),
+                files=[ExperimentFileData(experiment_id=0, filename='config.json',
+                                          file_data=os.urandom(rng.randint(256, 4096)))],
+            ))
+            database.update_experiment_confirmation(saved['experiment_id'], 'experiment queued', 'auto')
+            database.list_experiments(limit=20, fields=['id', 'status', 'file_count'])
+            ok += 1
+        except sqlite3.OperationalError as exc:
+            if is_busy_error(exc):
+                locked += 1
+            else:
+                other += 1
+        latencies.append(time.perf_counter() - start)
+    return ok, locked, other, latencies, database.pool_stats()['busy_retries']
+
+
+def run(config_env, processes, iterations):
+    saved_env = {k: os.environ.get(k) for k in config_env}
+    os.environ.update(config_env)
+    try:
+        with temp_database():
+            start = time.perf_counter()
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.map(submitter, [(w, iterations, w) for w in range(processes)])
+            elapsed = time.perf_counter() - start
+    finally:
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+    ok = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    other = sum(r[2] for r in results)
+    latencies = sorted(l for r in results for l in r[3])
+    attempts = ok + locked + other
+    return {
+        'processes': processes,
+        'submissions_ok': ok,
+        'lock_errors': locked,
+        'other_errors': other,
+        'lock_error_rate': round(locked / attempts, 4) if attempts else 0.0,
+        'busy_retries': sum(r[4] for r in results),
+        'elapsed_s': round(elapsed, 3),
+        'submissions_per_s': round(ok / elapsed, 1),
+        'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', default='1,4,8,16')
+    parser.add_argument('--iterations', type=int, default=50)
+    opts = parser.parse_args()
+
+    results = {}
+    for name, env in CONFIGS.items():
+        results[name] = [run(env, int(n), opts.iterations) for n in opts.processes.split(',')]
+    emit('concurrency', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# Credit ledger stress test: many processes debiting a few shared accounts
+# as fast as they can, some requests retried with the same idempotency key.
+# Exits non-zero if a balance went negative, lost an update, or no longer
+# matches its ledger. The old read-modify-write path (get_user_subscription
+# then update_user_subscription) runs the same load for comparison. A
+# replay check also reuses a key across users and amounts.
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import database
+from benchmarks.common import emit, summarize, temp_database
+from data import SubscriptionPlan, UserData, UserSubscription
+from storage import is_busy_error
+
+# Every read has to see the database, not a cached balance
+os.environ['CACHE_BACKEND'] = 'off'
+
+
+def seed(accounts, balance):
+    plan_id = database.create_subscription_plan(SubscriptionPlan(credits_to_buy=balance, plan_option_id=1))
+    for n in range(1, accounts + 1):
+        database.save_user_data(UserData(username=f'stress{n}', pwd_hash=b'x', api_key_hash=b'y'))
+        database.create_user_subscription(UserSubscription(user_id=n, plan_id=plan_id, credits_available=balance))
+
+
+def ledger_worker(args):
+    worker, requests, accounts, retry_rate = args
+    rng = random.Random(worker)
+    charged = {}  # user_id -> credits actually taken by this worker
+    counts = {'ok': 0, 'insufficient': 0, 'replayed': 0, 'errors': 0}
+    latencies = []
+    for i in range(requests):
+        user_id, amount, key = rng.randint(1, accounts), rng.randint(1, 5), f'{worker}-{i}'
+        # A client that timed out sends the same request again
+        for _ in range(2 if rng.random() < retry_rate else 1):
+            start = time.perf_counter()
+            try:
+                out = database.debit_credits(user_id, amount, 'stress', idempotency_key=key)
+            except sqlite3.OperationalError as exc:
+                counts['errors'] += 1
+                if not is_busy_error(exc):
+                    raise
+                continue
+            latencies.append(time.perf_counter() - start)
+            if out.get('replayed'):
+                counts['replayed'] += 1
+            elif out['ok']:
+                counts['ok'] += 1
+                charged[user_id] = charged.get(user_id, 0) + amount
+            else:
+                counts['insufficient'] += 1
+    return charged, counts, latencies
+
+
+def read_modify_write_worker(args):
+    worker, requests, accounts, _ = args
+    rng = random.Random(worker)
+    charged = {}
+    counts = {'ok': 0, 'insufficient': 0, 'replayed': 0, 'errors': 0}
+    latencies = []
+    for _ in range(requests):
+        user_id, amount = rng.randint(1, accounts), rng.randint(1, 5)
+        start = time.perf_counter()
+        try:
+            sub = database.get_user_subscription(user_id)
+            if sub.credits_available < amount:
+                counts['insufficient'] += 1
+                continue
+            sub.credits_available -= amount
+            database.update_user_subscription(sub)
+        except sqlite3.OperationalError:
+            counts['errors'] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        counts['ok'] += 1
+        charged[user_id] = charged.get(user_id, 0) + amount
+    return charged, counts, latencies
+
+
+def check_replays(balance):
+    # Retrying a request replays it; the same key from another user, or for
+    # another amount, is refused and does not reveal the first balance
+    with temp_database():
+        seed(2, balance)
+        first = database.debit_credits(1, 3, 'replay', idempotency_key='replay-check')
+        again = database.debit_credits(1, 3, 'replay', idempotency_key='replay-check')
+        other_user = database.debit_credits(2, 3, 'replay', idempotency_key='replay-check')
+        other_amount = database.debit_credits(1, 4, 'replay', idempotency_key='replay-check')
+        untouched = database.credit_balance(2)['balance'] == balance
+    return {
+        'replayed': bool(again.get('replayed')) and again['balance'] == first['balance'],
+        'other_user_refused': not other_user['ok'] and 'balance' not in other_user and untouched,
+        'other_amount_refused': not other_amount['ok'],
+    }
+
+
+def run(worker, processes, requests, accounts, balance, retry_rate):
+    with temp_database():
+        seed(accounts, balance)
+        start = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(worker, [(w, requests, accounts, retry_rate) for w in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        counts = {k: sum(r[1][k] for r in results) for k in results[0][1]}
+        charged = {}
+        for r in results:
+            for user_id, amount in r[0].items():
+                charged[user_id] = charged.get(user_id, 0) + amount
+        balances = {n: database.credit_balance(n)['balance'] for n in range(1, accounts + 1)}
+        lost = sum(1 for n, b in balances.items() if b != balance - charged.get(n, 0))
+        reconcile = database.reconcile_credits()
+    return {
+        'processes': processes,
+        'requests': sum(counts.values()),
+        **counts,
+        'requests_per_s': round(sum(counts.values()) / elapsed, 1),
+        'latency': summarize([l for r in results for l in r[2]]),
+        'accounts_with_lost_updates': lost,
+        'negative_balances': sum(1 for b in balances.values() if b < 0),
+        'ledger_mismatches': len(reconcile['mismatched']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=300, help='debits per process')
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--balance', type=int, default=1000)
+    parser.add_argument('--retry-rate', type=float, default=0.2)
+    opts = parser.parse_args()
+
+    ledger = run(ledger_worker, opts.processes, opts.requests, opts.accounts, opts.balance, opts.retry_rate)
+    legacy = run(read_modify_write_worker, opts.processes, opts.requests, opts.accounts, opts.balance, 0)
+    replays = check_replays(opts.balance)
+    emit('credits', {'ledger': ledger, 'read_modify_write': legacy, 'replays': replays})
+    if ledger['accounts_with_lost_updates'] or ledger['negative_balances'] or ledger['ledger_mismatches'] \
+            or not all(replays.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# Synthetic site data at a chosen scale: plan options, subscription plans,
+# users with subscriptions and credits, payload builders, and experiments
+# with files. Everything goes in through database.py, so triggers, the
+# ledger and the blob store see the same writes the site makes. The output
+# depends only on the scale and the seed, so two commits can be compared
+# on identical data.
+#
+#   python3 -m benchmarks.datagen --scale medium --out /tmp/site.db
+import argparse
+import base64
+import math
+import os
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import database
+from benchmarks.common import emit
+from catalog import get_catalog
+from data import ExperimentData, ExperimentFileData, PlanOption, SubscriptionPlan, UserData, UserSubscription
+from placement import auto_pack
+from serializer import dumps
+
+# users, experiments, payload builders and at most this many files per
+# experiment. File sizes are log-normal around file_median bytes (sigma
+# file_sigma), capped at file_max.
+SCALES = {
+    'tiny': dict(users=10, experiments=100, builders=5, max_files=2,
+                 file_median=4096, file_sigma=1.0, file_max=256 * 1024),
+    'small': dict(users=50, experiments=1000, builders=20, max_files=3,
+                  file_median=8192, file_sigma=1.5, file_max=1024 * 1024),
+    'medium': dict(users=500, experiments=20000, builders=200, max_files=3,
+                   file_median=2048, file_sigma=1.5, file_max=4 * 1024 * 1024),
+    'large': dict(users=5000, experiments=200000, builders=2000, max_files=3,
+                  file_median=512, file_sigma=1.5, file_max=4 * 1024 * 1024),
+}
+
+PLAN_OPTIONS = (('Basic', 'Standard modules'), ('Pro', 'Sports modules'), ('Enterprise', 'Every module'))
+EXPERIMENT_TYPES = ('Thermal', 'Vacuum', 'Radiation', 'Imaging', 'Biology', 'Materials')
+# Share of experiments in each status, roughly what the approvals page sees
+STATUS_WEIGHTS = (('pending approval', 40), ('experiment queued', 20),
+                  ('experiment completed', 35), ('failed', 5))
+FILE_TYPES = ('csv', 'json', 'png', 'bin', 'txt')
+# Share of uploads that repeat a file already uploaded (the blob store
+# stores those once)
+DUPLICATE_RATE = 0.2
+# Days of history the experiments' created_at is spread over
+HISTORY_DAYS = 365
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+BATCH = 500
+
+
+@dataclass(slots=True)
+class Dataset:
+    scale: str
+    seed: int
+    plan_option_ids: List[int] = field(default_factory=list)
+    plan_ids: List[int] = field(default_factory=list)
+    user_ids: List[int] = field(default_factory=list)
+    user_emails: List[str] = field(default_factory=list)
+    builder_ids: List[int] = field(default_factory=list)
+    experiment_ids: List[int] = field(default_factory=list)
+    file_ids: List[int] = field(default_factory=list)
+    file_bytes: int = 0
+
+    def counts(self):
+        return {'plan_options': len(self.plan_option_ids), 'plans': len(self.plan_ids),
+                'users': len(self.user_ids), 'builders': len(self.builder_ids),
+                'experiments': len(self.experiment_ids), 'files': len(self.file_ids),
+                'file_bytes': self.file_bytes}
+
+
+class Generator:
+    # Draws the individual records; generate() below writes a whole dataset
+    def __init__(self, scale='small', seed=1):
+        if scale not in SCALES:
+            raise ValueError(f"scale must be one of {', '.join(SCALES)}")
+        self.scale = scale
+        self.params = SCALES[scale]
+        self.rng = random.Random(seed)
+        self._bodies = []
+        self._statuses = [s for s, _ in STATUS_WEIGHTS]
+        self._status_weights = [w for _, w in STATUS_WEIGHTS]
+
+    def file_size(self):
+        p = self.params
+        return max(1, min(p['file_max'], int(self.rng.lognormvariate(math.log(p['file_median']), p['file_sigma']))))
+
+    def file_body(self):
+        if self._bodies and self.rng.random() < DUPLICATE_RATE:
+            return self.rng.choice(self._bodies)
+        body = self.rng.randbytes(self.file_size())
+        if len(self._bodies) < 100:
+            self._bodies.append(body)
+        return body
+
+    def files(self, experiment_index):
+        return [(f'exp{experiment_index}-{n}.{self.rng.choice(FILE_TYPES)}', self.file_body())
+                for n in range(self.rng.randint(0, self.params['max_files']))]
+
+    def created_at(self):
+        moment = START + timedelta(seconds=self.rng.randrange(HISTORY_DAYS * 86400))
+        return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+    def modules(self, plan_option_id):
+        names = sorted({m.name for m in get_catalog().by_plan_option.get(plan_option_id, ())})
+        return self.rng.sample(names, self.rng.randint(1, min(4, len(names)))) if names else []
+
+    def user_email(self, emails):
+        # A few users submit most of the experiments
+        return emails[(int(self.rng.paretovariate(0.2)) - 1) % len(emails)]
+
+    def experiment(self, index, user_email, plan_option_id, files=()):
+        modules = self.modules(plan_option_id)
+        fields = {
+            'name': f'Experiment {index}',
+            'description': f'Synthetic experiment {index} ' + 'x' * self.rng.randrange(200),
+            'status': self.rng.choices(self._statuses, self._status_weights)[0],
+            'user_email': user_email,
+            'created_at': self.created_at(),
+            'experimentType': self.rng.choice(EXPERIMENT_TYPES),
+            'ModulesNeeded': ', '.join(modules),
+        }
+        # What the form stores: the submission, files by reference
+        payload = {'experiment': fields, 'plan_option_id': plan_option_id,
+                   'files': [{'filename': name, 'size': len(body)} for name, body in files]}
+        return fields, payload
+
+    def builder(self, index, plan_id, plan_option_id):
+        width, height = self.rng.randint(4, 12), self.rng.randint(4, 12)
+        modules = [{'module_id': m.id, 'label': m.name}
+                   for m in self.rng.choices(get_catalog().by_plan_option[plan_option_id], k=self.rng.randint(1, 8))]
+        packed = auto_pack(width, height, modules, time_budget=0.01)
+        return {'name': f'Bay {index}', 'bay_width': width, 'bay_height': height,
+                'created_at': self.created_at(), 'subscription_plan_id': plan_id,
+                'items': [item for i, item in enumerate(packed['items']) if i not in packed['unplaced']]}
+
+    def submission(self, index, user_email='bench@example.com', plan_option_id=1):
+        # A cli.py submission as the experiments form sends it, file bodies
+        # base64 encoded
+        files = self.files(index)
+        fields, _ = self.experiment(index, user_email, plan_option_id, files)
+        fields['status'] = 'pending approval'
+        return {
+            'experiment': fields,
+            'files': [{'filename': name, 'data': base64.b64encode(body).decode('ascii')} for name, body in files],
+            'plan_option_id': plan_option_id,
+        }
+
+
+def generate(scale='small', seed=1, experiments=None):
+    # Fill the current database (database.db_name) and return what was
+    # written. experiments overrides the scale's experiment count.
+    gen = Generator(scale, seed)
+    p = gen.params
+    ds = Dataset(scale, seed)
+    rng = gen.rng
+
+    for name, perks in PLAN_OPTIONS:
+        ds.plan_option_ids.append(database.create_plan_option(PlanOption(id=None, name=name, perks=perks)))
+    plan_options = {}
+    for option_id in ds.plan_option_ids:
+        for credits in (100, 500, 2000):
+            plan_id = database.create_subscription_plan(SubscriptionPlan(credits_to_buy=credits,
+                                                                         plan_option_id=option_id))
+            ds.plan_ids.append(plan_id)
+            plan_options[plan_id] = option_id
+
+    user_plan = {}
+    with database.db_session() as conn:
+        for n in range(p['users']):
+            plan_id = rng.choice(ds.plan_ids)
+            credits = rng.randrange(0, 2000)
+            database.save_user_data(UserData(username=f'user{n}', pwd_hash=rng.randbytes(32),
+                                             api_key_hash=rng.randbytes(32), credits_available=credits,
+                                             subscriptionplan_id=plan_id))
+            user_id = conn.execute("SELECT id FROM users WHERE username = ?", (f'user{n}',)).fetchone()[0]
+            database.create_user_subscription(UserSubscription(user_id=user_id, plan_id=plan_id,
+                                                               credits_available=credits))
+            ds.user_ids.append(user_id)
+            ds.user_emails.append(f'user{n}@example.com')
+            user_plan[ds.user_emails[-1]] = plan_id
+
+    with database.db_session():
+        for n in range(p['builders']):
+            plan_id = rng.choice(ds.plan_ids)
+            ds.builder_ids.append(database.save_payload_builder(gen.builder(n, plan_id, plan_options[plan_id])))
+
+    count = p['experiments'] if experiments is None else experiments
+    for start in range(0, count, BATCH):
+        with database.db_session():
+            for index in range(start, min(count, start + BATCH)):
+                email = gen.user_email(ds.user_emails)
+                files = gen.files(index)
+                fields, payload = gen.experiment(index, email, plan_options[user_plan[email]], files)
+                exp_id = database.save_experiment(ExperimentData(payload=dumps(payload),
+                                                                 **fields))
+                ds.experiment_ids.append(exp_id)
+                if files:
+                    database.save_experiment_files([ExperimentFileData(experiment_id=exp_id, filename=name,
+                                                                       file_data=body)
+                                                    for name, body in files])
+                    ds.file_bytes += sum(len(body) for _, body in files)
+    with database.db_session() as conn:
+        ds.file_ids = [row[0] for row in conn.execute("SELECT id FROM experiment_files ORDER BY id")]
+    return ds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='small', choices=sorted(SCALES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--experiments', type=int, help='override the scale\'s experiment count')
+    parser.add_argument('--out', required=True, help='database file to create (must not exist)')
+    opts = parser.parse_args()
+
+    if os.path.exists(opts.out):
+        parser.error(f'{opts.out} already exists')
+    os.makedirs(os.path.dirname(os.path.abspath(opts.out)), exist_ok=True)
+    os.environ['SITE_DB'] = database.db_name = os.path.abspath(opts.out)
+    database.create_table()
+    ds = generate(opts.scale, opts.seed, opts.experiments)
+    emit('datagen', {'scale': opts.scale, 'seed': opts.seed, 'database': database.db_name, **ds.counts()})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Throughput and peak memory of checksumming / exporting one large stored
+# file: the old `SELECT file_data` fetch of an inline BLOB against the
+# memory-mapped blob-store view. Each variant runs in its own process so its
+# peak RSS can be read on its own.
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import database
+from benchmarks.common import DATABASE_DIR, emit, temp_database
+from data import ExperimentFileData
+
+VARIANTS = ('fetch_checksum', 'mmap_checksum', 'fetch_export', 'mmap_export')
+
+
+def peak_rss_kb():
+    # High-water mark of this process's RSS; unlike ru_maxrss it starts over
+    # at exec, so the parent's memory does not leak into the measurement
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def run_variant(variant, file_id, inline_id, dest):
+    # Returns (seconds, peak Python heap bytes, peak RSS kB). Mapped pages
+    # show up in RSS but are shared page cache, not a copy on the heap.
+    tracemalloc.start()
+    start = time.perf_counter()
+    if variant == 'fetch_checksum':
+        with database.db_session() as conn:
+            data = conn.execute("SELECT file_data FROM experiment_files WHERE id = ?", (inline_id,)).fetchone()[0]
+        hashlib.sha256(data).hexdigest()
+    elif variant == 'mmap_checksum':
+        database.experiment_file_checksum(file_id)
+    elif variant == 'fetch_export':
+        with database.db_session() as conn:
+            data = conn.execute("SELECT file_data FROM experiment_files WHERE id = ?", (inline_id,)).fetchone()[0]
+        with open(dest, 'wb') as out:
+            out.write(data)
+    elif variant == 'mmap_export':
+        database.export_experiment_file(file_id, dest)
+    elapsed = time.perf_counter() - start
+    heap_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, heap_peak, peak_rss_kb()
+
+
+def measure(variant, file_id, inline_id, size, dest):
+    code = ("import sys; from benchmarks.file_reads import run_variant; "
+            f"print(*run_variant({variant!r}, {file_id}, {inline_id}, {dest!r}))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=DATABASE_DIR, capture_output=True,
+                         text=True, check=True).stdout
+    seconds, heap_peak, rss_kb = out.split()
+    seconds = float(seconds)
+    return {
+        'seconds': round(seconds, 4),
+        'throughput_mb_s': round(size / (1024 * 1024) / seconds, 1),
+        'peak_heap_mb': round(int(heap_peak) / (1024 * 1024), 1),
+        'peak_rss_mb': round(int(rss_kb) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=128)
+    opts = parser.parse_args()
+    size = opts.size_mb * 1024 * 1024
+
+    with temp_database() as db_path:
+        body = os.urandom(size)
+        exp_id = database.save_experiment(database.ExperimentData(name='big', description='', status='pending approval'))
+        file_id = database.save_experiment_file(ExperimentFileData(experiment_id=exp_id, filename='big.bin', file_data=body))
+        with database.db_session() as conn:
+            inline_id = conn.execute(
+                "INSERT INTO experiment_files (experiment_id, filename, file_data, file_size) VALUES (?, ?, ?, ?)",
+                (exp_id, 'big-inline.bin', body, size)).lastrowid
+        del body
+        dest = os.path.join(os.path.dirname(db_path), 'export.bin')
+        results = {'size_mb': opts.size_mb}
+        for variant in VARIANTS:
+            results[variant] = measure(variant, file_id, inline_id, size, dest)
+    emit('file_reads', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Time get_all_experiments at increasing table sizes, against the old
+# one-query-per-experiment listing on an unindexed experiment_files table.
+import argparse
+import os
+import time
+
+import database
+from benchmarks.common import emit, temp_database
+
+# Time the queries themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+
+def populate(count, files_per_experiment, file_bytes):
+    blob = os.urandom(file_bytes)
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'exp-{i}', 'listing benchmark', 'pending approval', '{}') for i in range(count)))
+        conn.executemany(
+            "INSERT INTO experiment_files (experiment_id, filename, file_data, file_size) VALUES (?, ?, ?, ?)",
+            ((exp_id, f'file-{n}.bin', blob, file_bytes)
+             for exp_id in range(1, count + 1) for n in range(files_per_experiment)))
+
+
+def legacy_listing():
+    # The listing as it was: N+1 queries, length() over the BLOB, no index
+    with database.db_session() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM experiments ORDER BY id DESC")
+        for ex in cur.fetchall():
+            cur.execute("SELECT id, filename, length(file_data) as size FROM experiment_files NOT INDEXED WHERE experiment_id = ?", (ex['id'],))
+            cur.fetchall()
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--files', type=int, default=2)
+    parser.add_argument('--file-bytes', type=int, default=2048)
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help='skip the quadratic legacy listing above this many experiments')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in opts.sizes.split(',')):
+        with temp_database():
+            populate(size, opts.files, opts.file_bytes)
+            row = {'experiments': size, 'files': size * opts.files,
+                   'listing_ms': best_of(database.get_all_experiments, opts.repeat)}
+            if size <= opts.legacy_max:
+                row['legacy_listing_ms'] = best_of(legacy_listing, 1)
+            results.append(row)
+    emit('listing', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Per-row cost of the data.py models: time and memory to load 100k rows into
+# objects and to serialize them back for an INSERT, slotted models with row
+# adapters against plain dataclasses built with cls(**dict(row)) and asdict.
+import argparse
+import sqlite3
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from benchmarks.common import emit
+from data import ExperimentData, cursor_columns, row_adapter, values_getter
+
+
+@dataclass
+class PlainExperimentData:
+    # ExperimentData as it was: no slots
+    name: str
+    description: str
+    status: str
+    payload: str = ''
+    notes: Optional[str] = None
+    user_email: Optional[str] = None
+    created_at: Optional[str] = None
+    experimentType: Optional[str] = None
+    ModulesNeeded: Optional[str] = None
+
+
+COLUMNS = ('name', 'description', 'status', 'payload', 'notes', 'user_email',
+           'created_at', 'experimentType', 'ModulesNeeded')
+
+
+def make_db(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE experiments ({', '.join(COLUMNS)})")
+    conn.executemany(f"INSERT INTO experiments VALUES ({', '.join('?' * len(COLUMNS))})",
+                     ((f'exp-{i}', 'model benchmark', 'pending approval', '{}', None,
+                       f'user{i % 50}@example.com', '2024-01-01T00:00:00', 'Thermal', 'Camera')
+                      for i in range(rows)))
+    return conn
+
+
+def load_plain(conn):
+    cur = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM experiments")
+    return [PlainExperimentData(**dict(row)) for row in cur]
+
+
+def load_slotted(conn):
+    cur = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM experiments")
+    adapt = row_adapter(ExperimentData, cursor_columns(cur))
+    return [adapt(row) for row in cur]
+
+
+def dump_plain(objs):
+    return [asdict(o) for o in objs]
+
+
+def dump_slotted(objs):
+    values = values_getter(ExperimentData, COLUMNS)
+    return [values(o) for o in objs]
+
+
+def measure(fn, *args):
+    # Wall time of one call, then the memory its result holds, from a
+    # second, traced call
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = fn(*args)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, retained, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    opts = parser.parse_args()
+
+    conn = make_db(opts.rows)
+    results = {}
+    for name, load, dump in (('plain_dataclass', load_plain, dump_plain),
+                             ('slotted_adapter', load_slotted, dump_slotted)):
+        load_s, load_bytes, load_peak, objs = measure(load, conn)
+        dump_s, dump_bytes, _, _ = measure(dump, objs)
+        results[name] = {
+            'rows': opts.rows,
+            'load_ms': round(load_s * 1000, 1),
+            'load_us_per_row': round(load_s / opts.rows * 1e6, 3),
+            'bytes_per_object': round(load_bytes / opts.rows, 1),
+            'load_peak_mb': round(load_peak / 1e6, 1),
+            'serialize_ms': round(dump_s * 1000, 1),
+            'serialize_bytes_per_row': round(dump_bytes / opts.rows, 1),
+        }
+    emit('models', results)
+
+
+if __name__ == '__main__':
+    main()
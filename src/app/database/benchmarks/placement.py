@@ -0,0 +1,97 @@
+# Time placement validation and auto-packing on large bays. Validation is
+# compared with a pairwise overlap check, packing with a cell-by-cell
+# first-fit search like the one the payload builder page runs in the browser.
+import argparse
+import random
+import time
+
+from benchmarks.common import emit
+from catalog import get_catalog
+from placement import auto_pack, validate_layout
+
+
+def tiled_layout(bay, count, rng):
+    # count items laid out left to right, row by row, without overlaps
+    modules = get_catalog().modules
+    items, x, y, row_h = [], 0, 0, 0
+    while len(items) < count:
+        m = rng.choice(modules)
+        if x + m.w > bay:
+            x, y, row_h = 0, y + row_h, 0
+        if y + m.h > bay:
+            break
+        items.append({'module_id': m.id, 'x': x, 'y': y})
+        x += m.w
+        row_h = max(row_h, m.h)
+    return items
+
+
+def pairwise_validate(items):
+    catalog = get_catalog()
+    rects = [(i['x'], i['y'], catalog.get(i['module_id']).w, catalog.get(i['module_id']).h) for i in items]
+    overlaps = 0
+    for a in range(len(rects)):
+        x1, y1, w1, h1 = rects[a]
+        for b in range(a):
+            x2, y2, w2, h2 = rects[b]
+            if x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1:
+                overlaps += 1
+    return overlaps
+
+
+def cell_first_fit(bay, requested):
+    catalog = get_catalog()
+    placed = []
+    for r in requested:
+        m = catalog.get(r['module_id'])
+        spot = None
+        for y in range(bay - m.h + 1):
+            for x in range(bay - m.w + 1):
+                if not any(x < px + pw and px < x + m.w and y < py + ph and py < y + m.h
+                           for px, py, pw, ph in placed):
+                    spot = (x, y)
+                    break
+            if spot:
+                break
+        if spot:
+            placed.append((spot[0], spot[1], m.w, m.h))
+    return len(placed)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - start) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bays', default='64,256,1024')
+    parser.add_argument('--items', default='100,500,2000')
+    parser.add_argument('--baseline-max', type=int, default=500,
+                        help='skip the quadratic baselines above this many items')
+    parser.add_argument('--time-budget', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=1)
+    opts = parser.parse_args()
+
+    rng = random.Random(opts.seed)
+    results = []
+    for bay in (int(b) for b in opts.bays.split(',')):
+        for count in (int(n) for n in opts.items.split(',')):
+            items = tiled_layout(bay, count, rng)
+            report, validate_ms = timed(validate_layout, bay, bay, items)
+            requested = [{'module_id': i['module_id']} for i in items]
+            rng.shuffle(requested)
+            packed, pack_ms = timed(auto_pack, bay, bay, requested, None, opts.time_budget)
+            row = {'bay': f'{bay}x{bay}', 'items': len(items), 'valid': report['ok'],
+                   'validate_ms': validate_ms, 'pack_ms': pack_ms, 'packed': len(packed['items']),
+                   'pack_strategy': packed['strategy'], 'utilization': report['utilization']}
+            if len(items) <= opts.baseline_max:
+                row['pairwise_validate_ms'] = timed(pairwise_validate, items)[1]
+                row['cell_first_fit_ms'] = timed(cell_first_fit, bay, requested)[1]
+            results.append(row)
+    emit('placement', results)
+
+
+if __name__ == '__main__':
+    main()
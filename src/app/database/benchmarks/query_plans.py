@@ -0,0 +1,213 @@
+# Query-plan regression check. Exercises every query database.py issues
+# against a scratch database, captures the SQL as it is sent to SQLite, runs
+# EXPLAIN QUERY PLAN on each statement and exits non-zero if a lookup has
+# fallen back to a full table SCAN.
+#
+# A SCAN is accepted when
+# - the scenario reads a whole table on purpose (full listings, stats,
+#   cleanup), or
+# - it walks a partial index, which only holds the rows being looked for, or
+# - it walks the table in id order under a LIMIT with no sort step, so it
+#   stops after one page (list_experiments' first page), or
+# - it is json_each going through a list of ids passed as a parameter.
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+import database
+from benchmarks.common import emit, temp_database
+from data import (ExperimentBundle, ExperimentData, ExperimentFileData, PlanOption,
+                  SubscriptionPlan, UserData, UserSubscription)
+
+# Every scenario has to reach SQLite, so the read cache is off
+os.environ['CACHE_BACKEND'] = 'off'
+
+CHECKED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def populate():
+    database.create_plan_option(PlanOption(id=None, name='basic', perks='none'))
+    plan_id = database.create_subscription_plan(SubscriptionPlan(credits_to_buy=100, plan_option_id=1))
+    for i in range(20):
+        database.submit_experiment_bundle(ExperimentBundle(
+            experiment=ExperimentData(name=f'exp-{i}', description='plan check',
+                                      status='pending approval', payload='{}',
+                                      user_email=f'user{i % 3}@example.com',
+                                      created_at=f'2024-01-{i + 1:02d}T00:00:00',
+                                      experimentType='Thermal'),
+            files=[ExperimentFileData(experiment_id=0, filename=f'f{i}.bin', file_data=os.urandom(64))],
+            user=UserData(username=f'user{i}', pwd_hash=b'x', api_key_hash=b'y'),
+            user_subscription=UserSubscription(user_id=i + 1, plan_id=plan_id, credits_available=10),
+        ))
+    # One file from before the blob store, body inline in experiment_files
+    with database.db_session() as conn:
+        conn.execute("INSERT INTO experiment_files (experiment_id, filename, file_data, file_size) "
+                     "VALUES (1, 'inline.bin', x'00112233', 4)")
+    builder_id = database.save_payload_builder({
+        'name': 'bay', 'bay_width': 4, 'bay_height': 4, 'created_at': '2024-01-01',
+        'subscription_plan_id': plan_id,
+        'items': [{'module_id': 1, 'x': 0, 'y': 0}, {'module_id': 3, 'x': 2, 'y': 0}]})
+    return plan_id, builder_id
+
+
+def scenarios(plan_id, builder_id):
+    # (label, call, whole-table scans allowed)
+    return [
+        ('get_subscription_plan', lambda: database.get_subscription_plan(plan_id), False),
+        ('update_subscription_plan', lambda: database.update_subscription_plan(
+            SubscriptionPlan(id=plan_id, credits_to_buy=50, plan_option_id=1)), False),
+        ('get_user_subscription', lambda: database.get_user_subscription(3), False),
+        ('update_user_subscription', lambda: database.update_user_subscription(
+            UserSubscription(user_id=3, plan_id=plan_id, credits_available=5)), False),
+        ('delete_user_subscription', lambda: database.delete_user_subscription(4), False),
+        ('get_plan_option', lambda: database.get_plan_option(1), False),
+        ('update_plan_option', lambda: database.update_plan_option(
+            PlanOption(id=1, name='basic', perks='more')), False),
+        ('update_experiment_confirmation', lambda: database.update_experiment_confirmation(
+            2, 'experiment queued', 'ok'), False),
+        ('get_experiment_file', lambda: database.get_experiment_file(1), False),
+        ('get_experiment_file_info', lambda: database.get_experiment_file_info(1), False),
+        ('read_experiment_file', lambda: database.read_experiment_file(1, 8, 16), False),
+        ('experiment_file_checksum', lambda: database.experiment_file_checksum(1), False),
+        ('get_payload_builder', lambda: database.get_payload_builder(builder_id), False),
+        ('get_payload_builders', lambda: database.get_payload_builders(plan_id), False),
+        ('payload_builder_totals', lambda: database.payload_builder_totals(builder_id), False),
+        ('builders_using_module', lambda: database.builders_using_module(3), False),
+        ('list_experiments', lambda: database.list_experiments(limit=5), False),
+        ('list_experiments cursor', lambda: database.list_experiments(cursor=10, limit=5), False),
+        ('list_experiments status', lambda: database.list_experiments(
+            status=['pending approval', 'experiment queued'], limit=5), False),
+        ('list_experiments user_email', lambda: database.list_experiments(
+            user_email='user1@example.com', cursor=15, limit=5), False),
+        ('list_experiments experimentType', lambda: database.list_experiments(
+            experimentType='Thermal', limit=5), False),
+        ('list_experiments created range', lambda: database.list_experiments(
+            created_after='2024-01-05', created_before='2024-01-10', limit=5), False),
+        ('debit_credits', lambda: database.debit_credits(3, 1, idempotency_key='plan-check'), False),
+        ('debit_credits replay', lambda: database.debit_credits(3, 1, idempotency_key='plan-check'), False),
+        ('debit_credits insufficient', lambda: database.debit_credits(3, 10 ** 6), False),
+        ('grant_credits user', lambda: database.grant_credits(2, 5, account='user'), False),
+        ('credit_balance', lambda: database.credit_balance(3, history=5), False),
+        ('reconcile_credits', lambda: database.reconcile_credits(batch_size=10), False),
+        ('bulk_update_experiment_confirmation', lambda: database.bulk_update_experiment_confirmation(
+            [(3, 'experiment queued', 'bulk'), (4, 'failed', None), (999, 'failed', None)]), False),
+        ('confirm_matching_experiments ids', lambda: database.confirm_matching_experiments(
+            'experiment completed', ids=[6, 7]), False),
+        ('confirm_matching_experiments status', lambda: database.confirm_matching_experiments(
+            'experiment queued', from_status='pending approval', user_email='user2@example.com'), False),
+        ('claim_experiments', lambda: database.claim_experiments('plan-check', 2), False),
+        ('heartbeat_experiment', lambda: database.heartbeat_experiment(3, 'token'), False),
+        ('complete_experiment', lambda: database.complete_experiment(3, 'token'), False),
+        ('fail_experiment retry', lambda: database.fail_experiment(3, 'token', 'error', retry=True), False),
+        ('requeue_expired_leases', database.requeue_expired_leases, False),
+        ('queue_stats', database.queue_stats, False),
+        ('get_changes_since', lambda: database.get_changes_since(5, limit=10), False),
+        ('get_changes_since experiment', lambda: database.get_changes_since(0, experiment_id=3), False),
+        ('latest_change_seq', database.latest_change_seq, False),
+        ('prune_changes', lambda: database.prune_changes(2), False),
+        ('report_aggregates', lambda: database.report_aggregates('status', 'week'), False),
+        ('report_aggregates range', lambda: database.report_aggregates(
+            'total', 'month', since='2024-01-05', until='2024-01-10'), False),
+        ('report_aggregates key', lambda: database.report_aggregates(
+            'user_email', 'day', key='user1@example.com'), False),
+        ('move_inline_files_to_blobs', database.move_inline_files_to_blobs, False),
+        ('delete_experiment', lambda: database.delete_experiment(5), False),
+        ('delete_payload_builder', lambda: database.delete_payload_builder(builder_id), False),
+        ('delete_plan_option', lambda: database.delete_plan_option(99), False),
+        ('delete_subscription_plan', lambda: database.delete_subscription_plan(99), False),
+        ('normalize_stored_payloads', lambda: database.normalize_stored_payloads(batch_size=50), False),
+        ('get_all_experiments', database.get_all_experiments, True),
+        ('fetch_table_data', lambda: database.fetch_table_data('experiments'), True),
+        ('blob_stats', database.blob_stats, True),
+        ('payload_builder_totals all', database.payload_builder_totals, True),
+        ('module_usage_counts', database.module_usage_counts, True),
+        ('payload_mass_per_plan', database.payload_mass_per_plan, True),
+        ('report_summary', database.report_summary, True),
+        ('rebuild_reports', database.rebuild_reports, True),
+        ('gc_blobs', lambda: database.gc_blobs(grace_seconds=0), True),
+        ('cleanup_database', database.cleanup_database, True),
+    ]
+
+
+def trace_pool(pool, callback):
+    # Attach callback as the trace hook of every connection the pool hands out
+    acquire = pool.acquire
+
+    def traced_acquire():
+        conn = acquire()
+        conn.set_trace_callback(callback)
+        return conn
+    pool.acquire = traced_acquire
+
+
+def partial_indexes(conn):
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+
+
+def judge(sql, plan, full_scan_ok, partial):
+    # json_each walks a bound id list, not a table
+    scans = [d for d in plan if d.startswith('SCAN ') and d != 'SCAN CONSTANT ROW'
+             and not d.startswith('SCAN json_each VIRTUAL TABLE')]
+    if not scans or full_scan_ok:
+        return 'ok'
+    bounded = re.search(r'\bLIMIT\b', sql, re.I) and not any('TEMP B-TREE' in d for d in plan)
+    for detail in scans:
+        index = re.search(r'USING (?:COVERING )?INDEX (\w+)', detail)
+        if index and index.group(1) in partial:
+            continue
+        if bounded and not index:
+            continue
+        return 'full scan'
+    return 'ok'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verbose', action='store_true', help='report every statement, not only failures')
+    opts = parser.parse_args()
+
+    captured = []
+    current = {'label': None}
+
+    def record(sql):
+        statement = sql.lstrip()
+        if current['label'] and statement.upper().startswith(CHECKED_STATEMENTS):
+            captured.append((current['label'], current['full'], statement))
+
+    with temp_database() as db_path:
+        plan_id, builder_id = populate()
+        trace_pool(database.get_pool(), record)
+        for label, call, full_scan_ok in scenarios(plan_id, builder_id):
+            current.update(label=label, full=full_scan_ok)
+            call()
+        current['label'] = None
+
+        # The schema is what the migrations built; plans are taken on a
+        # separate, untraced connection
+        conn = sqlite3.connect(db_path)
+        partial = partial_indexes(conn)
+        results, failures, seen = [], 0, set()
+        for label, full_scan_ok, sql in captured:
+            # Statements differing only in literal values share a plan
+            shape = re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+            if (label, shape) in seen:
+                continue
+            seen.add((label, shape))
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+            verdict = judge(sql, plan, full_scan_ok, partial)
+            failures += verdict != 'ok'
+            if verdict != 'ok' or opts.verbose:
+                results.append({'function': label, 'sql': ' '.join(sql.split())[:200],
+                                'plan': plan, 'verdict': verdict})
+        conn.close()
+
+    emit('query_plans', {'statements_checked': len(seen), 'failures': failures, 'queries': results})
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
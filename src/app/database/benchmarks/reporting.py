@@ -0,0 +1,163 @@
+# Reports dashboard: the aggregates read from the report_rollup table
+# against working them out from a full get_all_experiments dump, plus what
+# the rollup triggers add to every insert and how long a rebuild takes.
+# Exits non-zero if the rollups, kept incrementally through inserts,
+# confirmations, edits and deletes, disagree with the full scan or with a
+# rebuild.
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import database
+from benchmarks.common import emit, summarize, temp_database
+from data import MODULE_TYPES, STATUS_OPTIONS
+
+# Time the queries themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+TYPES = ('thermal', 'vacuum', 'radiation', 'imaging', None)
+
+
+def rows(count, users, days, seed):
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    names = [m.name for m in MODULE_TYPES]
+    for i in range(count):
+        day = start + timedelta(days=rng.randrange(days))
+        created = f'{day.isoformat()}T{rng.randrange(24):02d}:00:00.000Z' if rng.random() > 0.01 else None
+        yield (f'exp-{i}', 'reporting benchmark', rng.choice(STATUS_OPTIONS).name, '{}',
+               f'user{rng.randrange(users)}@example.com', created, rng.choice(TYPES),
+               ', '.join(rng.sample(names, rng.randint(0, 3))))
+
+
+def populate(count, users, days, files, seed):
+    rng = random.Random(seed)
+    with database.db_session() as conn:
+        conn.executemany("""
+            INSERT INTO experiments (name, description, status, payload, user_email, created_at,
+                                     experimentType, ModulesNeeded)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows(count, users, days, seed))
+        conn.executemany(
+            "INSERT INTO experiment_files (experiment_id, filename, file_size) VALUES (?, ?, ?)",
+            ((exp_id, f'file-{n}.bin', rng.randrange(1, 1 << 20))
+             for exp_id in range(1, count + 1) for n in range(rng.randrange(files + 1))))
+
+
+def timed_populate(count, users, days, files, seed, triggers):
+    # Insert cost with and without the rollup triggers installed
+    with temp_database():
+        if not triggers:
+            with database.db_session() as conn:
+                for (name,) in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'report_rollup%'").fetchall():
+                    conn.execute(f"DROP TRIGGER {name}")
+        start = time.perf_counter()
+        populate(count, users, days, files, seed)
+        return time.perf_counter() - start
+
+
+def naive_summary(experiments):
+    # What the dashboard would have to do today: aggregate the full dump
+    summary = {'totals': {'experiments': 0, 'files': 0, 'bytes': 0},
+               'status': {}, 'experimentType': {}, 'user_email': {}, 'module': {}}
+    for e in experiments:
+        summary['totals']['experiments'] += 1
+        summary['totals']['files'] += len(e['files'])
+        summary['totals']['bytes'] += sum(f['size'] or 0 for f in e['files'])
+        for dimension in ('status', 'experimentType', 'user_email'):
+            key = e[dimension] or ''
+            summary[dimension][key] = summary[dimension].get(key, 0) + 1
+        for name in {m.strip() for m in (e['ModulesNeeded'] or '').split(',')} - {''}:
+            summary['module'][name] = summary['module'].get(name, 0) + 1
+    return summary
+
+
+def naive_daily(experiments, dimension):
+    counts = {}
+    for e in experiments:
+        day = (e['created_at'] or '')[:10] or 'unknown'
+        counts[(day, e[dimension] or '')] = counts.get((day, e[dimension] or ''), 0) + 1
+    return [{'bucket': day, 'key': key, 'experiments': n} for (day, key), n in sorted(counts.items())]
+
+
+def churn(count, rng):
+    # Confirmations, edits and deletes the triggers have to follow
+    statuses = [s.name for s in STATUS_OPTIONS]
+    database.bulk_update_experiment_confirmation(
+        [(rng.randrange(1, count + 1), rng.choice(statuses), 'churn') for _ in range(count // 5)])
+    with database.db_session() as conn:
+        conn.executemany("UPDATE experiments SET created_at = ?, ModulesNeeded = ? WHERE id = ?",
+                         [('2025-06-01T00:00:00.000Z', 'Camera', rng.randrange(1, count + 1))
+                          for _ in range(count // 50)])
+        conn.executemany("UPDATE experiment_files SET file_size = file_size + 1 WHERE id = ?",
+                         [(rng.randrange(1, count),) for _ in range(count // 50)])
+    for _ in range(count // 100):
+        database.delete_experiment(rng.randrange(1, count + 1))
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--experiments', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--files', type=int, default=3, help='up to this many files per experiment')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    opts = parser.parse_args()
+
+    args = (opts.experiments, opts.users, opts.days, opts.files, opts.seed)
+    insert = {'with_triggers_s': round(timed_populate(*args, triggers=True), 3),
+              'without_triggers_s': round(timed_populate(*args, triggers=False), 3)}
+
+    with temp_database():
+        populate(*args)
+        churn(opts.experiments, random.Random(opts.seed))
+
+        scan_summary, naive_summary_time = timed(lambda: naive_summary(database.get_all_experiments()), opts.repeat)
+        summary, rollup_summary_time = timed(database.report_summary, opts.repeat)
+        scan_daily, naive_daily_time = timed(
+            lambda: naive_daily(database.get_all_experiments(), 'status'), opts.repeat)
+        daily, rollup_daily_time = timed(lambda: database.report_aggregates('status', 'day'), opts.repeat)
+        monthly, rollup_monthly_time = timed(
+            lambda: database.report_aggregates('total', 'month', '2025-03-01', '2025-09-01'), opts.repeat)
+
+        mismatches = []
+        if summary != scan_summary:
+            mismatches.append('summary')
+        if daily['rows'] != scan_daily:
+            mismatches.append('status by day')
+        rebuild = database.rebuild_reports()
+        if database.report_summary() != summary or database.report_aggregates('status', 'day') != daily:
+            mismatches.append('rebuild')
+        with database.db_session() as conn:
+            rollup_rows = conn.execute("SELECT COUNT(*) FROM report_rollup").fetchone()[0]
+
+    emit('reporting', {
+        'experiments': opts.experiments,
+        'insert': insert,
+        'summary': {'full_scan': naive_summary_time, 'rollup': rollup_summary_time},
+        'status_by_day': {'full_scan': naive_daily_time, 'rollup': rollup_daily_time},
+        'total_by_month_range': rollup_monthly_time,
+        'rebuild_s': rebuild['elapsed_s'],
+        'rollup_rows': rollup_rows,
+        'monthly_buckets': len(monthly['rows']),
+        'mismatches': mismatches,
+    })
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
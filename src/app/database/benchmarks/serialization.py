@@ -0,0 +1,82 @@
+# Cost of encoding cli.py output: a --list response of experiments whose
+# stored payloads are large JSON strings, encoded with the stdlib json.dumps
+# cli.py used to call, with each serializer backend, and with the payloads
+# spliced in from the fragment cache (the steady state of a worker that
+# serves the same rows repeatedly). Also times decoding request bodies.
+import argparse
+import json
+import random
+import time
+
+import serializer
+from benchmarks.common import emit
+
+
+def make_rows(count, files, rng):
+    rows = []
+    for i in range(1, count + 1):
+        payload = {
+            'experiment': {'name': f'exp-{i}', 'description': 'thermal cycling of a sample ' * 4,
+                           'status': 'pending approval', 'experimentType': 'Thermal',
+                           'ModulesNeeded': 'Camera, Heater', 'user_email': f'user{i % 50}@example.com'},
+            'files': [{'filename': f'run-{i}-{n}.csv', 'size': rng.randrange(1, 1 << 20),
+                       'sha256': '%064x' % rng.getrandbits(256)} for n in range(files)],
+            'readings': [round(rng.random() * 100, 4) for _ in range(64)],
+        }
+        rows.append({'id': i, 'name': f'exp-{i}', 'description': 'thermal cycling',
+                     'status': 'experiment queued', 'payload': json.dumps(payload),
+                     'notes': None, 'user_email': f'user{i % 50}@example.com',
+                     'created_at': '2024-01-01T00:00:00', 'experimentType': 'Thermal',
+                     'ModulesNeeded': 'Camera, Heater'})
+    return rows
+
+
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best * 1000, 2)
+
+
+def with_fragments(rows):
+    return [{**row, 'payload': serializer.payload_fragment(row['id'], row['payload'])} for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--files', type=int, default=8, help='file references per payload')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    opts = parser.parse_args()
+
+    rows = make_rows(opts.rows, opts.files, random.Random(opts.seed))
+    # Room for every row, as a warm worker would have
+    serializer.PAYLOAD_FRAGMENT_CACHE_BYTES = max(serializer.PAYLOAD_FRAGMENT_CACHE_BYTES,
+                                                  8 * sum(len(r['payload']) for r in rows))
+    baseline, baseline_ms = best_of(opts.repeat, json.dumps, rows)
+    with_fragments(rows)  # warm the fragment cache
+    encoded, plain_ms = best_of(opts.repeat, serializer.dumps_bytes, rows)
+    spliced, cached_ms = best_of(opts.repeat, lambda r: serializer.dumps_bytes(with_fragments(r)), rows)
+    assert json.loads(baseline) == json.loads(encoded) == json.loads(spliced)
+
+    request_body = json.dumps({'experiment': rows[0], 'files': []})
+    _, stdlib_loads_ms = best_of(opts.repeat, lambda: [json.loads(request_body) for _ in range(10000)])
+    _, backend_loads_ms = best_of(opts.repeat, lambda: [serializer.loads(request_body) for _ in range(10000)])
+    emit('serialization', {
+        'backend': serializer.BACKEND,
+        'rows': opts.rows,
+        'output_bytes': len(encoded),
+        'stdlib_json_dumps_ms': baseline_ms,
+        'serializer_dumps_ms': plain_ms,
+        'serializer_cached_payloads_ms': cached_ms,
+        'stdlib_loads_10k_requests_ms': stdlib_loads_ms,
+        'serializer_loads_10k_requests_ms': backend_loads_ms,
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Peak RSS of `cli.py --list --stream` as the experiments table grows, next
+# to the buffered `cli.py --list`. Exits non-zero if the streaming peak grows
+# by more than --max-growth-mb between the smallest and largest table, on
+# top of SQLite's page cache, which fills up to its configured cache_size
+# whatever the table size.
+import argparse
+import os
+import subprocess
+import sys
+
+import database
+from benchmarks.common import CLI_PATH, emit, temp_database
+from storage import StorageConfig
+
+
+def page_cache_mb():
+    # cache_size is in pages when positive, KiB when negative
+    size = StorageConfig.from_env().cache_size
+    return round((-size * 1024 if size < 0 else size * 4096) / (1024 * 1024), 1)
+
+
+def populate(count, payload_bytes):
+    payload = '{"experiment": {"notes": "%s"}}' % ('x' * payload_bytes)
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'exp-{i}', 'stream benchmark', 'pending approval', payload) for i in range(count)))
+
+
+def peak_rss_mb(args):
+    # wait4 reports the rusage of just this child
+    with open(os.devnull, 'wb') as devnull:
+        proc = subprocess.Popen([sys.executable, CLI_PATH] + args, stdout=devnull)
+        _, status, usage = os.wait4(proc.pid, 0)
+    if status != 0:
+        raise RuntimeError(f"cli.py {' '.join(args)} exited with status {status}")
+    # ru_maxrss is in kilobytes on Linux
+    return round(usage.ru_maxrss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--payload-bytes', type=int, default=2048)
+    parser.add_argument('--max-growth-mb', type=float, default=10.0)
+    opts = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in opts.sizes.split(',')):
+        with temp_database():
+            populate(size, opts.payload_bytes)
+            results.append({
+                'experiments': size,
+                'stream_peak_rss_mb': peak_rss_mb(['--list', '--stream']),
+                'buffered_peak_rss_mb': peak_rss_mb(['--list']),
+            })
+    growth = results[-1]['stream_peak_rss_mb'] - results[0]['stream_peak_rss_mb']
+    limit = opts.max_growth_mb + page_cache_mb()
+    emit('stream_memory', {'sizes': results, 'stream_growth_mb': round(growth, 1),
+                           'page_cache_mb': page_cache_mb(), 'growth_limit_mb': limit})
+    if growth > limit:
+        sys.exit(f"streaming peak RSS grew by {growth:.1f} MB (limit {limit} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+# Timing suite for the whole database layer. It generates a synthetic
+# dataset (see datagen.py) in a scratch database, then times every public
+# function in database.py and the cli.py submit, list, confirm and report
+# paths, run in-process through cli.main(). Results are JSON, tagged with
+# the git commit, so runs can be compared:
+#
+#   python3 -m benchmarks.suite --scale small --out before.json
+#   (change something)
+#   python3 -m benchmarks.suite --scale small --compare before.json
+#
+# With --compare the run exits non-zero when a call's p50 got slower than
+# --threshold times the baseline. A public function that is neither timed
+# below nor listed in NOT_TIMED also fails the run, so new API gets covered.
+import argparse
+import inspect
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+
+import cli
+import database
+from benchmarks.common import DATABASE_DIR, emit, summarize, temp_database
+from benchmarks.datagen import SCALES, Generator, generate
+from data import (ExperimentBundle, ExperimentData, ExperimentFileData, PlanOption, STATUS_OPTIONS,
+                  SubscriptionPlan, UserData, UserSubscription)
+
+# Plumbing with nothing of its own to time, or that would wreck the dataset
+NOT_TIMED = {
+    'db_session': 'session plumbing, timed through every call',
+    'with_db_session': 'decorator',
+    'run_transaction': 'session plumbing, timed through every call',
+    'in_session': 'session plumbing',
+    'get_pool': 'plumbing',
+    'get_cache': 'plumbing',
+    'get_blob_store': 'plumbing',
+    'discard_blobs': 'timed through delete_experiment',
+    'drop_users_table': 'drops the users table',
+}
+
+STATUSES = [s.name for s in STATUS_OPTIONS]
+
+
+class Context:
+    # The dataset plus what the calls below need to hand each other
+    def __init__(self, ds, gen):
+        self.ds = ds
+        self.gen = gen
+        # Inside the scratch database's directory, removed along with it
+        self.tmpdir = os.path.dirname(database.db_name)
+
+    def pick(self, items, i):
+        return items[(i * 7919) % len(items)]
+
+    def experiment(self, i):
+        return self.pick(self.ds.experiment_ids, i)
+
+    def file(self, i):
+        return self.pick(self.ds.file_ids, i)
+
+    def user(self, i):
+        return self.pick(self.ds.user_ids, i)
+
+    def claim(self, i):
+        # A lease for the queue calls, taken outside the timed part
+        claimed = database.claim_experiments(f'suite-{i}', 1)
+        if not claimed:
+            database.update_experiment_confirmation(self.experiment(i), 'experiment queued', 'suite')
+            claimed = database.claim_experiments(f'suite-{i}', 1)
+        return claimed[0]['id'], claimed[0]['lease_token']
+
+
+def session_call(fn):
+    # For the public helpers that take the caller's cursor
+    def call(*args):
+        with database.db_session() as conn:
+            return fn(conn.cursor(), *args)
+    return call
+
+
+def drain(iterable, limit=None):
+    n = 0
+    for _ in iterable:
+        n += 1
+        if limit is not None and n >= limit:
+            break
+    return n
+
+
+def view_length(file_id):
+    with database.experiment_file_view(file_id) as view:
+        return len(view)
+
+
+def next_change(since):
+    follow = database.follow_changes(since)
+    try:
+        return next(follow)
+    finally:
+        follow.close()
+
+
+# (name, setup, call, runs at most once) in run order: reads, then writes,
+# then deletes, cleanup_database last. setup(ctx, i) returns the call's
+# arguments and is not timed.
+CALLS = [
+    ('get_subscription_plan', lambda c, i: (c.pick(c.ds.plan_ids, i),), database.get_subscription_plan, False),
+    ('get_user_subscription', lambda c, i: (c.user(i),), database.get_user_subscription, False),
+    ('get_plan_option', lambda c, i: (c.pick(c.ds.plan_option_ids, i),), database.get_plan_option, False),
+    ('credit_balance', lambda c, i: (c.user(i), 'subscription', 10), database.credit_balance, False),
+    ('fetch_table_data', lambda c, i: ('subscription_plans',), database.fetch_table_data, False),
+    ('get_experiment_file', lambda c, i: (c.file(i),), database.get_experiment_file, False),
+    ('get_experiment_file_info', lambda c, i: (c.file(i),), database.get_experiment_file_info, False),
+    ('read_experiment_file', lambda c, i: (c.file(i), 0, 4096), database.read_experiment_file, False),
+    ('iter_experiment_file', lambda c, i: (database.iter_experiment_file(c.file(i)),), drain, False),
+    ('experiment_file_view', lambda c, i: (c.file(i),), view_length, False),
+    ('experiment_file_checksum', lambda c, i: (c.file(i),), database.experiment_file_checksum, False),
+    ('write_experiment_file', lambda c, i: (c.file(i), io.BytesIO()), database.write_experiment_file, False),
+    ('export_experiment_file', lambda c, i: (c.file(i), os.path.join(c.tmpdir, 'export.bin')),
+     database.export_experiment_file, False),
+    ('files_by_experiment', lambda c, i: ([c.experiment(i + n) for n in range(50)],),
+     session_call(database.files_by_experiment), False),
+    ('get_payload_builder', lambda c, i: (c.pick(c.ds.builder_ids, i),), database.get_payload_builder, False),
+    ('get_payload_builders', lambda c, i: (c.pick(c.ds.plan_ids, i),), database.get_payload_builders, False),
+    ('payload_builder_totals', lambda c, i: (c.pick(c.ds.builder_ids, i),), database.payload_builder_totals, False),
+    ('builders_using_module', lambda c, i: (1 + i % 21,), database.builders_using_module, False),
+    ('module_usage_counts', lambda c, i: (), database.module_usage_counts, False),
+    ('payload_mass_per_plan', lambda c, i: (), database.payload_mass_per_plan, False),
+    ('get_modules_by_plan_option', lambda c, i: (1 + i % 3,), database.get_modules_by_plan_option, False),
+    ('list_experiments', lambda c, i: (), database.list_experiments, False),
+    ('iter_experiments', lambda c, i: (database.iter_experiments(status='pending approval'),), drain, False),
+    ('get_all_experiments', lambda c, i: (), database.get_all_experiments, False),
+    ('latest_change_seq', lambda c, i: (), database.latest_change_seq, False),
+    ('get_changes_since', lambda c, i: (max(0, database.latest_change_seq() - 100),),
+     database.get_changes_since, False),
+    ('wait_for_changes', lambda c, i: (max(0, database.latest_change_seq() - 1), 1.0),
+     database.wait_for_changes, False),
+    ('follow_changes', lambda c, i: (max(0, database.latest_change_seq() - 1),), next_change, False),
+    ('report_summary', lambda c, i: (), database.report_summary, False),
+    ('report_aggregates', lambda c, i: ('status', 'month'), database.report_aggregates, False),
+    ('queue_stats', lambda c, i: (), database.queue_stats, False),
+    ('blob_stats', lambda c, i: (), database.blob_stats, False),
+    ('pool_stats', lambda c, i: (), database.pool_stats, False),
+    ('cache_stats', lambda c, i: (), database.cache_stats, False),
+    ('migration_status', lambda c, i: (), database.migration_status, False),
+    ('create_table', lambda c, i: (), database.create_table, False),
+    ('apply_migrations', lambda c, i: (), database.apply_migrations, False),
+    ('invalidate_cache', lambda c, i: ('experiments',), database.invalidate_cache, False),
+
+    ('create_plan_option', lambda c, i: (PlanOption(id=None, name=f'suite-{i}', perks='none'),),
+     database.create_plan_option, False),
+    ('update_plan_option', lambda c, i: (PlanOption(id=c.pick(c.ds.plan_option_ids, i), name='Basic', perks=f'v{i}'),),
+     database.update_plan_option, False),
+    ('create_subscription_plan', lambda c, i: (SubscriptionPlan(credits_to_buy=50, plan_option_id=1),),
+     database.create_subscription_plan, False),
+    ('update_subscription_plan', lambda c, i: (SubscriptionPlan(id=c.pick(c.ds.plan_ids, i), credits_to_buy=100 + i,
+                                                                plan_option_id=1),),
+     database.update_subscription_plan, False),
+    ('save_user_data', lambda c, i: (UserData(username=f'suite-user-{i}', pwd_hash=b'x', api_key_hash=b'y',
+                                              credits_available=100),),
+     database.save_user_data, False),
+    ('create_user_subscription', lambda c, i: (UserSubscription(user_id=c.user(i), plan_id=c.ds.plan_ids[0],
+                                                                credits_available=0),),
+     database.create_user_subscription, False),
+    ('update_user_subscription', lambda c, i: (UserSubscription(user_id=c.user(i), plan_id=c.ds.plan_ids[0],
+                                                                credits_available=500),),
+     database.update_user_subscription, False),
+    ('apply_credits', lambda c, i: (c.user(i), 5, 'suite', f'suite-apply-{i}'), database.apply_credits, False),
+    ('grant_credits', lambda c, i: (c.user(i), 5), database.grant_credits, False),
+    ('debit_credits', lambda c, i: (c.user(i), 1), database.debit_credits, False),
+    ('save_experiment', lambda c, i: (ExperimentData(**c.gen.experiment(10 ** 6 + i, c.ds.user_emails[0], 1)[0]),),
+     database.save_experiment, False),
+    ('save_experiment_file', lambda c, i: (ExperimentFileData(experiment_id=c.experiment(i), filename=f'suite-{i}.bin',
+                                                              file_data=c.gen.file_body()),),
+     database.save_experiment_file, False),
+    ('save_experiment_files', lambda c, i: ([ExperimentFileData(experiment_id=c.experiment(i), filename=name,
+                                                                file_data=c.gen.file_body())
+                                             for name in (f'suite-{i}-{n}.bin' for n in range(3))],),
+     database.save_experiment_files, False),
+    ('store_file_stream', lambda c, i: (f'suite-{i}.bin', iter([c.gen.file_body()])), database.store_file_stream, False),
+    ('store_blobs', lambda c, i: ([ExperimentFileData(experiment_id=0, filename=None, file_data=c.gen.file_body())],),
+     session_call(database.store_blobs), False),
+    ('submit_experiment_bundle', lambda c, i: (ExperimentBundle(
+        experiment=ExperimentData(**c.gen.experiment(2 * 10 ** 6 + i, c.ds.user_emails[0], 1)[0]),
+        files=[ExperimentFileData(experiment_id=0, filename=name, file_data=body)
+               for name, body in c.gen.files(2 * 10 ** 6 + i)]),),
+     database.submit_experiment_bundle, False),
+    ('save_payload_builder', lambda c, i: (c.gen.builder(i, c.ds.plan_ids[0], 1),), database.save_payload_builder, False),
+    ('update_experiment_confirmation', lambda c, i: (c.experiment(i), STATUSES[i % len(STATUSES)], f'suite {i}'),
+     database.update_experiment_confirmation, False),
+    ('bulk_update_experiment_confirmation', lambda c, i: ([(c.experiment(i * 100 + n), STATUSES[n % len(STATUSES)],
+                                                            'suite bulk') for n in range(100)],),
+     database.bulk_update_experiment_confirmation, False),
+    ('confirm_matching_experiments', lambda c, i: ('experiment queued', 'suite',
+                                                   [c.experiment(i * 10 + n) for n in range(10)]),
+     database.confirm_matching_experiments, False),
+    ('claim_experiments', lambda c, i: (f'suite-{i}', 1), database.claim_experiments, False),
+    ('heartbeat_experiment', lambda c, i: c.claim(i), database.heartbeat_experiment, False),
+    ('complete_experiment', lambda c, i: c.claim(i), database.complete_experiment, False),
+    ('fail_experiment', lambda c, i: c.claim(i) + ('suite failure', True), database.fail_experiment, False),
+    ('requeue_expired_leases', lambda c, i: (), database.requeue_expired_leases, False),
+    ('move_inline_files_to_blobs', lambda c, i: (), database.move_inline_files_to_blobs, False),
+    ('reconcile_credits', lambda c, i: (), database.reconcile_credits, True),
+    ('rebuild_reports', lambda c, i: (), database.rebuild_reports, True),
+    ('normalize_stored_payloads', lambda c, i: (), database.normalize_stored_payloads, True),
+
+    ('prune_changes', lambda c, i: (max(0, database.latest_change_seq() - 1000),), database.prune_changes, False),
+    ('delete_experiment', lambda c, i: (c.ds.experiment_ids.pop(),), database.delete_experiment, False),
+    ('delete_payload_builder', lambda c, i: (c.ds.builder_ids.pop(),), database.delete_payload_builder, False),
+    ('delete_user_subscription', lambda c, i: (c.ds.user_ids.pop(),), database.delete_user_subscription, False),
+    ('delete_subscription_plan', lambda c, i: (database.create_subscription_plan(
+        SubscriptionPlan(credits_to_buy=1, plan_option_id=1)),), database.delete_subscription_plan, False),
+    ('delete_plan_option', lambda c, i: (database.create_plan_option(PlanOption(id=None, name='gone', perks='')),),
+     database.delete_plan_option, False),
+    ('gc_blobs', lambda c, i: (0,), database.gc_blobs, True),
+    ('cleanup_database', lambda c, i: (), database.cleanup_database, True),
+]
+
+
+def untimed_functions():
+    # Public functions of database.py the suite does not know about
+    public = {name for name, fn in inspect.getmembers(database, inspect.isfunction)
+              if not name.startswith('_') and fn.__module__ == 'database'}
+    return sorted(public - {name for name, *_ in CALLS} - set(NOT_TIMED))
+
+
+def time_calls(ctx, repeat):
+    results = {}
+    for name, setup, call, once in CALLS:
+        samples = []
+        for i in range(1 if once else repeat):
+            args = setup(ctx, i)
+            start = time.perf_counter()
+            call(*args)
+            samples.append(time.perf_counter() - start)
+        results[name] = summarize(samples)
+    return results
+
+
+def run_cli(argv, payload=None):
+    # cli.main() in this process with argv and stdin as given; returns the
+    # decoded output
+    stdin = io.TextIOWrapper(io.BytesIO(json.dumps(payload).encode() if payload is not None else b''))
+    stdout = io.TextIOWrapper(io.BytesIO())
+    saved_argv, saved_stdin = sys.argv, sys.stdin
+    sys.argv, sys.stdin = ['cli.py'] + argv, stdin
+    try:
+        with redirect_stdout(stdout):
+            cli.main()
+    finally:
+        sys.argv, sys.stdin = saved_argv, saved_stdin
+    return json.loads(stdout.buffer.getvalue())
+
+
+def time_cli(ctx, repeat):
+    gen = ctx.gen
+    runs = {
+        'submit': lambda i: ([], gen.submission(3 * 10 ** 6 + i, ctx.ds.user_emails[0])),
+        'list': lambda i: (['--list'], None),
+        'list page': lambda i: (['--list', '--limit', '50', '--status', 'pending approval'], None),
+        'confirm': lambda i: (['--confirm'], {'experiment_id': ctx.experiment(i), 'status': 'experiment queued',
+                                              'notes': 'suite'}),
+        'confirm bulk': lambda i: (['--confirm'], [[ctx.experiment(i * 100 + n), 'experiment completed', 'suite']
+                                                   for n in range(100)]),
+        'report': lambda i: (['--report'], None),
+    }
+    results = {}
+    for name, make in runs.items():
+        samples = []
+        for i in range(repeat):
+            argv, payload = make(i)
+            start = time.perf_counter()
+            out = run_cli(argv, payload)
+            samples.append(time.perf_counter() - start)
+            if isinstance(out, dict) and 'error' in out:
+                raise RuntimeError(f'cli {name}: {out["error"]}')
+        results[name] = summarize(samples)
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DATABASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=DATABASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def compare(results, baseline, threshold):
+    # p50 of every call in both runs, slowest change first
+    rows = []
+    for section in ('functions', 'cli'):
+        before, after = baseline['results'].get(section, {}), results[section]
+        for name in sorted(set(before) & set(after)):
+            old, new = before[name]['p50_ms'], after[name]['p50_ms']
+            ratio = round(new / old, 2) if old else None
+            rows.append({'call': f'{section}.{name}', 'before_p50_ms': old, 'after_p50_ms': new, 'ratio': ratio})
+    rows.sort(key=lambda r: r['ratio'] or 0, reverse=True)
+    # Timings are only comparable on the same generated data
+    same = all(baseline['results'].get(k) == results[k] for k in ('scale', 'seed', 'dataset', 'cache'))
+    return {
+        'baseline_commit': baseline['results'].get('commit'),
+        'same_dataset': same,
+        'threshold': threshold,
+        'regressions': [r for r in rows if r['ratio'] and r['ratio'] > threshold],
+        'calls': rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='small', choices=sorted(SCALES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--experiments', type=int, help='override the scale\'s experiment count')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cache', default='off', choices=('off', 'memory', 'sqlite'),
+                        help='read cache backend (off times the queries themselves)')
+    parser.add_argument('--out', help='also write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='p50 ratio over the baseline that counts as a regression')
+    opts = parser.parse_args()
+
+    missing = untimed_functions()
+    if missing:
+        sys.exit(f"database.py functions the suite does not time: {', '.join(missing)} "
+                 f"(add them to CALLS or NOT_TIMED)")
+
+    os.environ['CACHE_BACKEND'] = opts.cache
+    with temp_database():
+        start = time.perf_counter()
+        ds = generate(opts.scale, opts.seed, opts.experiments)
+        generated = time.perf_counter() - start
+        ctx = Context(ds, Generator(opts.scale, opts.seed + 1))
+        counts = ds.counts()
+        cli_results = time_cli(ctx, opts.repeat)
+        functions = time_calls(ctx, opts.repeat)
+
+    results = {
+        'commit': git_commit(),
+        'scale': opts.scale,
+        'seed': opts.seed,
+        'repeat': opts.repeat,
+        'cache': opts.cache,
+        'dataset': counts,
+        'generate_s': round(generated, 3),
+        'functions': functions,
+        'cli': cli_results,
+        'not_timed': NOT_TIMED,
+    }
+    regressions = []
+    if opts.compare:
+        with open(opts.compare) as f:
+            results['comparison'] = compare(results, json.load(f), opts.threshold)
+        regressions = results['comparison']['regressions']
+    if opts.out:
+        with open(opts.out, 'w') as f:
+            emit('suite', results, f)
+    emit('suite', results)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Experiment queue under several scheduler processes claiming at once. Some
+# claims are abandoned mid-way (a crashed worker) and must come back after
+# their lease runs out. The check fails unless every experiment is
+# completed exactly once and no stale lease is ever accepted. It also times
+# a claim against a growing table of finished experiments, which should
+# stay flat.
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import database
+from benchmarks.common import emit, summarize, temp_database
+
+# Time the queries themselves, not the read cache in front of them
+os.environ['CACHE_BACKEND'] = 'off'
+
+
+def populate(queued, finished=0):
+    with database.db_session() as conn:
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'done-{i}', 'queue benchmark', 'experiment completed', '{}') for i in range(finished)))
+        conn.executemany(
+            "INSERT INTO experiments (name, description, status, payload) VALUES (?, ?, ?, ?)",
+            ((f'job-{i}', 'queue benchmark', 'experiment queued', '{}') for i in range(queued)))
+
+
+def scheduler(args):
+    worker, batch, lease_seconds, crash_rate = args
+    rng = random.Random(worker)
+    completed, abandoned, stale_accepted = [], 0, 0
+    latencies = []
+    idle_since = None
+    while True:
+        start = time.perf_counter()
+        claimed = database.claim_experiments(f'w{worker}', batch, lease_seconds)
+        latencies.append(time.perf_counter() - start)
+        if not claimed:
+            # Abandoned leases may still come back; give up once the queue
+            # has stayed empty for longer than a lease
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > lease_seconds * 3 and database.queue_stats()['leased'] == 0:
+                break
+            time.sleep(lease_seconds / 4)
+            continue
+        idle_since = None
+        for job in claimed:
+            if rng.random() < crash_rate:
+                abandoned += 1
+                continue
+            database.heartbeat_experiment(job['id'], job['lease_token'], lease_seconds)
+            if database.complete_experiment(job['id'], job['lease_token'], f'done by w{worker}'):
+                completed.append(job['id'])
+                # Completing again with the same, now released, lease must fail
+                if database.complete_experiment(job['id'], job['lease_token']):
+                    stale_accepted += 1
+    return completed, abandoned, stale_accepted, latencies
+
+
+def claim_latency(finished, samples):
+    with temp_database():
+        populate(samples, finished)
+        times = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            database.claim_experiments('probe', 1)
+            times.append(time.perf_counter() - start)
+        return summarize(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--experiments', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=5)
+    parser.add_argument('--lease', type=float, default=0.5, help='lease length in seconds')
+    parser.add_argument('--crash-rate', type=float, default=0.05)
+    parser.add_argument('--table-sizes', default='1000,100000,500000')
+    opts = parser.parse_args()
+
+    with temp_database():
+        populate(opts.experiments)
+        start = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(opts.processes) as pool:
+            results = pool.map(scheduler, [(w, opts.batch, opts.lease, opts.crash_rate)
+                                           for w in range(opts.processes)])
+        elapsed = time.perf_counter() - start
+        completed = [i for r in results for i in r[0]]
+        with database.db_session() as conn:
+            not_done = conn.execute(
+                "SELECT COUNT(*) FROM experiments WHERE status != 'experiment completed'").fetchone()[0]
+            max_attempts = conn.execute("SELECT MAX(attempts) FROM experiments").fetchone()[0]
+    concurrent = {
+        'processes': opts.processes,
+        'experiments': opts.experiments,
+        'completed': len(completed),
+        'completed_twice': len(completed) - len(set(completed)),
+        'not_completed': not_done,
+        'abandoned_claims': sum(r[1] for r in results),
+        'stale_leases_accepted': sum(r[2] for r in results),
+        'max_attempts': max_attempts,
+        'elapsed_s': round(elapsed, 3),
+        'claim_latency': summarize([l for r in results for l in r[3]]),
+    }
+    scaling = {size: claim_latency(size, 200) for size in (int(n) for n in opts.table_sizes.split(','))}
+    emit('work_queue', {'concurrent': concurrent, 'claim_latency_by_finished_rows': scaling})
+    if (concurrent['completed_twice'] or concurrent['not_completed'] or concurrent['stale_leases_accepted']
+            or len(set(completed)) != opts.experiments):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import time
+
+
+class BlobStore:
+    # Content-addressed file store: every blob lives once under
+    # <root>/<sha[:2]>/<sha[2:4]>/<sha>, named by the SHA-256 of its bytes.
+    # Reference counts are kept in the database (the blobs table); this class
+    # only deals with the files.
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def _commit_temp(self, tmp_path, sha256):
+        # Identical content may already be stored; keep the existing copy
+        final = self.path_for(sha256)
+        if os.path.exists(final):
+            os.unlink(tmp_path)
+            return
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(tmp_path, final)
+
+    def _temp_file(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.incoming-', dir=self.root)
+        return os.fdopen(fd, 'wb'), tmp_path
+
+    def touch(self, sha256):
+        # Mark an existing blob as just reused so a concurrent garbage
+        # collection (which only removes files older than its grace period)
+        # leaves it alone. Returns False if the blob is not stored.
+        try:
+            os.utime(self.path_for(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, data: bytes):
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.touch(sha256):
+            return sha256
+        f, tmp_path = self._temp_file()
+        try:
+            with f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._commit_temp(tmp_path, sha256)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return sha256
+
+    def writer(self):
+        return BlobWriter(self)
+
+    def put_chunks(self, chunks):
+        # Store a body that arrives in pieces; returns (sha256, size)
+        w = self.writer()
+        try:
+            for chunk in chunks:
+                w.write(chunk)
+        except BaseException:
+            w.abort()
+            raise
+        return w.commit(), w.size
+
+    def open(self, sha256):
+        return open(self.path_for(sha256), 'rb')
+
+    def read(self, sha256):
+        with open(self.path_for(sha256), 'rb') as f:
+            return f.read()
+
+    def delete(self, sha256):
+        try:
+            os.unlink(self.path_for(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_blobs(self, older_than: float = 0.0):
+        # (sha256, path) of every stored blob last modified more than
+        # older_than seconds ago, plus abandoned .incoming- temp files
+        cutoff = time.time() - older_than
+        if not os.path.isdir(self.root):
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(full) > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                yield name, full
+
+
+class BlobWriter:
+    # Incremental blob write: bytes go to a temp file as they arrive and are
+    # hashed on the way, so a large body never has to be held in memory
+    def __init__(self, store):
+        self.store = store
+        self._file, self._tmp_path = store._temp_file()
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        if self.store.touch(sha256):
+            os.unlink(self._tmp_path)
+        else:
+            self.store._commit_temp(self._tmp_path, sha256)
+        return sha256
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
@@ -0,0 +1,274 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from os import environ
+
+# Read-through cache for hot lookups in database.py. Entries expire after a
+# TTL and the least recently used ones are evicted past a size limit. Writers
+# invalidate a whole namespace ('experiments', 'plan_options', ...) once
+# their transaction has committed.
+#
+# Two stores:
+#   MemoryCache  per process; another process's writes are only seen once
+#                the entry expires
+#   SqliteCache  a small SQLite file shared by every process on the host, so
+#                an invalidation in one (say cli.py --confirm) reaches the
+#                long-running workers at once
+#
+# Each namespace has a generation number that invalidate() bumps. A value
+# loaded on a miss is only stored if the generation is still the one seen
+# before loading, so a read racing a write cannot put stale rows back.
+#
+# CACHE_BACKEND=memory|sqlite|off, CACHE_TTL (seconds), CACHE_SIZE (entries)
+# and CACHE_DB (path of the shared store) configure it. sqlite is the
+# default: the --serve worker and the one-shot cli.py runs the routes spawn
+# are separate processes, and a write in one has to invalidate the others'
+# entries. memory suits a single process that does its own writing.
+
+DEFAULT_TTL = 5.0
+DEFAULT_SIZE = 256
+
+_MISSING = object()
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, namespace, event, n=1):
+        with self._lock:
+            per_ns = self.counts.setdefault(namespace, {
+                'hits': 0, 'misses': 0, 'stores': 0, 'stale_stores_skipped': 0,
+                'expired': 0, 'evicted': 0, 'invalidations': 0})
+            per_ns[event] += n
+
+    def snapshot(self):
+        with self._lock:
+            namespaces = {ns: dict(c) for ns, c in self.counts.items()}
+        totals = {}
+        for counts in namespaces.values():
+            for event, n in counts.items():
+                totals[event] = totals.get(event, 0) + n
+        lookups = totals.get('hits', 0) + totals.get('misses', 0)
+        totals['hit_ratio'] = round(totals.get('hits', 0) / lookups, 4) if lookups else 0.0
+        return {'totals': totals, 'namespaces': namespaces}
+
+
+class MemoryCache:
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_SIZE):
+        self.ttl = float(ttl)
+        self.maxsize = max(1, int(maxsize))
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # (namespace, key) -> (expires_at, value)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[(namespace, key)]
+                self.stats.add(namespace, 'expired')
+                entry = None
+            if entry is None:
+                self.stats.add(namespace, 'misses')
+                return _MISSING
+            self._entries.move_to_end((namespace, key))
+        self.stats.add(namespace, 'hits')
+        return entry[1]
+
+    def set(self, namespace, key, value, generation):
+        with self._lock:
+            if self._generations.get(namespace, 0) != generation:
+                self.stats.add(namespace, 'stale_stores_skipped')
+                return False
+            self._entries[(namespace, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.maxsize:
+                (evicted_ns, _), _ = self._entries.popitem(last=False)
+                self.stats.add(evicted_ns, 'evicted')
+        self.stats.add(namespace, 'stores')
+        return True
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+        self.stats.add(namespace, 'invalidations')
+
+    def clear(self):
+        with self._lock:
+            for namespace in {k[0] for k in self._entries} | set(self._generations):
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._entries.clear()
+
+    def entries(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteCache:
+    # Values are pickled; the file is private to this host's processes
+    def __init__(self, db_path, ttl=DEFAULT_TTL, maxsize=DEFAULT_SIZE):
+        self.db_path = db_path
+        self.ttl = float(ttl)
+        self.maxsize = max(1, int(maxsize))
+        self.stats = CacheStats()
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries(accessed_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_generations (
+                    namespace TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                ) WITHOUT ROWID""")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def generation(self, namespace):
+        row = self._conn().execute(
+            "SELECT generation FROM cache_generations WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, namespace, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                           (namespace, key)).fetchone()
+        if row is not None and row[1] <= now:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                         (namespace, key, now))
+            self.stats.add(namespace, 'expired')
+            row = None
+        if row is None:
+            self.stats.add(namespace, 'misses')
+            return _MISSING
+        # LRU order only needs to be roughly right; skip the write when the
+        # entry was touched within the last second
+        if now - row[2] > 1.0:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                         (now, namespace, key))
+        self.stats.add(namespace, 'hits')
+        return pickle.loads(row[0])
+
+    def set(self, namespace, key, value, generation):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Stored only while the namespace has not been invalidated since
+            # the caller read the value
+            stored = conn.execute("""
+                INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, accessed_at)
+                SELECT ?, ?, ?, ?, ?
+                WHERE COALESCE((SELECT generation FROM cache_generations WHERE namespace = ?), 0) = ?
+            """, (namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + self.ttl, now,
+                  namespace, generation)).rowcount
+            evicted = 0
+            if stored:
+                excess = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.maxsize
+                if excess > 0:
+                    evicted = conn.execute("""
+                        DELETE FROM cache_entries WHERE (namespace, key) IN (
+                            SELECT namespace, key FROM cache_entries ORDER BY accessed_at LIMIT ?)
+                    """, (excess,)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats.add(namespace, 'stores' if stored else 'stale_stores_skipped')
+        if evicted:
+            self.stats.add(namespace, 'evicted', evicted)
+        return bool(stored)
+
+    def invalidate(self, namespace):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                INSERT INTO cache_generations (namespace, generation) VALUES (?, 1)
+                ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1
+            """, (namespace,))
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.stats.add(namespace, 'invalidations')
+
+    def clear(self):
+        conn = self._conn()
+        namespaces = [row[0] for row in conn.execute(
+            "SELECT DISTINCT namespace FROM cache_entries UNION SELECT namespace FROM cache_generations")]
+        for namespace in namespaces:
+            self.invalidate(namespace)
+
+    def entries(self):
+        return self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+def from_env(db_path):
+    # The store configured by the CACHE_* variables, or None when disabled
+    backend = (environ.get('CACHE_BACKEND') or 'sqlite').lower()
+    ttl = float(environ.get('CACHE_TTL') or DEFAULT_TTL)
+    size = int(environ.get('CACHE_SIZE') or DEFAULT_SIZE)
+    if backend == 'off' or ttl <= 0:
+        return None
+    if backend == 'memory':
+        return MemoryCache(ttl, size)
+    if backend == 'sqlite':
+        return SqliteCache(environ.get('CACHE_DB') or db_path + '-cache', ttl, size)
+    raise ValueError("CACHE_BACKEND must be 'memory', 'sqlite' or 'off'")
+
+
+def cached(namespace, get_store, bypass=None):
+    """
+    Decorator caching func's result per call arguments in the store returned
+    by get_store() (nothing is cached when that is None, or when bypass()
+    is true). Cached values are shared between callers, who must not
+    mutate them.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            store = get_store()
+            if store is None or (bypass is not None and bypass()):
+                return func(*args, **kwargs)
+            key = repr((func.__name__, args, sorted(kwargs.items())))
+            value = store.get(namespace, key)
+            if value is not _MISSING:
+                return value
+            generation = store.generation(namespace)
+            value = func(*args, **kwargs)
+            store.set(namespace, key, value, generation)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
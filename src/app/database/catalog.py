@@ -0,0 +1,107 @@
+import hashlib
+import importlib.util
+import json
+import threading
+from types import MappingProxyType
+
+import data
+from data import to_dict
+
+# Plan option used when a request gives none (or one that does not parse)
+DEFAULT_PLAN_OPTION_ID = 1
+
+
+def parse_plan_option_id(plan_option_id):
+    # Accepts int or string, including values like '1:1' (first integer wins)
+    if isinstance(plan_option_id, str):
+        try:
+            return int(plan_option_id.split(':')[0])
+        except ValueError:
+            return DEFAULT_PLAN_OPTION_ID
+    return plan_option_id
+
+
+class ModuleCatalog:
+    # Immutable index over the module types, built once: the modules of each
+    # plan option (in catalog order) and every module by id. version is a
+    # hash of the contents, so two processes holding the same catalog agree
+    # on it and a client can tell when it has changed.
+    __slots__ = ('modules', 'by_plan_option', 'by_id', 'version', '_plan_option_dicts')
+
+    def __init__(self, module_types):
+        modules = tuple(module_types)
+        by_plan_option = {}
+        for m in modules:
+            by_plan_option.setdefault(m.subscription_plan_option_id, []).append(m)
+        dicts = [to_dict(m) for m in modules]
+        self.modules = modules
+        self.by_plan_option = MappingProxyType({k: tuple(v) for k, v in by_plan_option.items()})
+        self.by_id = MappingProxyType({m.id: m for m in modules})
+        self.version = hashlib.sha256(
+            json.dumps(dicts, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        grouped = {}
+        for m, d in zip(modules, dicts):
+            grouped.setdefault(m.subscription_plan_option_id, []).append(d)
+        self._plan_option_dicts = MappingProxyType({k: tuple(v) for k, v in grouped.items()})
+
+    def for_plan_option(self, plan_option_id):
+        return self.by_plan_option.get(parse_plan_option_id(plan_option_id), ())
+
+    def dicts_for_plan_option(self, plan_option_id):
+        # Serializable form of for_plan_option; the dicts are shared, do not
+        # modify them
+        return self._plan_option_dicts.get(parse_plan_option_id(plan_option_id), ())
+
+    def get(self, module_id):
+        return self.by_id.get(module_id)
+
+    def footprint(self, module_id):
+        # (w, h, massKg) of a module, all None when it is not in the catalog
+        m = self.by_id.get(module_id)
+        return (m.w, m.h, m.massKg) if m is not None else (None, None, None)
+
+    def to_dict(self):
+        # Whole catalog as JSON-ready data, indexed by plan option id
+        return {
+            'version': self.version,
+            'modules': [d for group in self._plan_option_dicts.values() for d in group],
+            'by_plan_option': {str(k): [d['id'] for d in v] for k, v in self._plan_option_dicts.items()},
+            'default_plan_option_id': DEFAULT_PLAN_OPTION_ID,
+        }
+
+
+_catalog = ModuleCatalog(data.MODULE_TYPES)
+_reload_lock = threading.Lock()
+
+
+def get_catalog() -> ModuleCatalog:
+    # Readers take a reference to the current catalog and keep using it even
+    # if a reload swaps in a new one meanwhile
+    return _catalog
+
+
+def load_module_types():
+    # MODULE_TYPES as data.py defines it on disk now. The file is run as a
+    # separate module, so a long-running process (the --serve worker) picks
+    # up edits without re-importing data and swapping out the model classes
+    # every other module already holds.
+    spec = importlib.util.spec_from_file_location('_catalog_source', data.__file__)
+    source = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(source)
+    return source.MODULE_TYPES
+
+
+def reload_catalog(module_types=None):
+    # Rebuild the index (from data.py as it is now unless module_types is
+    # given) and swap it in. Returns (version, changed).
+    global _catalog
+    with _reload_lock:
+        new = ModuleCatalog(load_module_types() if module_types is None else module_types)
+        if new.version == _catalog.version:
+            return _catalog.version, False
+        _catalog = new
+        return new.version, True
+
+
+def modules_for_plan_option(plan_option_id):
+    return list(_catalog.for_plan_option(plan_option_id))
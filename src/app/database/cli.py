@@ -1,53 +1,253 @@
 #!/usr/bin/env python3
+import sqlite3
 import sys
-import json
-from base64 import b64decode
-from database import save_experiment, save_experiment_file, create_table
-from database import get_all_experiments, save_payload_builder
-from data import ExperimentData, ExperimentFileData
+import time
+from database import create_table, submit_experiment_bundle, store_file_stream
+from database import get_blob_store, write_experiment_file, discard_blobs
+from database import get_all_experiments, iter_experiments, list_experiments, pool_stats, blob_stats, cache_stats
+from data import ExperimentData, ExperimentFileData, ExperimentBundle, to_dict
+from catalog import get_catalog, reload_catalog
+from payloads import decode_file_data, iter_decoded_chunks, normalize_payload
+from serializer import dumps, dumps_bytes, loads, load, write, payload_fragment
 
 
-def main():
-    # Ensure tables exist
-    create_table()
-    # If run with --list, print all experiments
-    if len(sys.argv) > 1 and sys.argv[1] == '--list':
-        rows = get_all_experiments()
-        print(json.dumps(rows))
-        return
+# list_experiments options; when none are given --list keeps returning the
+# full array of experiments
+LIST_OPTIONS = ('cursor', 'limit', 'status', 'user_email', 'experimentType',
+                'created_after', 'created_before', 'fields')
 
-    # If run with --modules, print available module types
-    if len(sys.argv) > 1 and sys.argv[1] == '--modules':
-        # Support optional --plan_option_id argument
-        plan_option_id = '1'
-        if '--plan_option_id' in sys.argv:
-            idx = sys.argv.index('--plan_option_id')
-            if len(sys.argv) > idx + 1:
-                plan_option_id = sys.argv[idx + 1]
-        from data import get_modules_for_plan_option
-        rows = get_modules_for_plan_option(plan_option_id)
-        # Convert dataclass objects to dicts
-        modules = [m.__dict__ for m in rows]
-        print(json.dumps({"modules": modules}))
-        return
+# Filters a bulk confirm may select experiments by
+CONFIRM_FILTERS = ('ids', 'from_status', 'user_email', 'experimentType', 'created_after', 'created_before')
+
+# Command-line flag for each list option
+LIST_FLAGS = {
+    '--cursor': 'cursor',
+    '--limit': 'limit',
+    '--status': 'status',
+    '--user-email': 'user_email',
+    '--type': 'experimentType',
+    '--since': 'created_after',
+    '--until': 'created_before',
+    '--fields': 'fields',
+}
+
+
+# Whether listings reuse cached payload encodings; only the long-running
+# --serve worker does. A one-shot or streaming cli.py run sees each payload
+# once, so the cache would only cost it memory.
+cache_payloads = False
+
+
+def with_payload_fragments(items):
+    # Stored payloads never change once written (bar a migration), so their
+    # encoded form is cached and spliced into the output (see serializer.py).
+    # The rows may come from the read cache, so they are copied, not changed.
+    if not cache_payloads:
+        return items
+    return [{**item, 'payload': payload_fragment(item['id'], item['payload'])} if 'payload' in item else item
+            for item in items]
+
+
+def list_options(args, paged=True):
+    # The listing options present in args, with cursor and limit checked to
+    # be integers; raises ValueError naming the bad option. Unknown fields
+    # are refused by the query itself.
+    options = {k: args[k] for k in LIST_OPTIONS if args.get(k) is not None and (paged or k != 'limit')}
+    for name in ('cursor', 'limit'):
+        if name in options:
+            try:
+                options[name] = int(options[name])
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer, not {options[name]!r}") from None
+    return options
+
+
+def list_command(args):
+    try:
+        options = list_options(args)
+        if not options:
+            return with_payload_fragments(get_all_experiments())
+        page = list_experiments(**options)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**page, 'experiments': with_payload_fragments(page['experiments'])}
+
+
+def stream_list(args, out):
+    # One JSON object per line, written as rows come off the cursor. Payloads
+    # are encoded as they go, never cached, so memory stays flat. Bad options
+    # raise ValueError before anything is written.
+    for row in iter_experiments(**list_options(args, paged=False)):
+        write(row, out, flush=False)
+    getattr(out, 'buffer', out).flush()
+
+
+def list_args_from_argv():
+    args = {}
+    for flag, option in LIST_FLAGS.items():
+        value = arg_value(flag)
+        if value is None:
+            continue
+        # status, user email, type and fields accept comma separated lists
+        if option in ('status', 'user_email', 'experimentType', 'fields'):
+            value = [v.strip() for v in value.split(',') if v.strip()]
+        args[option] = value
+    return args
+
+
+def modules_command(args):
+    # Support optional plan_option_id argument
+    plan_option_id = args.get('plan_option_id', '1')
+    catalog = get_catalog()
+    return {"modules": list(catalog.dicts_for_plan_option(plan_option_id)), "version": catalog.version}
+
+
+def catalog_command(args):
+    # The whole module catalog; pass "reload": true to re-read data.py and
+    # rebuild it first
+    if args.get('reload'):
+        reload_catalog()
+    return get_catalog().to_dict()
+
+
+def layout_command(builder):
+    # Validate a payload builder's items, or place them when auto_layout is
+    # set. max_mass_kg and time_budget (seconds) are optional.
+    from placement import validate_layout, auto_pack, PACK_TIME_BUDGET
+    items = builder.get('items') or []
+    if builder.get('auto_layout'):
+        return auto_pack(builder.get('bay_width'), builder.get('bay_height'), items,
+                         builder.get('max_mass_kg'), float(builder.get('time_budget') or PACK_TIME_BUDGET))
+    return validate_layout(builder.get('bay_width'), builder.get('bay_height'), items,
+                           builder.get('max_mass_kg'))
+
+
+def confirm_command(payload):
+    # A list of confirmations, {"updates": [...]} or {"filter": {...},
+    # "status": ...} is applied in one transaction (see
+    # bulk_update_experiment_confirmation); anything else is one experiment
+    if isinstance(payload, list) or 'updates' in payload:
+        from database import bulk_update_experiment_confirmation
+        return bulk_update_experiment_confirmation(payload if isinstance(payload, list) else payload['updates'])
+    if 'filter' in payload:
+        from database import confirm_matching_experiments
+        unknown = set(payload['filter']) - set(CONFIRM_FILTERS)
+        if unknown:
+            return {"error": f"unknown filter: {', '.join(sorted(unknown))}"}
+        return confirm_matching_experiments(payload.get('status'), payload.get('notes'), **payload['filter'])
+    from database import update_experiment_confirmation
+    experiment_id = payload.get('experiment_id')
+    status = payload.get('status', 'experiment queued')  # Default to queued if not specified
+    notes = payload.get('notes', '')
+    rows_updated = update_experiment_confirmation(experiment_id, status, notes)
+    return {"ok": True, "updated": rows_updated}
+
+
+def credits_command(payload):
+    # Debit ('amount'), grant ('grant') or adjust by a signed 'delta';
+    # retries of the same request should carry the same idempotency_key
+    import database
+    if not payload.get('user_id'):
+        return {"error": "user_id is required"}
+    account = payload.get('account', 'subscription')
+    try:
+        if 'amount' in payload:
+            return database.debit_credits(int(payload['user_id']), int(payload['amount']),
+                                          payload.get('reason') or 'debit', payload.get('idempotency_key'),
+                                          account, payload.get('experiment_id'))
+        if 'grant' in payload:
+            return database.grant_credits(int(payload['user_id']), int(payload['grant']),
+                                          payload.get('reason') or 'grant', payload.get('idempotency_key'),
+                                          account)
+        delta = int(payload.get('delta') or 0)
+        if not delta:
+            return {"error": "a positive amount or grant, or a non-zero delta, is required"}
+        return database.apply_credits(int(payload['user_id']), delta, payload.get('reason'),
+                                      payload.get('idempotency_key'), account, payload.get('experiment_id'))
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}
 
-    # If run with --confirm, update the experiment's status
-    if len(sys.argv) > 1 and sys.argv[1] == '--confirm':
-        from database import update_experiment_confirmation
-        payload = json.load(sys.stdin)
-        experiment_id = payload.get('experiment_id')
-        status = payload.get('status', 'experiment queued')  # Default to queued if not specified
-        notes = payload.get('notes', '')
-        rows_updated = update_experiment_confirmation(experiment_id, status, notes)
-        print(json.dumps({"ok": True, "updated": rows_updated}))
-        return
 
+def balance_command(payload):
+    from database import credit_balance
+    balance = credit_balance(int(payload['user_id']), payload.get('account', 'subscription'),
+                             int(payload.get('history') or 0))
+    return balance if balance is not None else {"error": "no such account"}
 
-    payload = json.load(sys.stdin)
-    # Save all entities from data.py if present in payload
+
+def queue_command(action, payload):
+    # Scheduler side of the experiment queue: claim, heartbeat, complete,
+    # fail, requeue_expired or stats
+    import database
+    if action == 'claim':
+        if not payload.get('worker'):
+            return {"error": "worker is required"}
+        return {"experiments": database.claim_experiments(
+            payload['worker'], int(payload.get('limit') or 1),
+            float(payload.get('lease_seconds') or database.QUEUE_LEASE_SECONDS))}
+    if action == 'requeue_expired':
+        return database.requeue_expired_leases()
+    if action == 'stats':
+        return database.queue_stats()
+    if action not in ('heartbeat', 'complete', 'fail'):
+        return {"error": f"unknown queue action: {action}"}
+    if payload.get('experiment_id') is None or not payload.get('lease_token'):
+        return {"error": "experiment_id and lease_token are required"}
+    experiment_id, token = int(payload['experiment_id']), payload['lease_token']
+    if action == 'heartbeat':
+        held = database.heartbeat_experiment(experiment_id, token,
+                                             float(payload.get('lease_seconds') or database.QUEUE_LEASE_SECONDS))
+    elif action == 'complete':
+        held = database.complete_experiment(experiment_id, token, payload.get('notes'))
+    else:
+        held = database.fail_experiment(experiment_id, token, payload.get('error'), bool(payload.get('retry')))
+    return {"ok": held} if held else {"error": "lease not held"}
+
+
+def changes_command(args):
+    # Experiment changes after args['since'] (the head seq when omitted).
+    # With 'wait' (seconds) the call long-polls until there is something.
+    from database import get_changes_since, wait_for_changes, CHANGES_PAGE_SIZE
+    since = int(args['since']) if args.get('since') is not None else None
+    limit = int(args.get('limit') or CHANGES_PAGE_SIZE)
+    experiment_id = int(args['experiment_id']) if args.get('experiment_id') is not None else None
+    if args.get('wait'):
+        return wait_for_changes(since, float(args['wait']), limit, experiment_id)
+    return get_changes_since(since, limit, experiment_id)
+
+
+def follow_command(args, out):
+    # Write each change as one NDJSON line as soon as it commits
+    from database import follow_changes
+    since = int(args['since']) if args.get('since') is not None else None
+    experiment_id = int(args['experiment_id']) if args.get('experiment_id') is not None else None
+    for change in follow_changes(since, experiment_id=experiment_id):
+        write(change, out)
+
+
+def report_command(args):
+    # Dashboard aggregates: with 'by' one dimension per time 'bucket'
+    # (day, week, month, year or all), otherwise every dimension summed
+    # over the range
+    from database import report_aggregates, report_summary
+    if args.get('by'):
+        return report_aggregates(args['by'], args.get('bucket') or 'day', args.get('since'),
+                                 args.get('until'), args.get('key'))
+    return report_summary(args.get('since'), args.get('until'))
+
+
+def submit_command(payload, stored_files=None):
+    # ExperimentData is required; check it before anything is written
+    exp = payload.get('experiment')
+    files = payload.get('files', [])
+    if not exp:
+        return {"error": "missing experiment"}
+
+    # Build every entity from data.py present in the payload, then save them
+    # all in one transaction
     # UserData
+    user_obj = None
     if 'user' in payload and payload['user']:
-        from database import save_user_data
         from data import UserData
         user = payload['user']
         # Map 'credits' to 'credits_available' if present
@@ -57,11 +257,10 @@ def main():
         allowed_fields = set(UserData.__dataclass_fields__.keys())
         filtered_user = {k: v for k, v in user.items() if k in allowed_fields}
         user_obj = UserData(**filtered_user)
-        save_user_data(user_obj)
 
     # SubscriptionPlan
+    plan_obj = None
     if 'subscription_plan' in payload and payload['subscription_plan']:
-        from database import create_subscription_plan
         from data import SubscriptionPlan
         plan = payload['subscription_plan']
         # Only pass fields that exist in SubscriptionPlan
@@ -72,23 +271,18 @@ def main():
             # Default to 1 if not set or invalid (should match your frontend default)
             filtered_plan['plan_option_id'] = 1
         plan_obj = SubscriptionPlan(**filtered_plan)
-        create_subscription_plan(plan_obj)
 
     # UserSubscription
+    sub_obj = None
     if 'user_subscription' in payload and payload['user_subscription']:
-        from database import create_user_subscription
         from data import UserSubscription
-        sub = payload['user_subscription']
-        sub_obj = UserSubscription(**sub)
-        create_user_subscription(sub_obj)
+        sub_obj = UserSubscription(**payload['user_subscription'])
 
     # PlanOption
+    option_obj = None
     if 'plan_option' in payload and payload['plan_option']:
-        from database import create_plan_option
         from data import PlanOption
-        option = payload['plan_option']
-        option_obj = PlanOption(**option)
-        create_plan_option(option_obj)
+        option_obj = PlanOption(**payload['plan_option'])
 
     # ModuleType
     if 'module_type' in payload and payload['module_type']:
@@ -96,26 +290,42 @@ def main():
         pass
 
     # PayloadBuilderData
-    builder_id = None
+    builder_obj = None
+    layout_warnings = None
     if 'payload_builder' in payload and payload['payload_builder']:
         builder = payload['payload_builder']
+        # Items should fit the bay without overlapping (see placement.py);
+        # with "auto_layout" their positions are chosen for them. Only a
+        # request that opts in ("auto_layout" or "validate_layout") is
+        # refused over its layout; otherwise the problems come back as
+        # warnings next to the saved experiment.
+        placement = layout_command(builder)
+        if not placement['ok']:
+            if builder.get('auto_layout') or builder.get('validate_layout'):
+                return {"error": "invalid payload builder layout", "placement": placement}
+            layout_warnings = placement['errors']
+        if builder.get('auto_layout'):
+            builder['items'] = placement['items']
         builder_obj = {
             'name': builder.get('name'),
             'bay_width': int(builder.get('bay_width') or 0),
             'bay_height': int(builder.get('bay_height') or 0),
-            'items_json': json.dumps(builder.get('items') or []),
+            'items': builder.get('items') or [],
             'created_at': builder.get('created_at') or None,
         }
-        builder_id = save_payload_builder(builder_obj)
 
-    # ExperimentData
-    exp = payload.get('experiment')
-    files = payload.get('files', [])
-    if not exp:
-        print(json.dumps({"error": "missing experiment"}))
-        sys.exit(2)
-    payload_str = json.dumps(payload)
-    from data import ExperimentData
+    # ExperimentFileData; each body is decoded in chunks straight into the
+    # blob store (unless --submit-stream already put it there) and its base64
+    # text dropped. experiment_id is set when the bundle is saved.
+    file_objs = stored_files
+    if file_objs is None:
+        file_objs = [store_file_stream(f.get('filename'), iter_decoded_chunks(f.pop('data', None)))
+                     for f in files]
+    stored_at = time.time()
+
+    # ExperimentData; the stored payload references the files instead of
+    # repeating their base64 bodies
+    payload_str = dumps(normalize_payload(payload, file_objs))
     exp_obj = ExperimentData(
         name=exp.get('name', ''),
         description=exp.get('description', ''),
@@ -127,19 +337,24 @@ def main():
         experimentType=exp.get('experimentType'),
         ModulesNeeded=exp.get('ModulesNeeded')
     )
-    exp_id = save_experiment(exp_obj)
 
-    # ExperimentFileData
-    from data import ExperimentFileData
-    for f in files:
-        filename = f.get('filename')
-        data_b64 = f.get('data')
-        try:
-            data = b64decode(data_b64)
-        except Exception:
-            data = b''
-        file_obj = ExperimentFileData(experiment_id=exp_id, filename=filename, file_data=data)
-        save_experiment_file(file_obj)
+    try:
+        saved = submit_experiment_bundle(ExperimentBundle(
+            experiment=exp_obj,
+            files=file_objs,
+            user=user_obj,
+            subscription_plan=plan_obj,
+            user_subscription=sub_obj,
+            plan_option=option_obj,
+            payload_builder=builder_obj,
+        ))
+    except sqlite3.Error as e:
+        # Bodies stored for this request only (--submit-stream cleans up its own)
+        if stored_files is None:
+            discard_blobs({f.blob_sha256 for f in file_objs}, stored_at)
+        return {"error": f"could not save experiment: {e}"}
+    exp_id = saved['experiment_id']
+    builder_id = saved['payload_builder_id']
 
     out = {
         "ok": True,
@@ -150,11 +365,380 @@ def main():
             "description": exp.get('description'),
             "status": exp.get('status')
         },
-        "files_saved": len(files)
+        "files_saved": saved['files_saved']
     }
     if builder_id:
         out['payload_builder_id'] = builder_id
-    print(json.dumps(out))
+    if layout_warnings:
+        out['layout_warnings'] = layout_warnings
+    return out
+
+
+def submit_stream_command(infile):
+    """
+    Submission read as newline-delimited JSON so file bodies never have to be
+    buffered whole. The first line is the submission itself without file
+    bodies. Each file follows as a {"filename": ...} line (any other keys are
+    kept as the file's payload entry) and then any number of
+    {"data": "<base64>"} lines, each chunk valid base64 on its own.
+    """
+    header = loads(infile.readline() or 'null')
+    if not isinstance(header, dict):
+        return {"error": "missing submission header"}
+    entries, stored = [], []
+    writer = None
+    out = stored_at = None
+
+    def finish():
+        if writer is not None:
+            entry = entries[-1]
+            stored.append(ExperimentFileData(experiment_id=0, filename=entry.get('filename'), file_data=None,
+                                             blob_sha256=writer.commit(), file_size=writer.size))
+
+    try:
+        for line in infile:
+            if not line.strip():
+                continue
+            record = loads(line)
+            if 'data' in record:
+                if writer is None:
+                    out = {"error": "file data before any filename"}
+                    return out
+                writer.write(decode_file_data(record['data']))
+            else:
+                finish()
+                entries.append(record)
+                writer = get_blob_store().writer()
+        finish()
+        writer = None
+        stored_at = time.time()
+        header['files'] = entries
+        out = submit_command(header, stored_files=stored)
+        return out
+    finally:
+        if writer is not None and len(stored) < len(entries):
+            writer.abort()
+        # A rejected (or failed) submission leaves nothing in the blob store;
+        # only a body someone else touched after ours were written is kept
+        if out is None or 'error' in out:
+            discard_blobs({f.blob_sha256 for f in stored}, stored_at or time.time())
+
+
+def write_file_command(file_id, offset, length, out):
+    # Raw bytes of a stored file (or a byte range of it), written from the
+    # memory-mapped blob
+    write_experiment_file(int(file_id), out, int(offset or 0), None if length is None else int(length))
+    out.flush()
+
+
+# Commands understood by the worker (--serve); each takes the request's
+# "payload" dict and returns something JSON serializable
+COMMANDS = {
+    'submit': submit_command,
+    'list': list_command,
+    'modules': modules_command,
+    'catalog': catalog_command,
+    'layout': layout_command,
+    'confirm': confirm_command,
+    'changes': changes_command,
+    'credits': credits_command,
+    'queue': lambda payload: queue_command(payload.get('action'), payload),
+    'balance': balance_command,
+    'report': report_command,
+    'ping': lambda payload: {"ok": True},
+    'pool_stats': lambda payload: pool_stats(),
+    'blob_stats': lambda payload: blob_stats(),
+    'cache_stats': lambda payload: cache_stats(),
+}
+
+
+def handle_request(line):
+    # Answer one newline-delimited JSON request, echoing its id back so the
+    # caller can match responses to requests
+    try:
+        request = loads(line)
+    except ValueError as e:
+        return {"id": None, "ok": False, "error": f"invalid JSON: {e}"}
+    if not isinstance(request, dict):
+        return {"id": None, "ok": False, "error": "request must be a JSON object"}
+    req_id = request.get('id')
+    handler = COMMANDS.get(request.get('command'))
+    if handler is None:
+        return {"id": req_id, "ok": False, "error": f"unknown command: {request.get('command')}"}
+    try:
+        result = handler(request.get('payload') or {})
+    except Exception as e:
+        return {"id": req_id, "ok": False, "error": str(e)}
+    if isinstance(result, dict) and 'error' in result:
+        return {"id": req_id, "ok": False, "error": result['error']}
+    return {"id": req_id, "ok": True, "result": result}
+
+
+def serve_stream(infile, outfile):
+    for line in infile:
+        if not line.strip():
+            continue
+        write(handle_request(line), outfile)
+
+
+def serve_socket(socket_path):
+    import os
+    import signal
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                request = None
+                try:
+                    request = loads(line)
+                except ValueError:
+                    pass
+                if isinstance(request, dict) and request.get('command') == 'watch':
+                    # Push changes on this connection until the client goes away
+                    self.watch(request.get('id'), request.get('payload') or {})
+                    return
+                self.wfile.write(dumps_bytes(handle_request(line)) + b'\n')
+                self.wfile.flush()
+
+        def watch(self, req_id, payload):
+            from database import follow_changes
+            since = int(payload['since']) if payload.get('since') is not None else None
+            try:
+                for change in follow_changes(since, experiment_id=payload.get('experiment_id')):
+                    self.wfile.write(dumps_bytes({"id": req_id, "ok": True, "change": change}) + b'\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    # A socket file left behind by a crashed worker would make bind() fail
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    # Turn SIGTERM into SystemExit so the socket file is removed on shutdown
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def serve(socket_path=None):
+    # Long-running worker: tables are created once, then every request is
+    # answered from the same warm interpreter
+    global cache_payloads
+    cache_payloads = True
+    create_table()
+    if socket_path:
+        serve_socket(socket_path)
+    else:
+        serve_stream(sys.stdin, sys.stdout)
+
+
+def arg_value(name, default=None):
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if len(sys.argv) > idx + 1:
+            return sys.argv[idx + 1]
+    return default
+
+
+def main():
+    # Run as a worker that reads newline-delimited JSON commands
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(arg_value('--socket'))
+        return
+
+    # If run with --modules, print available module types (from the
+    # in-memory catalog, so the database is not touched)
+    if len(sys.argv) > 1 and sys.argv[1] == '--modules':
+        write(modules_command({'plan_option_id': arg_value('--plan_option_id', '1')}))
+        return
+    # If run with --catalog, print the whole module catalog with its version
+    if len(sys.argv) > 1 and sys.argv[1] == '--catalog':
+        write(catalog_command({}))
+        return
+
+    # If run with --layout, check (or with "auto_layout" pack) the payload
+    # builder read from stdin
+    if len(sys.argv) > 1 and sys.argv[1] == '--layout':
+        write(layout_command(load(sys.stdin)))
+        return
+
+    # Schema migrations: --migrate applies pending ones (up to --to N),
+    # --migrations lists them with the version each database is at
+    if len(sys.argv) > 1 and sys.argv[1] == '--migrate':
+        from database import apply_migrations
+        target = arg_value('--to')
+        write(apply_migrations(int(target) if target is not None else None))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--migrations':
+        from database import migration_status
+        write(migration_status())
+        return
+
+    # Bring the schema up to date (a single version check once it is)
+    create_table()
+    # If run with --list, print all experiments (or one page of them when
+    # paging/filter flags are given); --stream prints them as NDJSON
+    if len(sys.argv) > 1 and sys.argv[1] == '--list':
+        if '--stream' in sys.argv:
+            try:
+                stream_list(list_args_from_argv(), sys.stdout)
+            except ValueError as e:
+                write({"error": str(e)})
+                sys.exit(2)
+        else:
+            out = list_command(list_args_from_argv())
+            write(out)
+            if isinstance(out, dict) and 'error' in out:
+                sys.exit(2)
+        return
+
+    # If run with --migrate-payloads, strip file bodies out of stored payloads
+    if len(sys.argv) > 1 and sys.argv[1] == '--migrate-payloads':
+        from database import normalize_stored_payloads
+        write(normalize_stored_payloads(vacuum='--vacuum' in sys.argv))
+        return
+
+    # Blob store maintenance: --gc-blobs drops unreferenced file bodies,
+    # --migrate-blobs moves inline file_data into the store, --blob-stats
+    # reports the dedup ratio
+    if len(sys.argv) > 1 and sys.argv[1] == '--gc-blobs':
+        from database import gc_blobs
+        write(gc_blobs(grace_seconds=float(arg_value('--grace', 60))))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--migrate-blobs':
+        from database import move_inline_files_to_blobs
+        write(move_inline_files_to_blobs())
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--blob-stats':
+        from database import blob_stats
+        write(blob_stats())
+        return
+    # Entries and counters of the read cache; only the shared SQLite store
+    # (CACHE_BACKEND=sqlite) outlives a single cli.py run
+    if len(sys.argv) > 1 and sys.argv[1] == '--cache-stats':
+        write(cache_stats())
+        return
+
+    # If run with --submit-stream, read a chunked NDJSON submission
+    if len(sys.argv) > 1 and sys.argv[1] == '--submit-stream':
+        out = submit_stream_command(sys.stdin.buffer)
+        write(out)
+        if 'error' in out:
+            sys.exit(2)
+        return
+
+    # If run with --get-file, write a stored file's bytes to stdout
+    # (nothing on stdout and exit status 2 if there is no such file)
+    if len(sys.argv) > 1 and sys.argv[1] == '--get-file':
+        try:
+            write_file_command(arg_value('--get-file'), arg_value('--offset', 0), arg_value('--length'),
+                               sys.stdout.buffer)
+        except (KeyError, OSError) as e:
+            print(f"cannot read file {arg_value('--get-file')}: {e}", file=sys.stderr)
+            sys.exit(2)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--file-info':
+        from database import get_experiment_file_info, experiment_file_checksum
+        info = get_experiment_file_info(int(arg_value('--file-info')))
+        if info and '--checksum' in sys.argv:
+            info['checksum'] = experiment_file_checksum(info['id'])
+        write(info)
+        return
+
+    # Payload builders: --builder ID prints one with its items, --builder-stats
+    # the mass/area totals of every builder, --module-usage how often each
+    # module is placed
+    if len(sys.argv) > 1 and sys.argv[1] == '--builder':
+        from database import get_payload_builder
+        builder = get_payload_builder(int(arg_value('--builder')))
+        write(to_dict(builder) if builder else None)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--builder-stats':
+        from database import payload_builder_totals, payload_mass_per_plan
+        write({'builders': payload_builder_totals(), 'plans': payload_mass_per_plan()})
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--module-usage':
+        from database import module_usage_counts
+        write(module_usage_counts())
+        return
+
+    # Change feed: --changes prints changes after --since SEQ (long-polling up
+    # to --wait seconds if there are none); --follow streams them as NDJSON
+    if len(sys.argv) > 1 and sys.argv[1] == '--changes':
+        args = {'since': arg_value('--since'), 'limit': arg_value('--limit'),
+                'experiment_id': arg_value('--experiment'), 'wait': arg_value('--wait')}
+        if '--follow' in sys.argv:
+            follow_command(args, sys.stdout)
+        else:
+            write(changes_command(args))
+        return
+
+    # Credits: --credits applies the debit/grant read from stdin, --balance ID
+    # prints a balance (with --history N entries), --reconcile-credits checks
+    # balances against the ledger (--repair records the differences)
+    if len(sys.argv) > 1 and sys.argv[1] == '--credits':
+        out = credits_command(load(sys.stdin))
+        write(out)
+        if 'error' in out:
+            sys.exit(2)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--balance':
+        write(balance_command({'user_id': arg_value('--balance'), 'account': arg_value('--account', 'subscription'),
+                               'history': arg_value('--history', 0)}))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--reconcile-credits':
+        from database import reconcile_credits
+        write(reconcile_credits(repair='--repair' in sys.argv))
+        return
+
+    # Experiment queue: --queue ACTION with the action's arguments as JSON on
+    # stdin (claim, heartbeat, complete, fail); requeue_expired and stats
+    # need no input
+    if len(sys.argv) > 1 and sys.argv[1] == '--queue':
+        action = arg_value('--queue')
+        out = queue_command(action, {} if action in ('requeue_expired', 'stats') else load(sys.stdin))
+        write(out)
+        if 'error' in out:
+            sys.exit(2)
+        return
+
+    # Reports: --report prints the dashboard aggregates (one dimension per
+    # time bucket with --by DIM [--bucket B], optionally for one --key;
+    # --since/--until dates limit the range), --rebuild-reports recomputes
+    # them from the experiments
+    if len(sys.argv) > 1 and sys.argv[1] == '--report':
+        try:
+            write(report_command({'by': arg_value('--by'), 'bucket': arg_value('--bucket'),
+                                  'key': arg_value('--key'), 'since': arg_value('--since'),
+                                  'until': arg_value('--until')}))
+        except ValueError as e:
+            write({"error": str(e)})
+            sys.exit(2)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--rebuild-reports':
+        from database import rebuild_reports
+        write(rebuild_reports())
+        return
+
+    # If run with --confirm, update the experiment's status
+    if len(sys.argv) > 1 and sys.argv[1] == '--confirm':
+        write(confirm_command(load(sys.stdin)))
+        return
+
+    out = submit_command(load(sys.stdin))
+    write(out)
+    if 'error' in out:
+        sys.exit(2)
 
 
 if __name__ == '__main__':
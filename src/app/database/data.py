@@ -1,12 +1,11 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import lru_cache
+from operator import attrgetter, itemgetter
 from typing import Optional, List
 
 # Static table for experiment/request statuses
 
-from dataclasses import dataclass, field
-from typing import Optional, List
-
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Status:
     id: int
     name: str
@@ -20,14 +19,14 @@ STATUS_OPTIONS = [
 ]
     
 
-@dataclass
+@dataclass(slots=True)
 class PlanOption:
     id: int
     name: str
     perks: str
 
 
-@dataclass
+@dataclass(slots=True)
 class SubscriptionPlan:
     id: Optional[int] = None
     credits_to_buy: int = 200
@@ -38,7 +37,7 @@ class SubscriptionPlan:
         if self.plan_option_id in [None, '', 0]:
             raise ValueError("plan_option_id is required if a plan option is selected")
 
-@dataclass
+@dataclass(slots=True)
 class UserSubscription:
     id: Optional[int] = None
     user_id: int = 0
@@ -46,7 +45,7 @@ class UserSubscription:
     credits_available: int = 0
 
 # Static table for module types
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ModuleType:
     id: int
     name: str
@@ -86,20 +85,10 @@ def get_modules_for_plan_option(plan_option_id) -> List[ModuleType]:
     """
     Return all ModuleType objects for the given subscription plan option id.
     Accepts string or int, including values like '1:1'.
+    Served from the precomputed index in catalog.py.
     """
-    # If plan_option_id is like '1:1', try to extract the first integer
-    if isinstance(plan_option_id, str):
-        if ':' in plan_option_id:
-            try:
-                plan_option_id = int(plan_option_id.split(':')[0])
-            except Exception:
-                plan_option_id = 1
-        else:
-            try:
-                plan_option_id = int(plan_option_id)
-            except Exception:
-                plan_option_id = 1
-    return [m for m in MODULE_TYPES if m.subscription_plan_option_id == plan_option_id]
+    from catalog import modules_for_plan_option
+    return modules_for_plan_option(plan_option_id)
 # Utility to clear all module types from the database
 def clear_moduletypes_db():
     import sqlite3
@@ -113,7 +102,7 @@ def clear_moduletypes_db():
     finally:
         conn.close()
 
-@dataclass
+@dataclass(slots=True)
 class PayloadBuilderData:
     id: Optional[int]
     name: str
@@ -123,7 +112,7 @@ class PayloadBuilderData:
     items: List['PayloadBuilderItemData']
     subscription_plan_id: int
 
-@dataclass
+@dataclass(slots=True)
 class PayloadBuilderItemData:
     id: Optional[int]
     payload_builder_id: Optional[int]
@@ -132,10 +121,9 @@ class PayloadBuilderItemData:
     y: int
     label: str
     massKg: float
-from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class UserData:
     username: str
     pwd_hash: bytes
@@ -145,7 +133,7 @@ class UserData:
     email: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ExperimentData:
     name: str
     description: str
@@ -158,12 +146,88 @@ class ExperimentData:
     ModulesNeeded: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ExperimentFileData:
     experiment_id: int
     filename: str
-    file_data: bytes
-
-
-
-
+    file_data: Optional[bytes]
+    # Key of the body in the content-addressed blob store, set once saved.
+    # A file streamed into the store up front has blob_sha256 and file_size
+    # set and no file_data.
+    blob_sha256: Optional[str] = None
+    file_size: Optional[int] = None
+
+
+@dataclass(slots=True)
+class ExperimentBundle:
+    # Everything submitted with one experiment, written in a single transaction
+    # by database.submit_experiment_bundle. The experiment_id of each file is
+    # filled in once the experiment row exists.
+    experiment: ExperimentData
+    files: List[ExperimentFileData] = field(default_factory=list)
+    user: Optional[UserData] = None
+    subscription_plan: Optional[SubscriptionPlan] = None
+    user_subscription: Optional[UserSubscription] = None
+    plan_option: Optional[PlanOption] = None
+    payload_builder: Optional[dict] = None
+
+
+# Models are slotted dataclasses (Status and ModuleType, being static, are
+# also frozen). The helpers below stand in for dataclasses.asdict and
+# cls(**dict(row)): they work positionally from per-class getters and
+# adapters built once, instead of recursing and copying on every call.
+
+@lru_cache(maxsize=None)
+def field_names(cls) -> tuple:
+    return tuple(f.name for f in fields(cls))
+
+
+@lru_cache(maxsize=None)
+def values_getter(cls, names: tuple = None):
+    # Function returning the given attributes of an instance (all fields by
+    # default) as a tuple, in that order
+    getter = attrgetter(*(names or field_names(cls)))
+    if len(names or field_names(cls)) == 1:
+        return lambda obj: (getter(obj),)
+    return getter
+
+
+def as_tuple(obj) -> tuple:
+    return values_getter(type(obj))(obj)
+
+
+def to_dict(obj) -> dict:
+    # Shallow asdict: field values are not copied, only lists of models
+    # (PayloadBuilderData.items) are converted in turn
+    out = dict(zip(field_names(type(obj)), values_getter(type(obj))(obj)))
+    for name, value in out.items():
+        if isinstance(value, list) and value and is_dataclass(value[0]):
+            out[name] = [to_dict(v) for v in value]
+    return out
+
+
+@lru_cache(maxsize=256)
+def row_adapter(cls, columns: tuple):
+    """
+    Function turning a row with the given column names (a sqlite3.Row or
+    tuple) into a cls instance. Columns that are not fields are ignored and
+    missing trailing fields keep their defaults.
+    """
+    names = field_names(cls)
+    positions = [columns.index(n) if n in columns else None for n in names]
+    while positions and positions[-1] is None:
+        positions.pop()
+    if None in positions:
+        pairs = [(n, p) for n, p in zip(names, positions) if p is not None]
+        return lambda row: cls(**{n: row[p] for n, p in pairs})
+    count = len(positions)
+    if positions == list(range(count)):
+        return lambda row: cls(*row[:count])
+    if count == 1:
+        return lambda row: cls(row[positions[0]])
+    getter = itemgetter(*positions)
+    return lambda row: cls(*getter(row))
+
+
+def cursor_columns(cursor) -> tuple:
+    return tuple(d[0] for d in cursor.description)
@@ -1,25 +1,155 @@
 
+import hashlib
+import mmap
+import os
 import sqlite3
-from dataclasses import dataclass, asdict, is_dataclass
-from data import UserData, ExperimentData, ExperimentFileData, PayloadBuilderData, PayloadBuilderItemData, SubscriptionPlan, UserSubscription, PlanOption
-from os import path
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import is_dataclass
+from functools import wraps
+from data import STATUS_OPTIONS, UserData, ExperimentData, ExperimentFileData, ExperimentBundle, PayloadBuilderData, PayloadBuilderItemData, SubscriptionPlan, UserSubscription, PlanOption
+from data import values_getter, to_dict, row_adapter, cursor_columns
+from pool import ConnectionPool
+from storage import StorageConfig, configure_connection, run_with_retry
+import migrations
+from migrations import add_column_if_not_exists, builder_item_values
+from blobstore import BlobStore
+import cache
+from cache import cached
+import serializer
+import reporting
+from os import path, environ
 BASE_DIR = path.dirname(path.abspath(__file__))
-db_name = path.join(BASE_DIR, 'site.db')
+# SITE_DB lets benchmarks and workers point at a different database file
+db_name = environ.get('SITE_DB') or path.join(BASE_DIR, 'site.db')
 
-def with_db_session(func):
-    def wrapper(*args, **kwargs): 
-        conn = sqlite3.connect(db_name)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        try: 
-            result = func(conn.cursor(), *args, **kwargs)
-            conn.commit()   
-            return result
-        except Exception as e: 
+# One pool per process and database file; a forked child (or a benchmark that
+# repoints db_name) gets a fresh pool instead of inheriting open connections
+_pool = None
+_storage = None
+_pool_lock = threading.Lock()
+_session = threading.local()
+
+
+def get_pool():
+    global _pool, _storage
+    with _pool_lock:
+        if _pool is None or _pool.db_path != db_name or _pool.pid != os.getpid():
+            if _pool is not None and _pool.pid == os.getpid():
+                _pool.close()
+            _storage = StorageConfig.from_env()
+            config = _storage
+            _pool = ConnectionPool(db_name, size=int(environ.get('DB_POOL_SIZE') or 5),
+                                   configure=lambda conn: configure_connection(conn, config))
+        return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+# Read cache for the lookups decorated with @cached below (see cache.py),
+# one per process and database file like the pool
+_cache = None
+
+
+def get_cache():
+    global _cache
+    key = (db_name, os.getpid())
+    with _pool_lock:
+        if _cache is None or _cache[0] != key:
+            _cache = (key, cache.from_env(db_name))
+        return _cache[1]
+
+
+def cache_stats():
+    store = get_cache()
+    if store is None:
+        return {'backend': 'off'}
+    return {'backend': type(store).__name__, 'ttl': store.ttl, 'maxsize': store.maxsize,
+            'entries': store.entries(), **store.stats.snapshot()}
+
+
+# Mark cached namespaces stale. Inside a transaction they are invalidated
+# once it commits, so no other reader can cache the old rows in between;
+# a rollback leaves the cache alone.
+def invalidate_cache(*namespaces):
+    if in_session():
+        _session.stale.update(namespaces)
+        return
+    store = get_cache()
+    if store is not None:
+        for namespace in namespaces:
+            store.invalidate(namespace)
+
+
+def in_session():
+    return getattr(_session, 'conn', None) is not None
+
+
+@contextmanager
+def db_session(immediate: bool = False):
+    # Run several CRUD calls on one pooled connection inside one transaction.
+    # Functions decorated with with_db_session join the active session of the
+    # calling thread; a nested session becomes a savepoint so a failure inside
+    # it only undoes its own writes. immediate takes the write lock up front
+    # (BEGIN IMMEDIATE), which read-then-write transactions should use so
+    # they wait on busy_timeout instead of failing on a stale snapshot.
+    conn = getattr(_session, 'conn', None)
+    if conn is not None:
+        _session.depth += 1
+        name = f"sp_{_session.depth}"
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        else:
+            conn.execute(f"RELEASE {name}")
+        finally:
+            _session.depth -= 1
+        return
+
+    with get_pool().connection() as conn:
+        _session.conn = conn
+        _session.depth = 0
+        _session.stale = set()
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield conn
+            conn.commit()
+        except BaseException:
             conn.rollback()
             raise
-        finally: 
-            conn.close()
+        finally:
+            _session.conn = None
+        if _session.stale:
+            invalidate_cache(*_session.stale)
+
+
+# Run fn(*args, **kwargs) as one transaction, retried with backoff when the
+# database is busy. Inside an active session it simply joins it (the outer
+# transaction is the one that gets retried).
+def run_transaction(fn, *args, immediate: bool = False, **kwargs):
+    def attempt():
+        with db_session(immediate=immediate):
+            return fn(*args, **kwargs)
+    if in_session():
+        return attempt()
+    pool = get_pool()
+    return run_with_retry(attempt, _storage, on_retry=pool.record_busy_retry)
+
+
+def with_db_session(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        def call():
+            return func(_session.conn.cursor(), *args, **kwargs)
+        return run_transaction(call)
     return wrapper
 
 # Update status and notes for an experiment
@@ -30,108 +160,107 @@ def update_experiment_confirmation(cur: sqlite3.Cursor, experiment_id: int, stat
         SET status = ?, notes = ?
         WHERE id = ?;
     """, (status, notes, experiment_id))
+    invalidate_cache('experiments')
     return cur.rowcount
 
-@with_db_session
-def drop_users_table(cur: sqlite3.Cursor):
-    cur.execute("DROP TABLE IF EXISTS users;")
-    return "users table dropped."
+# Statuses an experiment can be set to
+VALID_STATUSES = frozenset(s.name for s in STATUS_OPTIONS)
 
-def add_column_if_not_exists(cur: sqlite3.Cursor, table: str, column: str, type: str):
-    cur.execute(f"SELECT COUNT(*) FROM pragma_table_info('{table}') WHERE name='{column}'")
-    if cur.fetchone()[0] == 0:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type}")
+# Apply many confirmations at once. updates holds (experiment_id, status,
+# notes) tuples or dicts with those keys; notes None keeps the current
+# notes. Every status is checked against data.STATUS_OPTIONS first, then
+# all valid updates go through one executemany in a single transaction.
+# Returns a result per update, in input order.
+def bulk_update_experiment_confirmation(updates):
+    results, valid = [], []
+    for item in updates:
+        if isinstance(item, dict):
+            experiment_id, status, notes = item.get('experiment_id'), item.get('status'), item.get('notes')
+        else:
+            experiment_id, status, notes = (tuple(item) + (None, None, None))[:3]
+        try:
+            experiment_id = int(experiment_id)
+        except (TypeError, ValueError):
+            results.append({'experiment_id': experiment_id, 'ok': False, 'error': 'invalid experiment_id'})
+            continue
+        if status not in VALID_STATUSES:
+            results.append({'experiment_id': experiment_id, 'ok': False, 'error': f'invalid status: {status}'})
+            continue
+        results.append({'experiment_id': experiment_id, 'ok': True, 'status': status})
+        valid.append((status, notes, experiment_id))
 
-@with_db_session
-def create_table(cur: sqlite3.Cursor):
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        username TEXT UNIQUE, 
-        pwd_hash BLOB NOT NULL, 
-        api_key_hash BLOB NOT NULL, 
-        credits_available INTEGER DEFAULT 0,
-        subscriptionplan_id INTEGER DEFAULT 0
-    )""")
-    
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS experiments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        description TEXT,
-        status TEXT,
-        payload TEXT,
-        notes TEXT,
-        user_email TEXT,
-        created_at TEXT,
-        experimentType TEXT,
-        ModulesNeeded TEXT
-    )""")
-
-    # Add new columns if they don't exist
-    add_column_if_not_exists(cur, "experiments", "notes", "TEXT")
-    add_column_if_not_exists(cur, "experiments", "user_email", "TEXT")
-    add_column_if_not_exists(cur, "experiments", "created_at", "TEXT")
-    add_column_if_not_exists(cur, "experiments", "experimentType", "TEXT")
-    add_column_if_not_exists(cur, "experiments", "ModulesNeeded", "TEXT")
+    def apply():
+        conn = _session.conn
+        ids = sorted({v[2] for v in valid})
+        existing = {row[0] for row in conn.execute(
+            "SELECT id FROM experiments WHERE id IN (SELECT value FROM json_each(?))", (serializer.dumps(ids),))}
+        rows = [v for v in valid if v[2] in existing]
+        conn.executemany("UPDATE experiments SET status = ?, notes = COALESCE(?, notes) WHERE id = ?", rows)
+        if rows:
+            invalidate_cache('experiments')
+        return existing
+    existing = run_transaction(apply, immediate=True) if valid else set()
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS experiment_files (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        experiment_id INTEGER, 
-        filename TEXT, 
-        file_data BLOB, 
-        FOREIGN KEY(experiment_id) REFERENCES experiments(id)
-    );
-    """)
+    for result in results:
+        if result['ok'] and result['experiment_id'] not in existing:
+            result.update(ok=False, error='experiment not found')
+    updated = sum(1 for r in results if r['ok'])
+    return {'ok': updated == len(results), 'updated': updated, 'failed': len(results) - updated,
+            'results': results}
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS payload_builders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        bay_width INTEGER,
-        bay_height INTEGER,
-        items_json TEXT,
-        created_at TEXT
-    );
-    """)
+# Set status (and notes, unless None) on every experiment matching the
+# listing filters, e.g. all 'pending approval' experiments of one type.
+# At least one filter is required.
+@with_db_session
+def confirm_matching_experiments(cur: sqlite3.Cursor, status: str, notes: str = None, ids=None,
+                                 from_status=None, user_email=None, experimentType=None,
+                                 created_after: str = None, created_before: str = None):
+    if status not in VALID_STATUSES:
+        return {'ok': False, 'error': f'invalid status: {status}'}
+    where, params = _experiment_filters(status=from_status, user_email=user_email,
+                                        experimentType=experimentType, created_after=created_after,
+                                        created_before=created_before)
+    if ids is not None:
+        where.append("id IN (SELECT value FROM json_each(?))")
+        params.append(serializer.dumps([int(i) for i in ids]))
+    if not where:
+        return {'ok': False, 'error': 'a filter is required'}
+    cur.execute(f"UPDATE experiments SET status = ?, notes = COALESCE(?, notes) WHERE {' AND '.join(where)} RETURNING id",
+                [status, notes] + params)
+    updated = sorted(row[0] for row in cur.fetchall())
+    if updated:
+        invalidate_cache('experiments')
+    return {'ok': True, 'updated': len(updated), 'ids': updated}
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS modules (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE,
-        w INTEGER,
-        h INTEGER,
-        massKg REAL
-    );
-    """)
+@with_db_session
+def drop_users_table(cur: sqlite3.Cursor):
+    cur.execute("DROP TABLE IF EXISTS users;")
+    return "users table dropped."
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS subscription_plans (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        credits_to_buy INTEGER DEFAULT 0,
-        plan_option_id INTEGER DEFAULT 0
-    );
-    """)
+# Bring the schema up to date. After the first call in a process this is a
+# no-op; otherwise it costs one schema_version lookup unless migrations are
+# pending (see migrations.py).
+_schema_ready = set()
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS user_subscriptions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        plan_id INTEGER,
-        credits_available INTEGER DEFAULT 0,
-        FOREIGN KEY(user_id) REFERENCES users(id),
-        FOREIGN KEY(plan_id) REFERENCES subscription_plans(id)
-    );
-    """)
+def create_table():
+    key = (db_name, os.getpid())
+    if key in _schema_ready:
+        return
+    pool = get_pool()
+    with pool.connection() as conn:
+        run_with_retry(lambda: migrations.migrate(conn), _storage, on_retry=pool.record_busy_retry)
+    _schema_ready.add(key)
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS plan_options (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        perks TEXT
-    );
-    """)
+def migration_status():
+    with get_pool().connection() as conn:
+        return migrations.status(conn)
+
+def apply_migrations(target: int = None):
+    pool = get_pool()
+    with pool.connection() as conn:
+        applied = run_with_retry(lambda: migrations.migrate(conn, target), _storage,
+                                 on_retry=pool.record_busy_retry)
+        return {'applied': applied, 'version': migrations.current_version(conn)}
 
 @with_db_session
 def fetch_table_data(cur: sqlite3.Cursor, table: str):
@@ -145,185 +274,1192 @@ def fetch_table_data(cur: sqlite3.Cursor, table: str):
 @with_db_session
 def create_subscription_plan(cur: sqlite3.Cursor, plan: SubscriptionPlan):
     cur.execute("INSERT INTO subscription_plans (credits_to_buy, plan_option_id) VALUES (?, ?)", (plan.credits_to_buy, plan.plan_option_id))
+    invalidate_cache('subscription_plans')
     return cur.lastrowid
 
+@cached('subscription_plans', get_cache, bypass=in_session)
 @with_db_session
 def get_subscription_plan(cur: sqlite3.Cursor, plan_id: int):
     cur.execute("SELECT * FROM subscription_plans WHERE id = ?", (plan_id,))
     row = cur.fetchone()
-    return SubscriptionPlan(**row) if row else None
+    return row_adapter(SubscriptionPlan, cursor_columns(cur))(row) if row else None
 
 @with_db_session
 def update_subscription_plan(cur: sqlite3.Cursor, plan: SubscriptionPlan):
     cur.execute("UPDATE subscription_plans SET credits_to_buy=?, plan_option_id=? WHERE id=?", (plan.credits_to_buy, plan.plan_option_id, plan.id))
+    invalidate_cache('subscription_plans')
     return cur.rowcount
 
 @with_db_session
 def delete_subscription_plan(cur: sqlite3.Cursor, plan_id: int):
     cur.execute("DELETE FROM subscription_plans WHERE id=?", (plan_id,))
+    invalidate_cache('subscription_plans')
     return cur.rowcount
 
 # CRUD for user subscriptions
 @with_db_session
 def create_user_subscription(cur: sqlite3.Cursor, sub: UserSubscription):
     cur.execute("INSERT INTO user_subscriptions (user_id, plan_id, credits_available) VALUES (?, ?, ?)", (sub.user_id, sub.plan_id, sub.credits_available))
-    return cur.lastrowid
+    sub_id = cur.lastrowid
+    if sub.credits_available:
+        _ledger_entry(cur, 'subscription', sub_id, sub.credits_available, sub.credits_available, 'opening balance')
+    invalidate_cache('user_subscriptions')
+    return sub_id
 
+@cached('user_subscriptions', get_cache, bypass=in_session)
 @with_db_session
 def get_user_subscription(cur: sqlite3.Cursor, user_id: int):
     cur.execute("SELECT * FROM user_subscriptions WHERE user_id = ?", (user_id,))
     row = cur.fetchone()
-    return UserSubscription(**row) if row else None
+    return row_adapter(UserSubscription, cursor_columns(cur))(row) if row else None
 
 @with_db_session
 def update_user_subscription(cur: sqlite3.Cursor, sub: UserSubscription):
+    # Setting the balance outright is recorded as an adjustment so the
+    # ledger still adds up; use apply_credits for debits and grants
+    cur.execute("""
+        INSERT INTO credit_ledger (account, account_id, delta, balance_after, reason)
+        SELECT 'subscription', id, ? - COALESCE(credits_available, 0), ?, 'adjustment'
+        FROM user_subscriptions WHERE user_id = ? AND credits_available IS NOT ?
+    """, (sub.credits_available, sub.credits_available, sub.user_id, sub.credits_available))
     cur.execute("UPDATE user_subscriptions SET plan_id=?, credits_available=? WHERE user_id=?", (sub.plan_id, sub.credits_available, sub.user_id))
+    invalidate_cache('user_subscriptions')
     return cur.rowcount
 
 @with_db_session
 def delete_user_subscription(cur: sqlite3.Cursor, user_id: int):
     cur.execute("DELETE FROM user_subscriptions WHERE user_id=?", (user_id,))
+    invalidate_cache('user_subscriptions')
     return cur.rowcount
 
 # CRUD for plan options
 @with_db_session
 def create_plan_option(cur: sqlite3.Cursor, option: PlanOption):
     cur.execute("INSERT INTO plan_options (name, perks) VALUES (?, ?)", (option.name, option.perks))
+    invalidate_cache('plan_options')
     return cur.lastrowid
 
+@cached('plan_options', get_cache, bypass=in_session)
 @with_db_session
 def get_plan_option(cur: sqlite3.Cursor, option_id: int):
     cur.execute("SELECT * FROM plan_options WHERE id = ?", (option_id,))
     row = cur.fetchone()
-    return PlanOption(**row) if row else None
+    return row_adapter(PlanOption, cursor_columns(cur))(row) if row else None
 
 @with_db_session
 def update_plan_option(cur: sqlite3.Cursor, option: PlanOption):
     cur.execute("UPDATE plan_options SET name=?, perks=? WHERE id=?", (option.name, option.perks, option.id))
+    invalidate_cache('plan_options')
     return cur.rowcount
 
 @with_db_session
 def delete_plan_option(cur: sqlite3.Cursor, option_id: int):
     cur.execute("DELETE FROM plan_options WHERE id=?", (option_id,))
+    invalidate_cache('plan_options')
     return cur.rowcount
 
 
+# Credit ledger (see migration 7). A balance only changes through
+# apply_credits: one conditional UPDATE that cannot take it below zero,
+# plus the ledger row, in a single write transaction. A retried request
+# carrying the same idempotency_key gets the original result back instead
+# of being applied twice.
+CREDIT_ACCOUNTS = {
+    # account -> (table, SQL picking the row for a user id)
+    'user': ('users', "?"),
+    'subscription': ('user_subscriptions',
+                     "(SELECT id FROM user_subscriptions WHERE user_id = ? ORDER BY id LIMIT 1)"),
+}
+
+def _ledger_entry(cur: sqlite3.Cursor, account: str, account_id: int, delta: int, balance_after: int,
+                  reason: str, experiment_id: int = None, idempotency_key: str = None):
+    cur.execute("""
+        INSERT INTO credit_ledger
+        (account, account_id, delta, balance_after, reason, experiment_id, idempotency_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (account, account_id, delta, balance_after, reason, experiment_id, idempotency_key))
+    return cur.lastrowid
+
+def _credit_account(account: str):
+    if account not in CREDIT_ACCOUNTS:
+        raise ValueError(f"account must be one of {', '.join(CREDIT_ACCOUNTS)}")
+    return CREDIT_ACCOUNTS[account]
+
+def apply_credits(user_id: int, delta: int, reason: str = None, idempotency_key: str = None,
+                  account: str = 'subscription', experiment_id: int = None):
+    table, row_id = _credit_account(account)
+    delta = int(delta)
+
+    def apply():
+        cur = _session.conn.cursor()
+        if idempotency_key is not None:
+            cur.execute("SELECT id, account, account_id, delta, balance_after FROM credit_ledger WHERE idempotency_key = ?",
+                        (idempotency_key,))
+            done = cur.fetchone()
+            if done is not None:
+                # A replay must be the same change to the same account row;
+                # anything else would report another user's balance
+                account_id = cur.execute(f"SELECT {row_id}", (user_id,)).fetchone()[0]
+                if done['account'] != account or done['account_id'] != account_id or done['delta'] != delta:
+                    return {'ok': False, 'error': 'idempotency key already used for a different request'}
+                return {'ok': True, 'balance': done['balance_after'], 'entry_id': done['id'], 'replayed': True}
+        cur.execute(f"""
+            UPDATE {table} SET credits_available = COALESCE(credits_available, 0) + ?
+            WHERE id = {row_id} AND COALESCE(credits_available, 0) + ? >= 0
+            RETURNING id, credits_available
+        """, (delta, user_id, delta))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(f"SELECT credits_available FROM {table} WHERE id = {row_id}", (user_id,))
+            current = cur.fetchone()
+            if current is None:
+                return {'ok': False, 'error': f'no {account} account for user {user_id}'}
+            return {'ok': False, 'error': 'insufficient credits', 'balance': current[0] or 0}
+        entry_id = _ledger_entry(cur, account, row['id'], delta, row['credits_available'], reason,
+                                 experiment_id, idempotency_key)
+        if account == 'subscription':
+            invalidate_cache('user_subscriptions')
+        return {'ok': True, 'balance': row['credits_available'], 'entry_id': entry_id, 'replayed': False}
+    return run_transaction(apply, immediate=True)
+
+def debit_credits(user_id: int, amount: int, reason: str = 'debit', idempotency_key: str = None,
+                  account: str = 'subscription', experiment_id: int = None):
+    if int(amount) <= 0:
+        raise ValueError("amount must be positive")
+    return apply_credits(user_id, -int(amount), reason, idempotency_key, account, experiment_id)
+
+def grant_credits(user_id: int, amount: int, reason: str = 'grant', idempotency_key: str = None,
+                  account: str = 'subscription'):
+    if int(amount) <= 0:
+        raise ValueError("amount must be positive")
+    return apply_credits(user_id, int(amount), reason, idempotency_key, account)
+
+@with_db_session
+def credit_balance(cur: sqlite3.Cursor, user_id: int, account: str = 'subscription', history: int = 0):
+    table, row_id = _credit_account(account)
+    cur.execute(f"SELECT id, credits_available FROM {table} WHERE id = {row_id}", (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    out = {'user_id': user_id, 'account': account, 'balance': row['credits_available'] or 0}
+    if history:
+        cur.execute("""
+            SELECT id, delta, balance_after, reason, experiment_id, idempotency_key, created_at
+            FROM credit_ledger WHERE account = ? AND account_id = ? ORDER BY id DESC LIMIT ?
+        """, (account, row['id'], int(history)))
+        out['history'] = [dict(r) for r in cur.fetchall()]
+    return out
+
+# Check that every balance equals the sum of its ledger entries, batch_size
+# accounts per transaction, and report the ones that do not (or are
+# negative). Balances changed behind the ledger's back (manual SQL, old
+# scripts) are taken as the truth: with repair=True a 'reconciliation'
+# entry is added to make the ledger match them.
+def reconcile_credits(batch_size: int = 500, repair: bool = False):
+    report = {'accounts_checked': 0, 'mismatched': [], 'negative': [], 'repaired': 0}
+    for account, (table, _) in CREDIT_ACCOUNTS.items():
+        last_id = 0
+        while True:
+            with db_session(immediate=repair) as conn:
+                rows = conn.execute(f"""
+                    SELECT a.id, COALESCE(a.credits_available, 0) AS balance,
+                           COALESCE((SELECT SUM(delta) FROM credit_ledger l
+                                     WHERE l.account = ? AND l.account_id = a.id), 0) AS ledger
+                    FROM {table} a WHERE a.id > ? ORDER BY a.id LIMIT ?
+                """, (account, last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                report['accounts_checked'] += len(rows)
+                bad = [row for row in rows if row['balance'] != row['ledger']]
+                for row in bad:
+                    report['mismatched'].append({'account': account, 'account_id': row['id'],
+                                                 'balance': row['balance'], 'ledger_total': row['ledger']})
+                report['negative'].extend({'account': account, 'account_id': row['id'], 'balance': row['balance']}
+                                          for row in rows if row['balance'] < 0)
+                if repair and bad:
+                    conn.executemany("""
+                        INSERT INTO credit_ledger (account, account_id, delta, balance_after, reason)
+                        VALUES (?, ?, ?, ?, 'reconciliation')
+                    """, [(account, row['id'], row['balance'] - row['ledger'], row['balance']) for row in bad])
+                    report['repaired'] += len(bad)
+                last_id = rows[-1]['id']
+    report['ok'] = not report['mismatched'] and not report['negative']
+    return report
+
+# Column values of the users / experiments INSERTs, read off the model in
+# one attrgetter call
+USER_INSERT_VALUES = values_getter(UserData, ('username', 'pwd_hash', 'api_key_hash',
+                                              'credits_available', 'subscriptionplan_id'))
+EXPERIMENT_INSERT_VALUES = values_getter(ExperimentData, ('name', 'description', 'status', 'payload', 'notes',
+                                                          'user_email', 'created_at', 'experimentType',
+                                                          'ModulesNeeded'))
+
 @with_db_session
 def save_user_data(cur: sqlite3.Cursor, userdata: UserData):
     if not is_dataclass(userdata): 
         return "Invalid Data"
-    cur.execute(f"""
+    cur.execute("""
         INSERT INTO users
         (username, pwd_hash, api_key_hash, credits_available, subscriptionplan_id)
         VALUES
-        (:username, :pwd_hash, :api_key_hash, :credits_available, :subscriptionplan_id)
+        (?, ?, ?, ?, ?)
         ON CONFLICT (username) DO NOTHING;
-    """, asdict(userdata))
+    """, USER_INSERT_VALUES(userdata))
+    if cur.rowcount == 1 and userdata.credits_available:
+        _ledger_entry(cur, 'user', cur.lastrowid, userdata.credits_available, userdata.credits_available,
+                      'opening balance')
     
 @with_db_session
 def save_experiment(cur: sqlite3.Cursor, experimentdata: ExperimentData):
     if not is_dataclass(experimentdata): 
         return "Invalid Data"
+    data = EXPERIMENT_INSERT_VALUES(experimentdata)
     try:
-        data = asdict(experimentdata)
         cur.execute("""
             INSERT INTO experiments
             (name, description, status, payload, notes, user_email, created_at, experimentType, ModulesNeeded)
             VALUES
-            (:name, :description, :status, :payload, :notes, :user_email, :created_at, :experimentType, :ModulesNeeded)
+            (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, data)
+        invalidate_cache('experiments')
         return cur.lastrowid
     except Exception as e:
-        print(f"Error saving experiment: {str(e)}")
-        print(f"Data being saved: {data}")
+        # stdout carries the cli's JSON responses; diagnostics go to stderr
+        print(f"Error saving experiment {experimentdata.name!r}: {e}", file=sys.stderr)
         raise
 
+def get_blob_store():
+    # Blobs sit next to the database file unless BLOB_DIR says otherwise
+    return BlobStore(environ.get('BLOB_DIR') or path.join(path.dirname(path.abspath(db_name)), 'blobs'))
+
+# Write file bodies to the blob store (unless already streamed there) and
+# make sure each has a blobs row. The reference itself is counted by the
+# trigger when the experiment_files row goes in.
+def store_blobs(cur: sqlite3.Cursor, experimentfiles: list):
+    store = get_blob_store()
+    for f in experimentfiles:
+        if f.blob_sha256 is None:
+            data = f.file_data or b''
+            f.blob_sha256 = store.put(data)
+            f.file_size = len(data)
+    cur.executemany("""
+        INSERT INTO blobs (sha256, size, refcount, created_at)
+        VALUES (?, ?, 0, datetime('now'))
+        ON CONFLICT (sha256) DO NOTHING;
+    """, [(f.blob_sha256, f.file_size) for f in experimentfiles])
+
+# Stream a file body into the blob store chunk by chunk, before any database
+# work. The result can be passed to save_experiment_file(s) like any other
+# ExperimentFileData.
+def store_file_stream(filename: str, chunks):
+    sha256, size = get_blob_store().put_chunks(chunks)
+    return ExperimentFileData(experiment_id=0, filename=filename, file_data=None,
+                              blob_sha256=sha256, file_size=size)
+
 @with_db_session
 def save_experiment_file(cur: sqlite3.Cursor, experimentfile: ExperimentFileData):
     if not is_dataclass(experimentfile): 
         return "Invalid Data"
+    store_blobs(cur, [experimentfile])
     cur.execute(f"""
         INSERT INTO experiment_files
-        (experiment_id, filename, file_data)
+        (experiment_id, filename, file_size, blob_sha256)
         VALUES
-        (:experiment_id, :filename, :file_data);
+        (:experiment_id, :filename, :file_size, :blob_sha256);
 
-    """, asdict(experimentfile)
+    """, {'experiment_id': experimentfile.experiment_id, 'filename': experimentfile.filename,
+          'file_size': experimentfile.file_size, 'blob_sha256': experimentfile.blob_sha256}
     )
+    invalidate_cache('experiments')
+    return cur.lastrowid
+
+# Insert many files with one executemany
+@with_db_session
+def save_experiment_files(cur: sqlite3.Cursor, experimentfiles: list):
+    store_blobs(cur, experimentfiles)
+    cur.executemany("""
+        INSERT INTO experiment_files
+        (experiment_id, filename, file_size, blob_sha256)
+        VALUES
+        (?, ?, ?, ?);
+    """, [(f.experiment_id, f.filename, f.file_size, f.blob_sha256) for f in experimentfiles])
+    invalidate_cache('experiments')
+    return len(experimentfiles)
+
+# Load one stored file, whether its body is in the blob store or (for rows
+# written before the store existed) inline in file_data
+@with_db_session
+def get_experiment_file(cur: sqlite3.Cursor, file_id: int):
+    cur.execute("SELECT experiment_id, filename, file_data, blob_sha256 FROM experiment_files WHERE id = ?", (file_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    data = get_blob_store().read(row['blob_sha256']) if row['blob_sha256'] else (row['file_data'] or b'')
+    return ExperimentFileData(experiment_id=row['experiment_id'], filename=row['filename'],
+                              file_data=data, blob_sha256=row['blob_sha256'], file_size=len(data))
 
-import json
-# Save a payload builder row and modules
 @with_db_session
-def save_payload_builder(cur: sqlite3.Cursor, builder: dict, modules: list = None):
+def get_experiment_file_info(cur: sqlite3.Cursor, file_id: int):
+    cur.execute("""
+        SELECT id, experiment_id, filename, file_size AS size, blob_sha256 AS sha256
+        FROM experiment_files WHERE id = ?""", (file_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+# Yield the bytes of a stored file from offset, length bytes long (to the
+# end when None), at most chunk_size bytes at a time. Blob-store files are
+# read with seek/read; inline rows through SQLite's incremental BLOB I/O.
+def iter_experiment_file(file_id: int, offset: int = 0, length: int = None, chunk_size: int = FILE_CHUNK_SIZE):
+    info = get_experiment_file_info(file_id)
+    if info is None:
+        raise KeyError(f"no experiment file with id {file_id}")
+    size = info['size'] or 0
+    offset = max(0, min(int(offset), size))
+    end = size if length is None else min(size, offset + max(0, int(length)))
+    if end <= offset:
+        return
+    if info['sha256']:
+        with get_blob_store().open(info['sha256']) as f:
+            f.seek(offset)
+            pos = offset
+            while pos < end:
+                chunk = f.read(min(chunk_size, end - pos))
+                if not chunk:
+                    break
+                pos += len(chunk)
+                yield chunk
+        return
+    with get_pool().connection() as conn:
+        with conn.blobopen('experiment_files', 'file_data', file_id, readonly=True) as blob:
+            blob.seek(offset)
+            pos = offset
+            while pos < end:
+                chunk = blob.read(min(chunk_size, end - pos))
+                if not chunk:
+                    break
+                pos += len(chunk)
+                yield chunk
+
+def read_experiment_file(file_id: int, offset: int = 0, length: int = None):
+    return b''.join(iter_experiment_file(file_id, offset, length))
+
+# Zero-copy access to a stored file: yields a read-only memoryview over the
+# blob file mapped into memory, so hashing, exporting or serving a range of
+# a very large file never copies it into a Python bytes object. Inline rows
+# from before the blob store are fetched once into memory instead. Do not
+# keep the view (or slices of it) past the with block.
+@contextmanager
+def experiment_file_view(file_id: int):
+    info = get_experiment_file_info(file_id)
+    if info is None:
+        raise KeyError(f"no experiment file with id {file_id}")
+    if not info['sha256']:
+        file = get_experiment_file(file_id)
+        yield memoryview(file.file_data)
+        return
+    with get_blob_store().open(info['sha256']) as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap cannot map an empty file
+            yield memoryview(b'')
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+def experiment_file_checksum(file_id: int, algorithm: str = 'sha256', chunk_size: int = 4 * 1024 * 1024):
+    digest = hashlib.new(algorithm)
+    with experiment_file_view(file_id) as view:
+        for i in range(0, len(view), chunk_size):
+            digest.update(view[i:i + chunk_size])
+    return digest.hexdigest()
+
+# Write a stored file (or a byte range of it) to a binary stream straight
+# from the mapped blob
+def write_experiment_file(file_id: int, out, offset: int = 0, length: int = None,
+                          chunk_size: int = 4 * 1024 * 1024):
+    with experiment_file_view(file_id) as view:
+        offset = max(0, min(int(offset), len(view)))
+        end = len(view) if length is None else min(len(view), offset + max(0, int(length)))
+        for i in range(offset, end, chunk_size):
+            out.write(view[i:min(i + chunk_size, end)])
+        return end - offset
+
+def export_experiment_file(file_id: int, dest_path: str):
+    with open(dest_path, 'wb') as out:
+        return write_experiment_file(file_id, out)
+
+# Move file bodies still stored inline in experiment_files into the blob store
+def move_inline_files_to_blobs(batch_size: int = 100):
+    moved = 0
+    while True:
+        with db_session() as conn:
+            rows = conn.execute("""
+                SELECT id, file_data FROM experiment_files
+                WHERE blob_sha256 IS NULL LIMIT ?""", (batch_size,)).fetchall()
+            if not rows:
+                break
+            files = [ExperimentFileData(experiment_id=0, filename=None, file_data=row['file_data'])
+                     for row in rows]
+            store_blobs(conn.cursor(), files)
+            conn.executemany(
+                "UPDATE experiment_files SET blob_sha256 = ?, file_size = ?, file_data = NULL WHERE id = ?",
+                [(f.blob_sha256, f.file_size, row['id']) for f, row in zip(files, rows)])
+            invalidate_cache('experiments')
+            moved += len(rows)
+    return {'files_moved': moved}
+
+# Drop blobs nothing references any more. Rows with a zero reference count
+# are deleted first; then blob files without a row are removed from disk,
+# including ones left behind by rolled-back submissions. Files touched
+# within grace_seconds are kept so a submission that is reusing a blob right
+# now is not raced. Pass shas to only look at those blobs instead of walking
+# the whole store.
+def gc_blobs(grace_seconds: float = 60.0, shas=None):
+    store = get_blob_store()
+    with db_session() as conn:
+        if shas is None:
+            dead = [row[0] for row in conn.execute("SELECT sha256 FROM blobs WHERE refcount <= 0")]
+        else:
+            dead = list(shas)
+        rows_deleted = conn.executemany("DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0",
+                                        [(sha,) for sha in dead]).rowcount
+    report = {'blob_rows_deleted': max(rows_deleted, 0), 'files_deleted': 0, 'bytes_freed': 0}
+    if getattr(_session, 'conn', None) is not None:
+        # Still inside a caller's transaction; a later run removes the files
+        return report
+
+    if shas is None:
+        candidates = list(store.iter_blobs(older_than=grace_seconds))
+    else:
+        candidates = [(sha, store.path_for(sha)) for sha in shas]
+    cutoff = time.time() - grace_seconds
+    for i in range(0, len(candidates), 500):
+        batch = candidates[i:i + 500]
+        names = [name for name, _ in batch]
+        with db_session() as conn:
+            live = {row[0] for row in conn.execute(
+                f"SELECT sha256 FROM blobs WHERE sha256 IN ({','.join('?' * len(names))})", names)}
+        for name, full in batch:
+            if name in live:
+                continue
+            try:
+                if os.path.getmtime(full) > cutoff:
+                    continue
+                size = os.path.getsize(full)
+                os.unlink(full)
+            except FileNotFoundError:
+                continue
+            report['files_deleted'] += 1
+            report['bytes_freed'] += size
+    return report
+
+# Remove the given blobs if nothing references them, without the usual grace
+# period: only a blob touched after since (by a submission reusing it right
+# now) is kept. For blobs the caller itself just orphaned.
+def discard_blobs(shas, since: float):
+    shas = list(shas)
+    if not shas:
+        return None
+    return gc_blobs(grace_seconds=max(0.0, time.time() - since), shas=shas)
+
+# Delete an experiment with its files; blobs it was the last user of go too
+def delete_experiment(experiment_id: int):
+    started = time.time()
+
+    def delete():
+        conn = _session.conn
+        shas = [row[0] for row in conn.execute(
+            "SELECT DISTINCT blob_sha256 FROM experiment_files WHERE experiment_id = ? AND blob_sha256 IS NOT NULL",
+            (experiment_id,))]
+        conn.execute("DELETE FROM experiment_files WHERE experiment_id = ?", (experiment_id,))
+        invalidate_cache('experiments')
+        deleted = conn.execute("DELETE FROM experiments WHERE id = ?", (experiment_id,)).rowcount
+        # The blobs whose last reference this transaction dropped
+        orphaned = [row[0] for row in conn.execute(
+            "SELECT sha256 FROM blobs WHERE sha256 IN (SELECT value FROM json_each(?)) AND refcount <= 0",
+            (serializer.dumps(shas),))]
+        return orphaned, deleted
+    orphaned, deleted = run_transaction(delete, immediate=True)
+    discard_blobs(orphaned, started)
+    return deleted
+
+# Logical vs stored bytes of the blob store
+@with_db_session
+def blob_stats(cur: sqlite3.Cursor):
+    cur.execute("""
+        SELECT COUNT(*) AS files, COALESCE(SUM(file_size), 0) AS logical_bytes
+        FROM experiment_files WHERE blob_sha256 IS NOT NULL""")
+    files = cur.fetchone()
+    cur.execute("""
+        SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS stored_bytes,
+               COALESCE(SUM(refcount <= 0), 0) AS unreferenced
+        FROM blobs""")
+    blobs = cur.fetchone()
+    stored = blobs['stored_bytes']
+    return {
+        'files': files['files'],
+        'blobs': blobs['blobs'],
+        'unreferenced_blobs': blobs['unreferenced'],
+        'logical_bytes': files['logical_bytes'],
+        'stored_bytes': stored,
+        'bytes_saved': files['logical_bytes'] - stored,
+        'dedup_ratio': round(files['logical_bytes'] / stored, 3) if stored else 1.0,
+    }
+
+# Save an experiment together with its files, user, plan and payload builder.
+# Everything is written in one transaction (one commit, retried as a whole if
+# the database is busy), so a failure part way through leaves nothing behind.
+def submit_experiment_bundle(bundle: ExperimentBundle):
+    return run_transaction(_submit_experiment_bundle, bundle, immediate=True)
+
+def _submit_experiment_bundle(bundle: ExperimentBundle):
+    if bundle.user is not None:
+        save_user_data(bundle.user)
+    plan_id = None
+    if bundle.subscription_plan is not None:
+        plan_id = create_subscription_plan(bundle.subscription_plan)
+    if bundle.user_subscription is not None:
+        create_user_subscription(bundle.user_subscription)
+    if bundle.plan_option is not None:
+        create_plan_option(bundle.plan_option)
+    builder_id = None
+    if bundle.payload_builder is not None:
+        builder = bundle.payload_builder
+        if plan_id is not None and builder.get('subscription_plan_id') is None:
+            builder = {**builder, 'subscription_plan_id': plan_id}
+        builder_id = save_payload_builder(builder)
+    exp_id = save_experiment(bundle.experiment)
+    for f in bundle.files:
+        f.experiment_id = exp_id
+    files_saved = save_experiment_files(bundle.files) if bundle.files else 0
+    return {'experiment_id': exp_id, 'payload_builder_id': builder_id, 'files_saved': files_saved}
+
+# Save a payload builder and its items. builder is a dict (name, bay_width,
+# bay_height, created_at, items, optionally subscription_plan_id) or a
+# PayloadBuilderData; the items go into payload_builder_items with one
+# executemany in the same transaction as the builder row.
+@with_db_session
+def save_payload_builder(cur: sqlite3.Cursor, builder, modules: list = None):
+    from catalog import get_catalog
+    if is_dataclass(builder):
+        builder = to_dict(builder)
     cur.execute("""
         INSERT INTO payload_builders
-        (name, bay_width, bay_height, items_json, created_at)
+        (name, bay_width, bay_height, created_at, subscription_plan_id)
         VALUES
-        (:name, :bay_width, :bay_height, :items_json, :created_at);
-    """, builder)
+        (?, ?, ?, ?, ?);
+    """, (builder.get('name'), builder.get('bay_width'), builder.get('bay_height'),
+          builder.get('created_at'), builder.get('subscription_plan_id')))
     builder_id = cur.lastrowid
+    items = builder.get('items') or []
+    if items:
+        catalog = get_catalog()
+        cur.executemany("""
+            INSERT INTO payload_builder_items
+            (payload_builder_id, module_id, x, y, w, h, label, massKg)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [builder_item_values(builder_id, item, catalog) for item in items])
     # No dynamic module addition; modules are static
     return builder_id
 
-# Get a payload builder by id
+PAYLOAD_BUILDER_SELECT = """
+    SELECT b.id, b.name, b.bay_width, b.bay_height, b.created_at, b.subscription_plan_id,
+           i.id AS item_id, i.module_id, i.x, i.y, i.label, i.massKg
+    FROM payload_builders b
+    LEFT JOIN payload_builder_items i ON i.payload_builder_id = b.id
+"""
+
+# Rebuild PayloadBuilderData objects from joined builder/item rows, which
+# must be ordered by builder
+def _payload_builders_from_rows(rows):
+    builders = []
+    for row in rows:
+        if not builders or builders[-1].id != row['id']:
+            builders.append(PayloadBuilderData(
+                id=row['id'], name=row['name'], bay_width=row['bay_width'],
+                bay_height=row['bay_height'], created_at=row['created_at'], items=[],
+                subscription_plan_id=row['subscription_plan_id']))
+        if row['item_id'] is not None:
+            builders[-1].items.append(PayloadBuilderItemData(
+                id=row['item_id'], payload_builder_id=row['id'], module_id=row['module_id'],
+                x=row['x'], y=row['y'], label=row['label'], massKg=row['massKg']))
+    return builders
+
+# Get a payload builder with its items by id, in one query
 @with_db_session
 def get_payload_builder(cur: sqlite3.Cursor, builder_id: int):
-    cur.execute("SELECT id, name, bay_width, bay_height, items_json, created_at FROM payload_builders WHERE id = ?", (builder_id,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+    cur.execute(PAYLOAD_BUILDER_SELECT + " WHERE b.id = ? ORDER BY i.id", (builder_id,))
+    builders = _payload_builders_from_rows(cur.fetchall())
+    return builders[0] if builders else None
 
-# Delete a payload builder by id
+# Builders of a subscription plan (or every builder), oldest first
+@with_db_session
+def get_payload_builders(cur: sqlite3.Cursor, subscription_plan_id: int = None):
+    if subscription_plan_id is None:
+        cur.execute(PAYLOAD_BUILDER_SELECT + " ORDER BY b.id, i.id")
+    else:
+        cur.execute(PAYLOAD_BUILDER_SELECT + " WHERE b.subscription_plan_id = ? ORDER BY b.id, i.id",
+                    (subscription_plan_id,))
+    return _payload_builders_from_rows(cur.fetchall())
+
+# Delete a payload builder by id (its items go with it)
 @with_db_session
 def delete_payload_builder(cur: sqlite3.Cursor, builder_id: int):
+    cur.execute("DELETE FROM payload_builder_items WHERE payload_builder_id = ?", (builder_id,))
     cur.execute("DELETE FROM payload_builders WHERE id = ?", (builder_id,))
     return cur.rowcount
 
+# Item count, mass and occupied area of each builder (or just builder_id)
+@with_db_session
+def payload_builder_totals(cur: sqlite3.Cursor, builder_id: int = None):
+    sql = """
+        SELECT b.id, b.name, b.subscription_plan_id, b.bay_width * b.bay_height AS bay_area,
+               COUNT(i.id) AS item_count,
+               COALESCE(SUM(i.massKg), 0) AS total_mass_kg,
+               COALESCE(SUM(i.w * i.h), 0) AS used_area
+        FROM payload_builders b
+        LEFT JOIN payload_builder_items i ON i.payload_builder_id = b.id
+    """
+    params = ()
+    if builder_id is not None:
+        sql += " WHERE b.id = ?"
+        params = (builder_id,)
+    cur.execute(sql + " GROUP BY b.id ORDER BY b.id", params)
+    totals = []
+    for row in cur.fetchall():
+        total = dict(row)
+        total['total_mass_kg'] = round(total['total_mass_kg'], 3)
+        total['utilization'] = round(total['used_area'] / total['bay_area'], 4) if total['bay_area'] else 0.0
+        totals.append(total)
+    return totals
+
+# How often each module is placed, and in how many builders
+@with_db_session
+def module_usage_counts(cur: sqlite3.Cursor):
+    cur.execute("""
+        SELECT module_id, COUNT(*) AS placements,
+               COUNT(DISTINCT payload_builder_id) AS builders,
+               COALESCE(SUM(massKg), 0) AS total_mass_kg
+        FROM payload_builder_items
+        GROUP BY module_id ORDER BY placements DESC, module_id
+    """)
+    return [dict(row) for row in cur.fetchall()]
+
+# Ids of the builders that place a given module
+@with_db_session
+def builders_using_module(cur: sqlite3.Cursor, module_id: int):
+    cur.execute("SELECT DISTINCT payload_builder_id FROM payload_builder_items WHERE module_id = ? ORDER BY payload_builder_id",
+                (module_id,))
+    return [row[0] for row in cur.fetchall()]
+
+# Builder count and total placed mass per subscription plan
+@with_db_session
+def payload_mass_per_plan(cur: sqlite3.Cursor):
+    cur.execute("""
+        SELECT b.subscription_plan_id, COUNT(DISTINCT b.id) AS builders,
+               COALESCE(SUM(i.massKg), 0) AS total_mass_kg
+        FROM payload_builders b
+        LEFT JOIN payload_builder_items i ON i.payload_builder_id = b.id
+        GROUP BY b.subscription_plan_id ORDER BY b.subscription_plan_id
+    """)
+    return [dict(row) for row in cur.fetchall()]
+
+
+# Id, name and size of every file (or only those of the given experiments),
+# grouped by experiment id. One query over the covering index instead of one
+# query per experiment.
+def files_by_experiment(cur: sqlite3.Cursor, experiment_ids=None):
+    sql = "SELECT experiment_id, id, filename, file_size AS size FROM experiment_files"
+    params = ()
+    if experiment_ids is not None:
+        if not experiment_ids:
+            return {}
+        sql += f" WHERE experiment_id IN ({','.join('?' * len(experiment_ids))})"
+        params = tuple(experiment_ids)
+    cur.execute(sql + " ORDER BY experiment_id, id", params)
+    grouped = {}
+    for row in cur.fetchall():
+        grouped.setdefault(row[0], []).append({'id': row[1], 'filename': row[2], 'size': row[3]})
+    return grouped
+
+EXPERIMENT_COLUMNS = ('id', 'name', 'description', 'status', 'payload', 'notes',
+                      'user_email', 'created_at', 'experimentType', 'ModulesNeeded')
+# Fields list_experiments can project: the columns plus the file summaries
+EXPERIMENT_FIELDS = EXPERIMENT_COLUMNS + ('files', 'file_count')
+MAX_PAGE_SIZE = 500
+
+def _in_or_equals(column, value, where, params):
+    values = [value] if isinstance(value, str) else list(value)
+    if len(values) == 1:
+        where.append(f"{column} = ?")
+    else:
+        where.append(f"{column} IN ({','.join('?' * len(values))})")
+    params.extend(values)
+
+# WHERE terms for the listing filters
+def _experiment_filters(cursor=None, status=None, user_email=None, experimentType=None,
+                        created_after=None, created_before=None):
+    where, params = [], []
+    if cursor is not None:
+        where.append("id < ?")
+        params.append(int(cursor))
+    if status:
+        _in_or_equals("status", status, where, params)
+    if user_email:
+        _in_or_equals("user_email", user_email, where, params)
+    if experimentType:
+        _in_or_equals("experimentType", experimentType, where, params)
+    if created_after:
+        where.append("created_at >= ?")
+        params.append(created_after)
+    if created_before:
+        where.append("created_at < ?")
+        params.append(created_before)
+    return where, params
+
+# SELECT for experiments matching the listing filters, newest first
+def _experiment_query(fields, cursor=None, status=None, user_email=None, experimentType=None,
+                      created_after=None, created_before=None):
+    unknown = [f for f in fields if f not in EXPERIMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown experiment fields: {', '.join(unknown)}")
+    columns = ['id'] + [f for f in fields if f in EXPERIMENT_COLUMNS and f != 'id']
+
+    where, params = _experiment_filters(cursor, status, user_email, experimentType,
+                                        created_after, created_before)
+    sql = f"SELECT {', '.join(columns)} FROM experiments"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY id DESC", params
+
+# Turn a batch of experiment rows into listing dicts, fetching the file
+# summaries for the whole batch at once
+def _experiment_items(cur: sqlite3.Cursor, rows, fields):
+    files = {}
+    if 'files' in fields or 'file_count' in fields:
+        files = files_by_experiment(cur, [row['id'] for row in rows])
+    # Positions of the requested columns in the row, worked out once per batch
+    names = [f for f in fields if f in EXPERIMENT_COLUMNS]
+    columns = rows[0].keys() if rows else []
+    pick = [columns.index(f) for f in names]
+    want_files, want_count = 'files' in fields, 'file_count' in fields
+    items = []
+    for row in rows:
+        item = dict(zip(names, [row[i] for i in pick]))
+        if want_files or want_count:
+            row_files = files.get(row[0], [])
+            if want_files:
+                item['files'] = row_files
+            if want_count:
+                item['file_count'] = len(row_files)
+        items.append(item)
+    return items
+
+# One page of experiments, newest first. Pass the returned next_cursor back as
+# cursor to get the following page; it is None on the last page. created_after
+# and created_before bound created_at (ISO 8601 text) inclusively/exclusively.
+@cached('experiments', get_cache, bypass=in_session)
+@with_db_session
+def list_experiments(cur: sqlite3.Cursor, cursor: int = None, limit: int = 50, status=None,
+                     user_email=None, experimentType=None, created_after: str = None,
+                     created_before: str = None, fields=None):
+    fields = list(fields) if fields else list(EXPERIMENT_COLUMNS) + ['files']
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    sql, params = _experiment_query(fields, cursor, status, user_email, experimentType,
+                                    created_after, created_before)
+    # Fetch one extra row to know whether there is another page
+    cur.execute(sql + " LIMIT ?", params + [limit + 1])
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'experiments': _experiment_items(cur, rows, fields),
+        'next_cursor': rows[-1]['id'] if has_more else None,
+    }
+
+# Yield experiments newest first, batch_size rows at a time, so memory stays
+# bounded however large the table is. Takes the same filters as
+# list_experiments (without paging). The connection is held until the
+# generator is exhausted or closed.
+def iter_experiments(batch_size: int = 200, fields=None, **filters):
+    fields = list(fields) if fields else list(EXPERIMENT_COLUMNS) + ['files']
+    batch_size = max(1, min(int(batch_size), MAX_PAGE_SIZE))
+    sql, params = _experiment_query(fields, **filters)
+    with get_pool().connection() as conn:
+        rows_cur = conn.cursor()
+        files_cur = conn.cursor()
+        rows_cur.execute(sql, params)
+        while True:
+            rows = rows_cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from _experiment_items(files_cur, rows, fields)
+        rows_cur.close()
+
+def get_all_experiments():
+    # Fetch experiments with all fields. Not cached: the result is the whole
+    # table, which would be held (and pickled, in the shared store) per call
+    return list(iter_experiments())
+
+# Change feed (see migration 6): every insert, status or notes change and
+# delete of an experiment is appended to experiment_changes by triggers.
+# Clients remember the last seq they saw and ask for what came after it;
+# with since=None they get no changes, only the current head to start from.
+CHANGES_PAGE_SIZE = 500
+
+def _select_changes(cur: sqlite3.Cursor, since: int, limit: int, experiment_id: int = None):
+    limit = max(1, min(int(limit), CHANGES_PAGE_SIZE))
+    if experiment_id is None:
+        cur.execute("""
+            SELECT seq, experiment_id, field, old_value, new_value, changed_at
+            FROM experiment_changes WHERE seq > ? ORDER BY seq LIMIT ?""", (since, limit + 1))
+    else:
+        cur.execute("""
+            SELECT seq, experiment_id, field, old_value, new_value, changed_at
+            FROM experiment_changes WHERE experiment_id = ? AND seq > ? ORDER BY seq LIMIT ?""",
+                    (experiment_id, since, limit + 1))
+    rows = [dict(row) for row in cur.fetchall()]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {'changes': rows, 'last_seq': rows[-1]['seq'] if rows else since, 'has_more': has_more}
+
+def _latest_change_seq(cur: sqlite3.Cursor):
+    return cur.execute("SELECT COALESCE(MAX(seq), 0) FROM experiment_changes").fetchone()[0]
+
+@with_db_session
+def latest_change_seq(cur: sqlite3.Cursor):
+    return _latest_change_seq(cur)
+
+@with_db_session
+def get_changes_since(cur: sqlite3.Cursor, since: int = None, limit: int = CHANGES_PAGE_SIZE,
+                      experiment_id: int = None):
+    if since is None:
+        return {'changes': [], 'last_seq': _latest_change_seq(cur), 'has_more': False}
+    return _select_changes(cur, int(since), limit, experiment_id)
+
+# Long-poll: return as soon as there are changes after since, or an empty
+# page once timeout seconds pass. A dedicated connection watches PRAGMA
+# data_version, which moves whenever another connection commits, so the
+# changes table is only queried again after a commit.
+def wait_for_changes(since: int = None, timeout: float = 30.0, limit: int = CHANGES_PAGE_SIZE,
+                     experiment_id: int = None, poll_interval: float = 0.05):
+    conn = get_pool().connect()
+    try:
+        return _wait_for_changes(conn, since, timeout, limit, experiment_id, poll_interval)
+    finally:
+        conn.close()
+
+def _wait_for_changes(conn, since, timeout, limit, experiment_id, poll_interval):
+    cur = conn.cursor()
+    if since is None:
+        since = _latest_change_seq(cur)
+    deadline = time.monotonic() + timeout
+    # Read the version first so a commit landing between it and the query
+    # below is noticed on the next poll rather than missed
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    result = _select_changes(cur, int(since), limit, experiment_id)
+    while not result['changes'] and time.monotonic() < deadline:
+        time.sleep(min(poll_interval, max(0.0, deadline - time.monotonic())))
+        current = conn.execute("PRAGMA data_version").fetchone()[0]
+        if current != version:
+            version = current
+            result = _select_changes(cur, int(since), limit, experiment_id)
+    return result
+
+# Yield changes as they commit, forever (or until the caller stops)
+def follow_changes(since: int = None, limit: int = CHANGES_PAGE_SIZE, experiment_id: int = None,
+                   poll_interval: float = 0.05):
+    conn = get_pool().connect()
+    try:
+        while True:
+            result = _wait_for_changes(conn, since, 60.0, limit, experiment_id, poll_interval)
+            yield from result['changes']
+            since = result['last_seq']
+    finally:
+        conn.close()
+
+# Drop change log entries up to and including seq; seq keeps counting up
+@with_db_session
+def prune_changes(cur: sqlite3.Cursor, through_seq: int):
+    cur.execute("DELETE FROM experiment_changes WHERE seq <= ?", (through_seq,))
+    return cur.rowcount
+
+# Work queue over experiments (see migration 8) for downstream schedulers.
+# 'experiment queued' experiments are claimed with a lease; the claimer
+# heartbeats to keep it, then completes or fails the experiment. A lease
+# that runs out puts the experiment back in the queue (on the next claim or
+# requeue_expired_leases), until it has been tried QUEUE_MAX_ATTEMPTS times.
+QUEUE_LEASE_SECONDS = 60.0
+QUEUE_MAX_ATTEMPTS = 5
+QUEUE_CLAIM_COLUMNS = ('id', 'name', 'description', 'status', 'payload', 'notes', 'user_email',
+                       'created_at', 'experimentType', 'ModulesNeeded', 'attempts')
+
+def _requeue_expired(cur: sqlite3.Cursor, now: float, max_attempts: int):
+    # Leases left on experiments whose status was changed by hand are just
+    # dropped
+    cur.execute("""
+        UPDATE experiments INDEXED BY idx_experiments_queue_leased
+        SET lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL
+        WHERE lease_expires_at IS NOT NULL AND lease_expires_at < ? AND status != 'experiment queued'
+    """, (now,))
+    cur.execute("""
+        UPDATE experiments INDEXED BY idx_experiments_queue_leased
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE status END,
+            notes = CASE WHEN attempts >= ? THEN 'lease expired after ' || attempts || ' attempts' ELSE notes END,
+            lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL
+        WHERE lease_expires_at IS NOT NULL AND lease_expires_at < ? AND status = 'experiment queued'
+        RETURNING status
+    """, (max_attempts, max_attempts, now))
+    statuses = [row[0] for row in cur.fetchall()]
+    failed = statuses.count('failed')
+    if failed:
+        invalidate_cache('experiments')
+    return {'requeued': len(statuses) - failed, 'failed': failed}
+
+def claim_experiments(worker: str, limit: int = 1, lease_seconds: float = QUEUE_LEASE_SECONDS,
+                      max_attempts: int = QUEUE_MAX_ATTEMPTS):
+    # Atomically take up to limit queued experiments, oldest first. Each
+    # comes back with the lease_token the other queue calls need. The
+    # queue statements name their partial index: the planner would
+    # otherwise take idx_experiments_status and step over every leased row.
+    def claim():
+        cur = _session.conn.cursor()
+        now = time.time()
+        _requeue_expired(cur, now, max_attempts)
+        token = os.urandom(8).hex()
+        cur.execute(f"""
+            UPDATE experiments
+            SET lease_owner = ?, lease_token = ? || '-' || id, lease_expires_at = ?, attempts = COALESCE(attempts, 0) + 1
+            WHERE id IN (
+                SELECT id FROM experiments INDEXED BY idx_experiments_queue_ready
+                WHERE status = 'experiment queued' AND lease_expires_at IS NULL
+                ORDER BY id LIMIT ?)
+            RETURNING {', '.join(QUEUE_CLAIM_COLUMNS)}, lease_token, lease_expires_at
+        """, (worker, token, now + lease_seconds, max(1, int(limit))))
+        return sorted((dict(row) for row in cur.fetchall()), key=lambda r: r['id'])
+    return run_transaction(claim, immediate=True)
 
 @with_db_session
-def get_all_experiments(cur: sqlite3.Cursor):
-    # Fetch experiments with all fields
+def heartbeat_experiment(cur: sqlite3.Cursor, experiment_id: int, lease_token: str,
+                         lease_seconds: float = QUEUE_LEASE_SECONDS):
+    # Extend a lease still held; False means it was lost
+    cur.execute("""
+        UPDATE experiments SET lease_expires_at = ?
+        WHERE id = ? AND lease_token = ? AND status = 'experiment queued'
+    """, (time.time() + lease_seconds, experiment_id, lease_token))
+    return cur.rowcount == 1
+
+def _finish_experiment(cur: sqlite3.Cursor, experiment_id: int, lease_token: str, status: str, notes):
     cur.execute("""
-        SELECT id, name, description, status, payload, notes, 
-               user_email, created_at, experimentType, ModulesNeeded 
-        FROM experiments 
-        ORDER BY id DESC""")
-    ex_rows = cur.fetchall()
-    results = []
-    for ex in ex_rows:
-        ex_id = ex['id']
-        cur.execute("SELECT id, filename, length(file_data) as size FROM experiment_files WHERE experiment_id = ?", (ex_id,))
-        files = [dict(row) for row in cur.fetchall()]
-        results.append({
-            'id': ex_id,
-            'name': ex['name'],
-            'description': ex['description'],
-            'status': ex['status'],
-            'payload': ex['payload'],
-            'notes': ex['notes'],
-            'user_email': ex['user_email'],
-            'created_at': ex['created_at'],
-            'experimentType': ex['experimentType'],
-            'ModulesNeeded': ex['ModulesNeeded'],
-            'files': files
-        })
-    return results
+        UPDATE experiments
+        SET status = ?, notes = COALESCE(?, notes), lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL
+        WHERE id = ? AND lease_token = ? AND status = 'experiment queued'
+    """, (status, notes, experiment_id, lease_token))
+    if cur.rowcount != 1:
+        return False
+    invalidate_cache('experiments')
+    return True
+
+@with_db_session
+def complete_experiment(cur: sqlite3.Cursor, experiment_id: int, lease_token: str, notes: str = None):
+    return _finish_experiment(cur, experiment_id, lease_token, 'experiment completed', notes)
+
+@with_db_session
+def fail_experiment(cur: sqlite3.Cursor, experiment_id: int, lease_token: str, error: str = None,
+                    retry: bool = False, max_attempts: int = QUEUE_MAX_ATTEMPTS):
+    # With retry the experiment goes back in the queue, unless it has used
+    # up its attempts
+    if retry:
+        cur.execute("""
+            UPDATE experiments SET lease_owner = NULL, lease_token = NULL, lease_expires_at = NULL,
+                                   notes = COALESCE(?, notes)
+            WHERE id = ? AND lease_token = ? AND status = 'experiment queued' AND attempts < ?
+        """, (error, experiment_id, lease_token, max_attempts))
+        if cur.rowcount == 1:
+            invalidate_cache('experiments')
+            return True
+    return _finish_experiment(cur, experiment_id, lease_token, 'failed', error)
+
+@with_db_session
+def requeue_expired_leases(cur: sqlite3.Cursor, max_attempts: int = QUEUE_MAX_ATTEMPTS):
+    return _requeue_expired(cur, time.time(), max_attempts)
+
+@with_db_session
+def queue_stats(cur: sqlite3.Cursor):
+    now = time.time()
+    ready = cur.execute("""
+        SELECT COUNT(*) FROM experiments INDEXED BY idx_experiments_queue_ready
+        WHERE status = 'experiment queued' AND lease_expires_at IS NULL
+    """).fetchone()[0]
+    leased, expired = cur.execute("""
+        SELECT COUNT(*), COALESCE(SUM(lease_expires_at < ?), 0) FROM experiments WHERE lease_expires_at IS NOT NULL
+    """, (now,)).fetchone()
+    oldest = cur.execute("""
+        SELECT MIN(id) FROM experiments INDEXED BY idx_experiments_queue_ready
+        WHERE status = 'experiment queued' AND lease_expires_at IS NULL
+    """).fetchone()[0]
+    return {'ready': ready, 'leased': leased, 'expired_leases': expired, 'oldest_ready_id': oldest}
+
+# Reporting (see reporting.py and migration 9): the dashboard's aggregates
+# come from report_rollup, which triggers keep current, so a report costs
+# a scan of days x keys instead of every experiment. since and until are
+# dates (YYYY-MM-DD); since is inclusive, until exclusive, like the listing
+# filters.
+def _report_filters(since=None, until=None, key=None):
+    where, params = [], []
+    if since or until:
+        where.append("day != ?")
+        params.append(reporting.UNKNOWN_DAY)
+    if since:
+        where.append("day >= ?")
+        params.append(str(since)[:10])
+    if until:
+        where.append("day < ?")
+        params.append(str(until)[:10])
+    if key is not None:
+        where.append("key = ?")
+        params.append(key)
+    return where, params
+
+# Counts of one dimension per time bucket, oldest bucket first. The 'total'
+# dimension also carries the number of files and their bytes.
+@cached('experiments', get_cache, bypass=in_session)
+@with_db_session
+def report_aggregates(cur: sqlite3.Cursor, dimension: str = 'total', bucket: str = 'day',
+                      since: str = None, until: str = None, key: str = None):
+    if dimension not in reporting.DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(reporting.DIMENSIONS)}")
+    if bucket not in reporting.BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(reporting.BUCKETS)}")
+    where, params = _report_filters(since, until, key)
+    rows = cur.execute(f"""
+        SELECT {reporting.BUCKETS[bucket]} AS bucket, key, SUM(experiments) AS experiments,
+               SUM(files) AS files, SUM(bytes) AS bytes
+        FROM report_rollup WHERE {' AND '.join(['dimension = ?'] + where)}
+        GROUP BY 1, 2 HAVING SUM(experiments) != 0 OR SUM(files) != 0
+        ORDER BY 1, 2
+    """, [dimension] + params).fetchall()
+    if dimension == 'total':
+        items = [{'bucket': r['bucket'], 'experiments': r['experiments'], 'files': r['files'],
+                  'bytes': r['bytes']} for r in rows]
+    else:
+        items = [{'bucket': r['bucket'], 'key': r['key'], 'experiments': r['experiments']} for r in rows]
+    return {'dimension': dimension, 'bucket': bucket, 'rows': items}
+
+# Every dimension at once over the whole range: totals, and per status,
+# experimentType, user_email and module the number of experiments, most
+# used first
+@cached('experiments', get_cache, bypass=in_session)
+@with_db_session
+def report_summary(cur: sqlite3.Cursor, since: str = None, until: str = None):
+    where, params = _report_filters(since, until)
+    rows = cur.execute(f"""
+        SELECT dimension, key, SUM(experiments) AS experiments, SUM(files) AS files, SUM(bytes) AS bytes
+        FROM report_rollup {'WHERE ' + ' AND '.join(where) if where else ''}
+        GROUP BY dimension, key HAVING SUM(experiments) != 0 OR SUM(files) != 0
+        ORDER BY dimension, SUM(experiments) DESC, key
+    """, params).fetchall()
+    summary = {'totals': {'experiments': 0, 'files': 0, 'bytes': 0}}
+    summary.update({dimension: {} for dimension in reporting.DIMENSIONS if dimension != 'total'})
+    for r in rows:
+        if r['dimension'] == 'total':
+            summary['totals'] = {'experiments': r['experiments'], 'files': r['files'], 'bytes': r['bytes']}
+        else:
+            summary[r['dimension']][r['key']] = r['experiments']
+    return summary
+
+# Recompute report_rollup from the experiments and files themselves, in one
+# write transaction; for after manual edits, or to drop the zero rows that
+# moves leave behind
+def rebuild_reports():
+    def rebuild():
+        conn = _session.conn
+        conn.execute("DELETE FROM report_rollup")
+        for statement in reporting.rebuild_sql():
+            conn.execute(statement)
+        invalidate_cache('experiments')
+        return conn.execute("SELECT COUNT(*) FROM report_rollup").fetchone()[0]
+    start = time.perf_counter()
+    rows = run_transaction(rebuild, immediate=True)
+    return {'rows': rows, 'elapsed_s': round(time.perf_counter() - start, 3)}
+
+# One-off migration: rewrite experiments.payload rows that still embed base64
+# file bodies so they hold content references instead (see
+# payloads.normalize_payload). Runs in batches of batch_size rows, one
+# transaction each. The database file only shrinks after a VACUUM.
+def normalize_stored_payloads(batch_size: int = 500, vacuum: bool = False):
+    from payloads import normalize_payload, has_file_bodies
+    report = {'rows_scanned': 0, 'rows_rewritten': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = 0
+    while True:
+        with db_session() as conn:
+            rows = conn.execute(
+                "SELECT id, payload FROM experiments WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                report['rows_scanned'] += 1
+                try:
+                    payload = serializer.loads(row['payload']) if row['payload'] else None
+                except ValueError:
+                    continue
+                if not has_file_bodies(payload):
+                    continue
+                new_payload = serializer.dumps(normalize_payload(payload))
+                report['bytes_before'] += len(row['payload'].encode('utf-8'))
+                report['bytes_after'] += len(new_payload.encode('utf-8'))
+                updates.append((new_payload, row['id']))
+            conn.executemany("UPDATE experiments SET payload = ? WHERE id = ?", updates)
+            if updates:
+                invalidate_cache('experiments')
+            report['rows_rewritten'] += len(updates)
+            last_id = rows[-1]['id']
+    report['bytes_reclaimed'] = report['bytes_before'] - report['bytes_after']
+    if vacuum:
+        size_before = path.getsize(db_name)
+        with get_pool().connection() as conn:
+            conn.execute("VACUUM")
+        report['file_bytes_before_vacuum'] = size_before
+        report['file_bytes_after_vacuum'] = path.getsize(db_name)
+    return report
 
 if __name__ == '__main__': 
     create_table()
 
 # Cleanup all tables for a fresh database
-@with_db_session
-def cleanup_database(cur: sqlite3.Cursor):
-    cur.execute("DELETE FROM experiment_files;")
-    cur.execute("DELETE FROM experiments;")
-    cur.execute("DELETE FROM payload_builders;")
-    cur.execute("DELETE FROM modules;")
-    cur.execute("DELETE FROM users;")
+def cleanup_database():
+    with db_session() as conn:
+        # Earlier history goes, but the 'deleted' events the triggers record
+        # below stay, so change feed followers see the experiments go
+        head = _latest_change_seq(conn.cursor())
+        conn.execute("DELETE FROM experiment_files;")
+        conn.execute("DELETE FROM experiments;")
+        conn.execute("DELETE FROM experiment_changes WHERE seq <= ?", (head,))
+        conn.execute("DELETE FROM payload_builder_items;")
+        conn.execute("DELETE FROM payload_builders;")
+        conn.execute("DELETE FROM modules;")
+        conn.execute("DELETE FROM report_rollup;")
+        # Subscriptions reference their user and foreign keys are enforced,
+        # so they have to go with the users. The credit ledger is kept as
+        # the audit trail; account ids are never reused, so its entries
+        # cannot attach to a later account.
+        conn.execute("DELETE FROM user_subscriptions;")
+        conn.execute("DELETE FROM users;")
+        invalidate_cache('experiments', 'user_subscriptions')
+    # Every blob is unreferenced now, bar ones a concurrent submission has
+    # written but not yet referenced; the grace period keeps those
+    gc_blobs()
     return "Database cleaned."
 
-# Fetch all modules
-@with_db_session
-def get_modules_by_plan_option(cur: sqlite3.Cursor, plan_option_id: int):
-    from data import MODULE_TYPES
-    # Filter static modules by subscription_plan_option_id
-    return [m for m in MODULE_TYPES if m.subscription_plan_option_id == plan_option_id]
\ No newline at end of file
+# Modules available to a plan option, from the in-memory catalog (no
+# database access)
+def get_modules_by_plan_option(plan_option_id: int):
+    from catalog import modules_for_plan_option
+    return modules_for_plan_option(plan_option_id)
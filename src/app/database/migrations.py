@@ -0,0 +1,465 @@
+import sqlite3
+from datetime import datetime
+
+# Numbered schema migrations. schema_version records every migration that has
+# been applied, so bringing a database up to date costs one version lookup
+# when nothing is pending. Each migration runs in its own BEGIN IMMEDIATE
+# transaction and re-checks the version once it holds the write lock, so two
+# processes starting at the same time never apply the same step twice.
+# Migrations must never be edited once shipped: add a new one instead.
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"migration {version} registered out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def add_column_if_not_exists(cur: sqlite3.Cursor, table: str, column: str, type: str):
+    cur.execute(f"SELECT COUNT(*) FROM pragma_table_info('{table}') WHERE name='{column}'")
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type}")
+        return True
+    return False
+
+
+def column_exists(cur: sqlite3.Cursor, table: str, column: str):
+    cur.execute(f"SELECT COUNT(*) FROM pragma_table_info('{table}') WHERE name='{column}'")
+    return cur.fetchone()[0] > 0
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn: sqlite3.Connection):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError as e:
+        if 'no such table' in str(e):
+            return 0
+        raise
+    return row[0] or 0
+
+
+def _ensure_version_table(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    );
+    """)
+
+
+def migrate(conn: sqlite3.Connection, target: int = None):
+    # Apply every pending migration up to target (default: all of them) and
+    # return the versions applied. conn must not be inside a transaction.
+    target = latest_version() if target is None else target
+    if current_version(conn) >= target:
+        return []
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.cursor()
+            _ensure_version_table(cur)
+            if current_version(conn) >= version:
+                conn.commit()
+                continue
+            fn(cur)
+            cur.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                        (version, description, datetime.now().isoformat()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def status(conn: sqlite3.Connection):
+    applied = {}
+    if current_version(conn):
+        for row in conn.execute("SELECT version, applied_at FROM schema_version"):
+            applied[row[0]] = row[1]
+    return {
+        'version': current_version(conn),
+        'latest': latest_version(),
+        'migrations': [
+            {'version': v, 'description': d, 'applied_at': applied.get(v)}
+            for v, d, _ in MIGRATIONS
+        ],
+    }
+
+
+@migration(1, "baseline schema")
+def _baseline(cur: sqlite3.Cursor):
+    # Everything create_table used to (re)check on each run. Written with IF
+    # NOT EXISTS so it also adopts databases created before schema_version.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        pwd_hash BLOB NOT NULL,
+        api_key_hash BLOB NOT NULL,
+        credits_available INTEGER DEFAULT 0,
+        subscriptionplan_id INTEGER DEFAULT 0
+    )""")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS experiments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        description TEXT,
+        status TEXT,
+        payload TEXT,
+        notes TEXT,
+        user_email TEXT,
+        created_at TEXT,
+        experimentType TEXT,
+        ModulesNeeded TEXT
+    )""")
+
+    # Add new columns if they don't exist
+    add_column_if_not_exists(cur, "experiments", "notes", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "user_email", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "created_at", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "experimentType", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "ModulesNeeded", "TEXT")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS experiment_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        experiment_id INTEGER,
+        filename TEXT,
+        file_data BLOB,
+        FOREIGN KEY(experiment_id) REFERENCES experiments(id)
+    );
+    """)
+    # Store each file's size so listings never have to touch file_data
+    if add_column_if_not_exists(cur, "experiment_files", "file_size", "INTEGER"):
+        cur.execute("UPDATE experiment_files SET file_size = length(file_data)")
+    # Covering index for the per-experiment file summary in get_all_experiments
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_experiment_files_experiment
+    ON experiment_files (experiment_id, id, filename, file_size);
+    """)
+
+    # File bodies live once in the content-addressed blob store (see
+    # blobstore.py); experiment_files rows point at them by SHA-256 and the
+    # triggers keep each blob's reference count
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT
+    );
+    """)
+    add_column_if_not_exists(cur, "experiment_files", "blob_sha256", "TEXT")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_files_blob_ref
+    AFTER INSERT ON experiment_files WHEN NEW.blob_sha256 IS NOT NULL
+    BEGIN
+        UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.blob_sha256;
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_files_blob_unref
+    AFTER DELETE ON experiment_files WHEN OLD.blob_sha256 IS NOT NULL
+    BEGIN
+        UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = OLD.blob_sha256;
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_files_blob_reref
+    AFTER UPDATE OF blob_sha256 ON experiment_files
+    BEGIN
+        UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = OLD.blob_sha256;
+        UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.blob_sha256;
+    END;
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS payload_builders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        bay_width INTEGER,
+        bay_height INTEGER,
+        items_json TEXT,
+        created_at TEXT
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS modules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        w INTEGER,
+        h INTEGER,
+        massKg REAL
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS subscription_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        credits_to_buy INTEGER DEFAULT 0,
+        plan_option_id INTEGER DEFAULT 0
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        plan_id INTEGER,
+        credits_available INTEGER DEFAULT 0,
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(plan_id) REFERENCES subscription_plans(id)
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS plan_options (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        perks TEXT
+    );
+    """)
+
+
+@migration(2, "reconcile setup_db experiments schema")
+def _reconcile_experiments(cur: sqlite3.Cursor):
+    # setup_db.py used to recreate experiments with user_id, confirmed and
+    # confirmation_notes instead of notes. The baseline has already added the
+    # canonical columns; carry the old confirmation notes over. The legacy
+    # columns stay (user_id carries a foreign key, so SQLite cannot drop it)
+    # and nothing reads them any more.
+    if column_exists(cur, "experiments", "confirmation_notes"):
+        cur.execute("""
+            UPDATE experiments SET notes = confirmation_notes
+            WHERE notes IS NULL AND confirmation_notes IS NOT NULL
+        """)
+
+
+@migration(3, "experiment listing indexes")
+def _experiment_indexes(cur: sqlite3.Cursor):
+    # list_experiments filters on status / user_email and pages by id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_experiments_status ON experiments (status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_experiments_user_email ON experiments (user_email, id)")
+
+
+@migration(4, "lookup indexes")
+def _lookup_indexes(cur: sqlite3.Cursor):
+    # get/update/delete_user_subscription look subscriptions up by user
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_subscriptions_user ON user_subscriptions (user_id)")
+    # list_experiments can filter on experimentType as well
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_experiments_type ON experiments (experimentType, id)")
+    # Partial indexes holding only the rows the maintenance jobs look for:
+    # gc_blobs' unreferenced blobs and move_inline_files_to_blobs' inline bodies
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (sha256) WHERE refcount <= 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_experiment_files_inline ON experiment_files (id) WHERE blob_sha256 IS NULL")
+
+
+@migration(5, "payload builder items table")
+def _payload_builder_items(cur: sqlite3.Cursor):
+    # One row per placed module instead of the items_json text, so usage and
+    # mass/area questions can be answered in SQL. w, h and massKg are copied
+    # from the module catalog when the item is saved.
+    import json
+    from catalog import get_catalog
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS payload_builder_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        payload_builder_id INTEGER NOT NULL,
+        module_id INTEGER,
+        x INTEGER,
+        y INTEGER,
+        w INTEGER,
+        h INTEGER,
+        label TEXT,
+        massKg REAL,
+        FOREIGN KEY(payload_builder_id) REFERENCES payload_builders(id) ON DELETE CASCADE
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_payload_builder_items_builder ON payload_builder_items (payload_builder_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_payload_builder_items_module ON payload_builder_items (module_id, payload_builder_id)")
+    add_column_if_not_exists(cur, "payload_builders", "subscription_plan_id", "INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_payload_builders_plan ON payload_builders (subscription_plan_id)")
+
+    # Move the items of existing builders out of items_json
+    catalog = get_catalog()
+    rows = cur.execute("SELECT id, items_json FROM payload_builders WHERE items_json IS NOT NULL").fetchall()
+    for builder_id, items_json in rows:
+        try:
+            items = json.loads(items_json) or []
+        except ValueError:
+            continue
+        cur.executemany("""
+            INSERT INTO payload_builder_items
+            (payload_builder_id, module_id, x, y, w, h, label, massKg)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [builder_item_values(builder_id, item, catalog) for item in items if isinstance(item, dict)])
+        cur.execute("UPDATE payload_builders SET items_json = NULL WHERE id = ?", (builder_id,))
+
+
+def builder_item_values(builder_id, item: dict, catalog):
+    # Column values of a payload_builder_items row for one builder item
+    w, h, mass = catalog.footprint(item.get('module_id'))
+    return (builder_id, item.get('module_id'), item.get('x'), item.get('y'), w, h,
+            item.get('label'), item.get('massKg') or mass)
+
+
+@migration(6, "experiment change log")
+def _experiment_changes(cur: sqlite3.Cursor):
+    # Append-only feed of experiment changes, written by triggers so every
+    # writer (cli.py, workers, bulk updates, manual SQL) is covered. seq is
+    # AUTOINCREMENT so it never goes backwards, even after pruning.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS experiment_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        experiment_id INTEGER NOT NULL,
+        field TEXT NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_experiment_changes_experiment ON experiment_changes (experiment_id, seq)")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_changes_insert AFTER INSERT ON experiments
+    BEGIN
+        INSERT INTO experiment_changes (experiment_id, field, old_value, new_value)
+        VALUES (new.id, 'created', NULL, new.status);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_changes_status AFTER UPDATE OF status ON experiments
+    WHEN old.status IS NOT new.status
+    BEGIN
+        INSERT INTO experiment_changes (experiment_id, field, old_value, new_value)
+        VALUES (new.id, 'status', old.status, new.status);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_changes_notes AFTER UPDATE OF notes ON experiments
+    WHEN old.notes IS NOT new.notes
+    BEGIN
+        INSERT INTO experiment_changes (experiment_id, field, old_value, new_value)
+        VALUES (new.id, 'notes', old.notes, new.notes);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS experiment_changes_delete AFTER DELETE ON experiments
+    BEGIN
+        INSERT INTO experiment_changes (experiment_id, field, old_value, new_value)
+        VALUES (old.id, 'deleted', old.status, NULL);
+    END;
+    """)
+
+
+@migration(7, "credit ledger")
+def _credit_ledger(cur: sqlite3.Cursor):
+    # Every change to a credit balance, newest last. The balances themselves
+    # stay in users.credits_available and user_subscriptions.credits_available
+    # (account 'user' / 'subscription', account_id being that row's id) and
+    # must always equal the sum of the account's deltas.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS credit_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account TEXT NOT NULL CHECK (account IN ('user', 'subscription')),
+        account_id INTEGER NOT NULL,
+        delta INTEGER NOT NULL,
+        balance_after INTEGER NOT NULL,
+        reason TEXT,
+        experiment_id INTEGER,
+        idempotency_key TEXT UNIQUE,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_credit_ledger_account ON credit_ledger (account, account_id)")
+    # Opening entries so existing balances reconcile
+    cur.execute("""
+        INSERT INTO credit_ledger (account, account_id, delta, balance_after, reason)
+        SELECT 'user', id, credits_available, credits_available, 'opening balance'
+        FROM users WHERE COALESCE(credits_available, 0) != 0
+    """)
+    cur.execute("""
+        INSERT INTO credit_ledger (account, account_id, delta, balance_after, reason)
+        SELECT 'subscription', id, credits_available, credits_available, 'opening balance'
+        FROM user_subscriptions WHERE COALESCE(credits_available, 0) != 0
+    """)
+
+
+@migration(8, "experiment queue leases")
+def _queue_leases(cur: sqlite3.Cursor):
+    # A queued experiment is claimed by a scheduler for lease_expires_at
+    # (unix time); lease_token identifies the claim so a worker whose lease
+    # ran out cannot complete work someone else has since claimed.
+    add_column_if_not_exists(cur, "experiments", "lease_owner", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "lease_token", "TEXT")
+    add_column_if_not_exists(cur, "experiments", "lease_expires_at", "REAL")
+    add_column_if_not_exists(cur, "experiments", "attempts", "INTEGER DEFAULT 0")
+    # Queued and unclaimed, oldest first: what claim_experiments takes from.
+    # Partial, so its size is the backlog, not the table.
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_experiments_queue_ready ON experiments (id)
+        WHERE status = 'experiment queued' AND lease_expires_at IS NULL
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_experiments_queue_leased ON experiments (lease_expires_at)
+        WHERE lease_expires_at IS NOT NULL
+    """)
+
+
+@migration(9, "reporting rollups")
+def _reporting_rollups(cur: sqlite3.Cursor):
+    # Aggregates for the reports dashboard, kept by triggers so every writer
+    # (save_experiment, save_experiment_file(s), confirmations, the queue,
+    # deletes) updates them in the same transaction. See reporting.py.
+    import reporting
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_rollup (
+        dimension TEXT NOT NULL,
+        day TEXT NOT NULL,
+        key TEXT NOT NULL,
+        experiments INTEGER NOT NULL DEFAULT 0,
+        files INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key, day)
+    ) WITHOUT ROWID;
+    """)
+    # Everything but the status moves the whole experiment; a plain status
+    # change (the common case) only touches two status rows
+    others = ('created_at', 'experimentType', 'user_email', 'ModulesNeeded')
+    unchanged = ' AND '.join(f"old.{c} IS new.{c}" for c in others)
+    changed = ' OR '.join(f"old.{c} IS NOT new.{c}" for c in others)
+    triggers = {
+        "report_rollup_insert AFTER INSERT ON experiments": reporting.count_experiment('new', 1),
+        "report_rollup_delete AFTER DELETE ON experiments": reporting.count_experiment('old', -1),
+        f"""report_rollup_status AFTER UPDATE OF status, {', '.join(others)} ON experiments
+    WHEN old.status IS NOT new.status AND {unchanged}""": reporting.count_status('old', 'new'),
+        f"""report_rollup_update AFTER UPDATE OF status, {', '.join(others)} ON experiments
+    WHEN {changed}""": (reporting.count_experiment('old', -1) + reporting.count_experiment('new', 1)
+                        + reporting.move_files('old', 'new')),
+        "report_rollup_file_insert AFTER INSERT ON experiment_files": reporting.count_file('new', 1),
+        "report_rollup_file_delete AFTER DELETE ON experiment_files": reporting.count_file('old', -1),
+        """report_rollup_file_update AFTER UPDATE OF experiment_id, file_size ON experiment_files
+    WHEN old.experiment_id IS NOT new.experiment_id OR old.file_size IS NOT new.file_size""":
+            reporting.count_file('old', -1) + reporting.count_file('new', 1),
+    }
+    for head, statements in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {head}\n    BEGIN\n        "
+                    + "\n        ".join(statements) + "\n    END;")
+    # Counts for the rows already there
+    cur.execute("DELETE FROM report_rollup")
+    for statement in reporting.rebuild_sql():
+        cur.execute(statement)
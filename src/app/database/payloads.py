@@ -0,0 +1,77 @@
+import hashlib
+import re
+from base64 import b64decode
+
+# Decoded bytes per chunk when streaming base64 file bodies
+DECODE_CHUNK_SIZE = 256 * 1024
+
+_STRICT_BASE64 = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+
+def decode_file_data(data_b64):
+    try:
+        return b64decode(data_b64)
+    except Exception:
+        return b''
+
+
+def iter_decoded_chunks(data_b64, chunk_size=DECODE_CHUNK_SIZE):
+    """
+    Decode a base64 string piece by piece, yielding at most chunk_size bytes
+    at a time, so the decoded body never sits in memory whole. Strings that
+    are not plain padded base64 (embedded newlines, data: prefixes) go through
+    decode_file_data instead to keep its lenient behaviour.
+    """
+    if not data_b64:
+        return
+    if not isinstance(data_b64, str) or len(data_b64) % 4 or not _STRICT_BASE64.fullmatch(data_b64):
+        yield decode_file_data(data_b64)
+        return
+    step = max(4, chunk_size // 3 * 4)
+    for i in range(0, len(data_b64), step):
+        yield b64decode(data_b64[i:i + step])
+
+
+def file_reference(filename, data: bytes) -> dict:
+    # What experiments.payload keeps for a file once its body lives in
+    # experiment_files: enough to identify the content without repeating it
+    return {
+        'filename': filename,
+        'size': len(data),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+
+
+def normalize_payload(payload: dict, stored_files=None) -> dict:
+    """
+    Return a copy of a submission payload whose files carry content references
+    instead of base64 bodies. stored_files, if given, holds the already stored
+    ExperimentFileData (with blob_sha256 and file_size set) for each entry of
+    payload['files'] so nothing is decoded or hashed twice. Files that are
+    already references are left as they are.
+    """
+    files = payload.get('files')
+    if not files:
+        return payload
+    normalized = []
+    for i, f in enumerate(files):
+        if stored_files is not None:
+            ref = {k: v for k, v in f.items() if k != 'data'} if isinstance(f, dict) else {}
+            stored = stored_files[i]
+            ref.update({'filename': stored.filename, 'size': stored.file_size, 'sha256': stored.blob_sha256})
+            normalized.append(ref)
+            continue
+        if not isinstance(f, dict) or 'data' not in f:
+            normalized.append(f)
+            continue
+        ref = {k: v for k, v in f.items() if k != 'data'}
+        ref.update(file_reference(f.get('filename'), decode_file_data(f.get('data'))))
+        normalized.append(ref)
+    out = dict(payload)
+    out['files'] = normalized
+    return out
+
+
+def has_file_bodies(payload) -> bool:
+    files = payload.get('files') if isinstance(payload, dict) else None
+    return bool(files) and any(isinstance(f, dict) and 'data' in f for f in files)
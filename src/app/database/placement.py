@@ -0,0 +1,236 @@
+import time
+
+from catalog import get_catalog
+
+# Placement checks and automatic layout for payload builder bays. A bay is a
+# bay_width x bay_height grid of cells; each item is a module from the
+# catalog occupying w x h cells with its top-left corner at (x, y).
+#
+# Occupancy is kept as one Python int per bay row, bit x set when cell x is
+# taken. Marking or testing an item is then h big-int AND/OR operations
+# instead of w*h cell visits, so a layout of n items is checked in
+# O(sum of item heights) word operations.
+
+# Default time allowed for auto_pack to try orderings, in seconds
+PACK_TIME_BUDGET = 0.5
+# Side of the buckets used to name the item an overlap collides with
+BUCKET_SIZE = 16
+# Largest bay side accepted, in cells. Bay sizes come straight from the
+# request and the grid is allocated up front, so anything larger is refused.
+MAX_BAY_SIZE = 1024
+
+
+class Occupancy:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full = (1 << width) - 1
+        self.rows = [0] * height
+        # Items by bucket, only consulted to report who an overlap is with
+        self._buckets = {}
+
+    def collides(self, x, y, w, h):
+        mask = ((1 << w) - 1) << x
+        rows = self.rows
+        for r in range(y, y + h):
+            if rows[r] & mask:
+                return True
+        return False
+
+    def place(self, x, y, w, h, index=None):
+        mask = ((1 << w) - 1) << x
+        rows = self.rows
+        for r in range(y, y + h):
+            rows[r] |= mask
+        if index is not None:
+            for bx in range(x // BUCKET_SIZE, (x + w - 1) // BUCKET_SIZE + 1):
+                for by in range(y // BUCKET_SIZE, (y + h - 1) // BUCKET_SIZE + 1):
+                    self._buckets.setdefault((bx, by), []).append((index, x, y, w, h))
+
+    def colliding_items(self, x, y, w, h):
+        found = set()
+        for bx in range(x // BUCKET_SIZE, (x + w - 1) // BUCKET_SIZE + 1):
+            for by in range(y // BUCKET_SIZE, (y + h - 1) // BUCKET_SIZE + 1):
+                for index, ox, oy, ow, oh in self._buckets.get((bx, by), ()):
+                    if ox < x + w and x < ox + ow and oy < y + h and y < oy + oh:
+                        found.add(index)
+        return sorted(found)
+
+    def find_slot(self, w, h, start_row=0):
+        # Lowest, then leftmost, position where a w x h item fits
+        if w > self.width or h > self.height:
+            return None
+        rows = self.rows
+        full = self.full
+        for y in range(start_row, self.height - h + 1):
+            used = rows[y]
+            if used == full:
+                continue
+            for r in range(y + 1, y + h):
+                used |= rows[r]
+            starts = ~used & full
+            # Keep only the bits that begin a run of w free cells
+            for i in range(1, w):
+                starts &= ~used >> i
+            starts &= (1 << (self.width - w + 1)) - 1
+            if starts:
+                return (starts & -starts).bit_length() - 1, y
+        return None
+
+    def first_open_row(self, start=0):
+        rows, full = self.rows, self.full
+        while start < self.height and rows[start] == full:
+            start += 1
+        return start
+
+
+def _module_size(module_id):
+    module = get_catalog().get(module_id)
+    if module is None:
+        return None
+    return module.w, module.h, module.massKg
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bay_size_ok(bay_width, bay_height):
+    return bool(bay_width and bay_height) and 0 < bay_width <= MAX_BAY_SIZE and 0 < bay_height <= MAX_BAY_SIZE
+
+
+def validate_layout(bay_width, bay_height, items, max_mass_kg=None):
+    """
+    Check a payload builder layout: every item must name a known module, lie
+    inside the bay and not overlap another item, and the total mass must not
+    exceed max_mass_kg (when given). Returns a report dict; 'ok' is True when
+    there are no errors. Each error names the index of the item at fault.
+    A bay side outside 1..MAX_BAY_SIZE is an 'invalid bay size' error.
+    """
+    bay_width, bay_height = _as_int(bay_width), _as_int(bay_height)
+    errors = []
+    if not _bay_size_ok(bay_width, bay_height):
+        return {'ok': False, 'errors': [{'error': 'invalid bay size'}], 'total_mass_kg': 0.0,
+                'occupied_cells': 0, 'utilization': 0.0}
+
+    grid = Occupancy(bay_width, bay_height)
+    total_mass = 0.0
+    occupied = 0
+    for index, item in enumerate(items or []):
+        size = _module_size(item.get('module_id'))
+        if size is None:
+            errors.append({'item': index, 'error': 'unknown module', 'module_id': item.get('module_id')})
+            continue
+        w, h, mass = size
+        total_mass += mass
+        x, y = _as_int(item.get('x')), _as_int(item.get('y'))
+        if x is None or y is None:
+            errors.append({'item': index, 'error': 'missing position'})
+            continue
+        if x < 0 or y < 0 or x + w > bay_width or y + h > bay_height:
+            errors.append({'item': index, 'error': 'out of bounds', 'x': x, 'y': y, 'w': w, 'h': h})
+            continue
+        if grid.collides(x, y, w, h):
+            errors.append({'item': index, 'error': 'overlap', 'with': grid.colliding_items(x, y, w, h)})
+            continue
+        grid.place(x, y, w, h, index)
+        occupied += w * h
+
+    if max_mass_kg is not None and total_mass > float(max_mass_kg):
+        errors.append({'error': 'too heavy', 'total_mass_kg': round(total_mass, 3),
+                       'max_mass_kg': float(max_mass_kg)})
+    return {
+        'ok': not errors,
+        'errors': errors,
+        'total_mass_kg': round(total_mass, 3),
+        'occupied_cells': occupied,
+        'utilization': round(occupied / (bay_width * bay_height), 4),
+    }
+
+
+# Orderings auto_pack tries, best first for typical module mixes
+PACK_ORDERS = (
+    ('area', lambda s: (-s[0] * s[1], -s[1])),
+    ('height', lambda s: (-s[1], -s[0])),
+    ('width', lambda s: (-s[0], -s[1])),
+    ('perimeter', lambda s: (-(s[0] + s[1]), -s[1])),
+)
+
+
+def _pack(bay_width, bay_height, sized, order_key, deadline):
+    # Bottom-left fill: each item, largest first, goes to the lowest then
+    # leftmost free slot. Returns (placements, unplaced indexes, finished).
+    grid = Occupancy(bay_width, bay_height)
+    order = sorted(range(len(sized)), key=lambda i: order_key(sized[i]))
+    placements, unplaced = {}, []
+    floor = 0
+    for n, i in enumerate(order):
+        if n % 32 == 0 and time.perf_counter() > deadline:
+            return placements, unplaced + order[n:], False
+        w, h = sized[i][0], sized[i][1]
+        floor = grid.first_open_row(floor)
+        slot = grid.find_slot(w, h, floor)
+        if slot is None:
+            unplaced.append(i)
+            continue
+        grid.place(slot[0], slot[1], w, h)
+        placements[i] = slot
+    return placements, unplaced, True
+
+
+def auto_pack(bay_width, bay_height, modules, max_mass_kg=None, time_budget=PACK_TIME_BUDGET):
+    """
+    Find positions for a list of requested modules (dicts with module_id and
+    optionally label) in a bay. Several orderings are tried until one places
+    everything or time_budget seconds run out; the best attempt is returned
+    as {'ok', 'items', 'unplaced', 'strategy', ...}. items carry x and y in
+    the order the modules were given; unplaced lists the indexes that did
+    not fit.
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget
+    bay_width, bay_height = _as_int(bay_width) or 0, _as_int(bay_height) or 0
+    modules = list(modules or [])
+    sized, errors = [], []
+    total_mass = 0.0
+    for index, m in enumerate(modules):
+        size = _module_size(m.get('module_id'))
+        if size is None:
+            errors.append({'item': index, 'error': 'unknown module', 'module_id': m.get('module_id')})
+            size = (0, 0, 0.0)
+        sized.append(size)
+        total_mass += size[2]
+    if max_mass_kg is not None and total_mass > float(max_mass_kg):
+        errors.append({'error': 'too heavy', 'total_mass_kg': round(total_mass, 3),
+                       'max_mass_kg': float(max_mass_kg)})
+    if errors or not _bay_size_ok(bay_width, bay_height):
+        return {'ok': False, 'errors': errors or [{'error': 'invalid bay size'}], 'items': [],
+                'unplaced': list(range(len(modules))), 'strategy': None,
+                'total_mass_kg': round(total_mass, 3), 'elapsed_ms': 0.0}
+
+    best = None
+    for name, key in PACK_ORDERS:
+        placements, unplaced, finished = _pack(bay_width, bay_height, sized, key, deadline)
+        if best is None or len(unplaced) < len(best[2]):
+            best = (name, placements, unplaced)
+        if not unplaced or not finished or time.perf_counter() > deadline:
+            break
+
+    name, placements, unplaced = best
+    items = []
+    for index, m in enumerate(modules):
+        if index in placements:
+            x, y = placements[index]
+            items.append({**m, 'x': x, 'y': y})
+    return {
+        'ok': not unplaced,
+        'errors': [{'item': i, 'error': 'does not fit'} for i in sorted(unplaced)],
+        'items': items,
+        'unplaced': sorted(unplaced),
+        'strategy': name,
+        'total_mass_kg': round(total_mass, 3),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+    }
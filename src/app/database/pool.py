@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    # Fixed-size pool of sqlite3 connections. A connection is checked out by
+    # one thread at a time and handed back idle, so the connect/PRAGMA cost is
+    # paid once per connection instead of once per query.
+    def __init__(self, db_path, size=5, timeout=30.0, health_check_interval=30.0, configure=None):
+        self.db_path = db_path
+        # Called with every new connection to apply PRAGMAs (see storage.py)
+        self.configure = configure
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+        self._idle = []  # (connection, time it was returned)
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'reused': 0,
+            'connections_created': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'busy_retries': 0,
+        }
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.configure is not None:
+            self.configure(conn)
+        else:
+            conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        conn = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout}s (pool size {self.size})")
+                self._cond.wait(remaining)
+
+        reused = conn is not None
+        if reused and time.monotonic() - returned_at > self.health_check_interval and not self._healthy(conn):
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            conn.close()
+            conn, reused = None, False
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        waited = time.perf_counter() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            if reused:
+                self._stats['reused'] += 1
+            else:
+                self._stats['connections_created'] += 1
+        return conn
+
+    def release(self, conn):
+        # Never hand a connection with an open transaction to the next caller
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+        with self._cond:
+            if conn is None or self._closed:
+                self._created -= 1
+                if conn is not None:
+                    conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def record_busy_retry(self, exc=None, attempt=None):
+        with self._cond:
+            self._stats['busy_retries'] += 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+                self._created -= 1
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open_connections'] = self._created
+            stats['idle_connections'] = len(self._idle)
+        checkouts = stats['checkouts']
+        stats['reuse_rate'] = round(stats['reused'] / checkouts, 4) if checkouts else 0.0
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
@@ -0,0 +1,121 @@
+# Rollups behind the reports dashboard. report_rollup holds one row per
+# (dimension, key, day): how many experiments created that day have that
+# key, plus, on the 'total' rows, how many files they carry and their
+# logical size. Triggers on experiments and experiment_files (migration 9)
+# keep it current on every write; rebuild_sql() recomputes it from scratch.
+#
+# The SQL fragments here are shared by the triggers, the rebuild and the
+# queries in database.py so all three agree on what a day and a module are.
+
+# Dimensions an experiment is counted under, with the column holding its key
+# ('module' is split out of ModulesNeeded instead). 'total' has one key, ''.
+DIMENSIONS = {
+    'total': None,
+    'status': 'status',
+    'experimentType': 'experimentType',
+    'user_email': 'user_email',
+    'module': 'ModulesNeeded',
+}
+
+# An experiment is reported under the date part of its ISO created_at, or
+# this day when it has none
+UNKNOWN_DAY = 'unknown'
+
+# Time buckets a report can be grouped by, as expressions over day. Rows
+# without a created_at stay in the 'unknown' bucket whatever the grouping.
+BUCKETS = {
+    'day': "day",
+    'week': f"COALESCE(date(day, '-6 days', 'weekday 1'), '{UNKNOWN_DAY}')",
+    'month': f"COALESCE(strftime('%Y-%m', day), '{UNKNOWN_DAY}')",
+    'year': f"COALESCE(strftime('%Y', day), '{UNKNOWN_DAY}')",
+    'all': "'all'",
+}
+
+
+def day_of(ref):
+    return f"COALESCE(NULLIF(substr({ref}.created_at, 1, 10), ''), '{UNKNOWN_DAY}')"
+
+
+def key_of(ref, column):
+    return f"COALESCE({ref}.{column}, '')"
+
+
+def modules_of(ref):
+    # ModulesNeeded is a comma-separated list ("Camera, Heater"). json_quote
+    # escapes it into one JSON string; commas never occur inside an escape,
+    # so splitting that literal on ',' gives a valid JSON array of the names
+    # for json_each to walk. Usable inside triggers, unlike a recursive CTE.
+    return f"""json_each('[' || replace(json_quote({ref}.ModulesNeeded), ',', '","') || ']')"""
+
+
+UPSERT = """
+    ON CONFLICT (dimension, key, day) DO UPDATE SET
+        experiments = experiments + excluded.experiments,
+        files = files + excluded.files,
+        bytes = bytes + excluded.bytes"""
+
+
+def count_experiment(ref, sign):
+    # Statements adding (sign 1) or removing (sign -1) experiment ref from
+    # every dimension it is counted under
+    day = day_of(ref)
+    values = [f"('total', {day}, '', {sign}, 0, 0)"]
+    values += [f"('{dimension}', {day}, {key_of(ref, column)}, {sign}, 0, 0)"
+               for dimension, column in DIMENSIONS.items() if dimension not in ('total', 'module')]
+    return [
+        f"""INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        VALUES {', '.join(values)}{UPSERT};""",
+        f"""INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT DISTINCT 'module', {day}, trim(value), {sign}, 0, 0 FROM {modules_of(ref)}
+        WHERE trim(value) != ''{UPSERT};""",
+    ]
+
+
+def count_status(old, new):
+    # A status change only moves the experiment between two status keys
+    return [f"""INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        VALUES ('status', {day_of(old)}, {key_of(old, 'status')}, -1, 0, 0),
+               ('status', {day_of(new)}, {key_of(new, 'status')}, 1, 0, 0){UPSERT};"""]
+
+
+def count_file(ref, sign):
+    # A file counts on the 'total' row of the day its experiment was created
+    day = f"COALESCE((SELECT {day_of('e')} FROM experiments e WHERE e.id = {ref}.experiment_id), '{UNKNOWN_DAY}')"
+    return [f"""INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        VALUES ('total', {day}, '', 0, {sign}, {sign} * COALESCE({ref}.file_size, 0)){UPSERT};"""]
+
+
+def move_files(old, new):
+    # An experiment whose created_at changed takes its files to the new day
+    totals = f"(SELECT COUNT(*) AS n, COALESCE(SUM(file_size), 0) AS size FROM experiment_files WHERE experiment_id = {new}.id)"
+    return [f"""INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT 'total', {day_of(old)}, '', 0, -n, -size FROM {totals} WHERE n > 0
+        UNION ALL
+        SELECT 'total', {day_of(new)}, '', 0, n, size FROM {totals} WHERE n > 0{UPSERT};"""]
+
+
+def rebuild_sql():
+    # Statements that recompute report_rollup from experiments and
+    # experiment_files; run them in one transaction after clearing the table
+    statements = [f"""
+        INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT 'total', {day_of('e')}, '', COUNT(*), 0, 0 FROM experiments e GROUP BY 2
+    """]
+    statements += [f"""
+        INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT '{dimension}', {day_of('e')}, {key_of('e', column)}, COUNT(*), 0, 0 FROM experiments e GROUP BY 2, 3
+    """ for dimension, column in DIMENSIONS.items() if dimension not in ('total', 'module')]
+    statements.append(f"""
+        INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT 'module', day, name, COUNT(*), 0, 0 FROM (
+            SELECT DISTINCT e.id, {day_of('e')} AS day, trim(m.value) AS name
+            FROM experiments e, {modules_of('e')} m WHERE trim(m.value) != ''
+        ) GROUP BY day, name
+    """)
+    statements.append(f"""
+        INSERT INTO report_rollup (dimension, day, key, experiments, files, bytes)
+        SELECT 'total', {day_of('e')}, '', 0, COUNT(*), COALESCE(SUM(f.file_size), 0)
+        FROM experiment_files f LEFT JOIN experiments e ON e.id = f.experiment_id
+        GROUP BY 2 HAVING TRUE{UPSERT}
+    """)
+    return statements
@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# JSON encoding for cli.py. orjson is used when it is installed (it is an
+# optional dependency); the standard library otherwise. SERIALIZER=stdlib
+# or SERIALIZER=orjson forces one. Both backends write compact JSON and
+# agree on the output apart from escaping: orjson writes non-ASCII text as
+# UTF-8 where the stdlib escapes it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = os.environ.get('SERIALIZER', '').lower() or ('orjson' if orjson else 'stdlib')
+if BACKEND not in ('orjson', 'stdlib'):
+    raise ValueError("SERIALIZER must be 'orjson' or 'stdlib'")
+if BACKEND == 'orjson' and orjson is None:
+    raise ImportError("SERIALIZER=orjson but orjson is not installed")
+
+# Bytes of payload text plus encoded fragment payload_fragment may hold
+# (32 MB by default); payloads larger than a quarter of it are not kept
+PAYLOAD_FRAGMENT_CACHE_BYTES = int(os.environ.get('PAYLOAD_FRAGMENT_CACHE_BYTES') or 32 * 1024 * 1024)
+
+
+class Fragment:
+    # Already encoded JSON (bytes) to embed as is wherever it appears in a
+    # value passed to dumps
+    __slots__ = ('json',)
+
+    def __init__(self, encoded: bytes):
+        self.json = encoded
+
+
+# Fragments are swapped for placeholder strings while encoding and spliced
+# back into the output afterwards. The token is random per process so no
+# stored text can mimic a placeholder.
+_TOKEN = os.urandom(8).hex()
+_PLACEHOLDER = re.compile(rb'"\\u0000' + _TOKEN.encode() + rb'(\d+)\\u0000"')
+
+
+def _encoder(fragments):
+    def default(obj):
+        if isinstance(obj, Fragment):
+            fragments.append(obj.json)
+            return f'\x00{_TOKEN}{len(fragments) - 1}\x00'
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return default
+
+
+def _splice(encoded: bytes, fragments):
+    if not fragments:
+        return encoded
+    return _PLACEHOLDER.sub(lambda m: fragments[int(m.group(1))], encoded)
+
+
+if BACKEND == 'orjson':
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj) -> bytes:
+        fragments = []
+        return _splice(orjson.dumps(obj, default=_encoder(fragments), option=_ORJSON_OPTIONS), fragments)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj) -> bytes:
+        fragments = []
+        text = json.dumps(obj, default=_encoder(fragments), separators=(',', ':'))
+        return _splice(text.encode('utf-8'), fragments)
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps(obj) -> str:
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def load(fp):
+    # Read a whole JSON document from a text or binary stream; bytes are
+    # parsed without decoding to str first
+    return loads(getattr(fp, 'buffer', fp).read())
+
+
+def write(obj, stream=None, flush=True):
+    # Write obj as one line of JSON straight to the stream's byte buffer
+    stream = stream if stream is not None else sys.stdout
+    out = getattr(stream, 'buffer', stream)
+    out.write(dumps_bytes(obj) + b'\n')
+    if flush:
+        out.flush()
+
+
+_fragments = OrderedDict()
+_fragments_bytes = 0
+_fragments_lock = threading.Lock()
+
+
+# orjson escapes strings faster than the placeholder splice costs, so the
+# cache only pays off with the stdlib backend or an orjson that can embed
+# fragments natively (3.9+)
+_NATIVE_FRAGMENT = getattr(orjson, 'Fragment', None) if BACKEND == 'orjson' else None
+USE_PAYLOAD_FRAGMENTS = BACKEND == 'stdlib' or _NATIVE_FRAGMENT is not None
+
+
+def payload_fragment(key, text):
+    """
+    experiments.payload as an encoded JSON string, cached by key (the
+    experiment id) so a long-running worker escapes each stored payload only
+    once. The cached entry is only used while its text is unchanged. The
+    cache is bounded by PAYLOAD_FRAGMENT_CACHE_BYTES, least recently used
+    entries going first.
+    """
+    global _fragments_bytes
+    if not isinstance(text, str) or not USE_PAYLOAD_FRAGMENTS:
+        return text
+    with _fragments_lock:
+        hit = _fragments.get(key)
+        if hit is not None and hit[0] == text:
+            _fragments.move_to_end(key)
+            return hit[1]
+    encoded = dumps_bytes(text)
+    fragment = (_NATIVE_FRAGMENT or Fragment)(encoded)
+    size = len(text) + len(encoded)
+    if size > PAYLOAD_FRAGMENT_CACHE_BYTES // 4:
+        return fragment
+    with _fragments_lock:
+        old = _fragments.pop(key, None)
+        if old is not None:
+            _fragments_bytes -= old[2]
+        _fragments[key] = (text, fragment, size)
+        _fragments_bytes += size
+        while _fragments_bytes > PAYLOAD_FRAGMENT_CACHE_BYTES:
+            _fragments_bytes -= _fragments.popitem(last=False)[1][2]
+    return fragment
@@ -0,0 +1,99 @@
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+from os import environ
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORES = ('DEFAULT', 'FILE', 'MEMORY')
+
+# sqlite3 primary result codes that mean "someone else holds the lock"
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+@dataclass
+class StorageConfig:
+    # WAL lets readers run alongside the single writer; NORMAL sync is safe
+    # in WAL mode (a power cut can lose the last commits, never corrupt)
+    journal_mode: str = 'WAL'
+    synchronous: str = 'NORMAL'
+    cache_size: int = -16000  # negative means KiB, so ~16 MB per connection
+    busy_timeout: int = 5000  # ms SQLite itself waits on a lock
+    # Off by default: mapped pages count toward a process's RSS, so a full
+    # listing would grow it with the database file. DB_MMAP_SIZE turns it on.
+    mmap_size: int = 0
+    temp_store: str = 'MEMORY'
+    foreign_keys: bool = True
+    # Retries on top of busy_timeout, with exponential backoff and jitter
+    busy_retries: int = 5
+    retry_base_delay: float = 0.05
+    retry_max_delay: float = 2.0
+
+    def __post_init__(self):
+        self.journal_mode = self.journal_mode.upper()
+        self.synchronous = self.synchronous.upper()
+        self.temp_store = self.temp_store.upper()
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of {', '.join(JOURNAL_MODES)}")
+        if self.synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_MODES)}")
+        if self.temp_store not in TEMP_STORES:
+            raise ValueError(f"temp_store must be one of {', '.join(TEMP_STORES)}")
+
+    @classmethod
+    def from_env(cls):
+        # DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_BUSY_TIMEOUT,
+        # DB_MMAP_SIZE, DB_TEMP_STORE and DB_BUSY_RETRIES override the defaults
+        overrides = {}
+        for name, key, cast in (
+            ('journal_mode', 'DB_JOURNAL_MODE', str),
+            ('synchronous', 'DB_SYNCHRONOUS', str),
+            ('cache_size', 'DB_CACHE_SIZE', int),
+            ('busy_timeout', 'DB_BUSY_TIMEOUT', int),
+            ('mmap_size', 'DB_MMAP_SIZE', int),
+            ('temp_store', 'DB_TEMP_STORE', str),
+            ('busy_retries', 'DB_BUSY_RETRIES', int),
+        ):
+            if environ.get(key):
+                overrides[name] = cast(environ[key])
+        return cls(**overrides)
+
+
+def configure_connection(conn: sqlite3.Connection, config: StorageConfig):
+    # busy_timeout first so switching the journal mode can wait on a lock too
+    conn.execute(f"PRAGMA busy_timeout = {int(config.busy_timeout)}")
+    conn.execute(f"PRAGMA journal_mode = {config.journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {config.synchronous}")
+    conn.execute(f"PRAGMA cache_size = {int(config.cache_size)}")
+    conn.execute(f"PRAGMA mmap_size = {int(config.mmap_size)}")
+    conn.execute(f"PRAGMA temp_store = {config.temp_store}")
+    conn.execute(f"PRAGMA foreign_keys = {'ON' if config.foreign_keys else 'OFF'}")
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_with_retry(fn, config: StorageConfig, on_retry=None):
+    # Call fn(), retrying it from the start when SQLite reports the database
+    # busy or locked. fn must be a whole transaction so a retry is safe.
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except sqlite3.OperationalError as exc:
+            if not is_busy_error(exc) or attempt >= config.busy_retries:
+                raise
+            delay = min(config.retry_max_delay, config.retry_base_delay * (2 ** attempt))
+            attempt += 1
+            if on_retry is not None:
+                on_retry(exc, attempt)
+            time.sleep(delay * (0.5 + random.random()))
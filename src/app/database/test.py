@@ -1,11 +1,13 @@
 import sqlite3
 
-# Connect to the database
-conn = sqlite3.connect('site.db')
+from database import db_name
+
+# Connect to the database (site.db next to this file, or SITE_DB)
+conn = sqlite3.connect(db_name)
 cursor = conn.cursor()
 
-# Example: Fetch all rows from a table named 'users'
-cursor.execute("SELECT * FROM experiment")
+# Example: Fetch all rows from the experiments table
+cursor.execute("SELECT * FROM experiments")
 rows = cursor.fetchall()
 
 for row in rows:
@@ -1,13 +1,15 @@
 import sqlite3
 import json
 
-# Connect to database and get experiments
-conn = sqlite3.connect('site.db')
+from database import db_name
+
+# Connect to database (site.db next to this file, or SITE_DB) and get experiments
+conn = sqlite3.connect(db_name)
 cur = conn.cursor()
 
 # Get all experiments
 cur.execute("""
-    SELECT id, user_id, name, description, status, payload, confirmed, confirmation_notes, user_email, created_at, experimentType, ModulesNeeded 
+    SELECT id, name, description, status, payload, notes, user_email, created_at, experimentType, ModulesNeeded 
     FROM experiments 
     ORDER BY id DESC
 """)
@@ -105,6 +105,14 @@ export default function DashboardPage() {
     const newCredits = dashboardCredits - totalCost;
     setDashboardCredits(newCredits);
 
+    // Items saved before module_id existed (restored from localStorage)
+    // still carry the catalog entry's fields, so look the module up by name;
+    // their id was the catalog id too
+    const moduleIdOf = (item) =>
+      item.module_id ||
+      payloadPresets.find((m) => m.name === (item.name || item.label))?.id ||
+      (typeof item.id === "number" ? item.id : 0);
+
     // Build payload for all tables, including dashboard plan and credits
     const payload = {
       experiment: {
@@ -131,7 +139,7 @@ export default function DashboardPage() {
         bay_width: bayWidth,
         bay_height: bayHeight,
         items: payloadItems.map((item) => ({
-          module_id: item.module_id || 0,
+          module_id: moduleIdOf(item),
           x: item.x,
           y: item.y,
           label: item.label,
@@ -140,7 +148,7 @@ export default function DashboardPage() {
         created_at: new Date().toISOString(),
       },
       builder_items: payloadItems.map((item) => ({
-        module_id: item.module_id || 0,
+        module_id: moduleIdOf(item),
         x: item.x,
         y: item.y,
         label: item.label,
@@ -473,7 +481,8 @@ export default function DashboardPage() {
   // --- Payload Builder Logic ---
   function addPayloadPreset(preset) {
   const id = crypto.randomUUID();
-  const newItem = { id, ...preset, x: 0, y: 0, label: preset.name };
+  // module_id keys the catalog entry the server checks the layout against
+  const newItem = { id, ...preset, module_id: preset.id, x: 0, y: 0, label: preset.name };
     // Snap into first available spot
     const spot = findFirstFit(newItem, payloadItems, bayWidth, bayHeight);
     if (!spot) {
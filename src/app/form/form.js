@@ -158,7 +158,7 @@ export default function Form() {
     try {
       const res = await fetch("/api/modules");
       const data = await res.json();
-      setModules(Array.isArray(data) ? data : []);
+      setModules(Array.isArray(data) ? data : data.modules || []);
     } catch (err) {
       console.error("Failed to fetch modules", err);
     }
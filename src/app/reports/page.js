@@ -6,9 +6,12 @@ import { ReportsCard, ReportDetailsModal } from "../../../components/card";
 import { auth } from "../../lib/firebaseClient";
 import { onAuthStateChanged } from "firebase/auth";
 
-function downloadBase64File(base64, filename) {
+function downloadBase64File(base64, filename, fileId) {
   const link = document.createElement("a");
-  link.href = `data:application/octet-stream;base64,${base64}`;
+  // Stored files are listed without their bodies; fetch those by id
+  link.href = base64
+    ? `data:application/octet-stream;base64,${base64}`
+    : `/api/experiments/files?id=${fileId}&filename=${encodeURIComponent(filename)}`;
   link.download = filename;
   document.body.appendChild(link);
   link.click();